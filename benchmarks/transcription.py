@@ -0,0 +1,70 @@
+"""
+Time transcribing a long recording with different numbers of transcription
+processes, using the stub engine with a real engine's CPU cost.
+
+    uv run python -m benchmarks.transcription
+
+Wall-clock time should fall with more processes, up to the number of cores.
+"""
+
+import os
+import time
+
+import django
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+load_dotenv(".env.local", override=True)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "storyworth.settings")
+django.setup()
+
+from django.test import override_settings
+
+from voice_recordings import transcription
+
+RATE = 8000
+MINUTES = 5
+# CPU seconds the stub spends on each second of audio
+COST = 0.05
+
+
+def speech(seconds: int) -> np.ndarray:
+    """
+    Noise, in bursts of 2 to 8 seconds, with pauses in between.
+    """
+    rng = np.random.default_rng(0)
+    parts = []
+    while sum(len(part) for part in parts) < seconds * RATE:
+        parts.append(0.3 * rng.standard_normal(int(rng.uniform(2, 8) * RATE)))
+        parts.append(np.zeros(RATE // 2))
+    return np.concatenate(parts)[: seconds * RATE].astype(np.float32)
+
+
+def main():
+    samples = speech(MINUTES * 60)
+    chunks = transcription.split(samples, RATE)
+    pending = [(index, start, end) for index, (start, end) in enumerate(chunks)]
+    print(f"{MINUTES} minutes of audio in {len(chunks)} chunks, {os.cpu_count()} cores")
+
+    baseline = None
+    for processes in sorted({1, 2, 4, os.cpu_count() or 1}):
+        with override_settings(
+            TRANSCRIPTION_ENGINE={
+                "BACKEND": "voice_recordings.transcribers.StubEngine",
+                "OPTIONS": {"cost": COST},
+            },
+            TRANSCRIPTION_PROCESSES=processes,
+        ):
+            # Start the pool before timing, as the worker does once
+            list(transcription._transcribe(samples, RATE, pending[:processes]))
+            start = time.perf_counter()
+            list(transcription._transcribe(samples, RATE, pending))
+            seconds = time.perf_counter() - start
+            transcription.shutdown_pool()
+        baseline = baseline or seconds
+        print(f"{processes:>3} processes: {seconds:6.2f} s ({baseline / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Compare placing calls with a new Twilio client each time, as we used to,
+against the process' pooled client, and against the async client with many
+requests in flight, all against a local fake of the Calls endpoint.
+
+    uv run python -m benchmarks.twilio_client
+
+The fake is plain HTTP on localhost, so a new connection only costs a TCP
+handshake here. Against api.twilio.com each one is also a TLS handshake,
+several round trips away, so pooling saves more than this shows.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+from dotenv import load_dotenv
+
+CALLS = 500
+# Simulated Twilio response time, for comparing concurrency
+LATENCY = 0.05
+CONCURRENCY = 20
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent separately, which would otherwise stall
+    # reused connections on delayed ACKs
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        body = json.dumps({"sid": "CA" + "0" * 32, "status": "queued"}).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for every connection the async client opens at once
+    request_queue_size = 128
+
+
+server = Server(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+load_dotenv(".env")
+load_dotenv(".env.local", override=True)
+os.environ["TWILIO_API_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+os.environ["TWILIO_POOL_SIZE"] = str(CONCURRENCY)
+# Only the fake is called, so no real account is needed
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "AC" + "0" * 32)
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "0" * 32)
+os.environ.setdefault("TWILIO_FROM_NUMBER", "+15555550199")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "storyworth.settings")
+django.setup()
+# Twilio's clients log every request and response
+logging.getLogger("twilio").setLevel(logging.WARNING)
+
+from django.conf import settings
+from twilio.rest import Client
+
+from voice_recordings.twilio_accounts import (
+    AsyncTimedHttpClient,
+    get_accounts,
+)
+
+PARAMS = {"to": "+15555550100", "from_": "+15555550199", "url": "https://example.com"}
+
+
+def new_client_per_call(account):
+    client = Client(account.sid, account.auth_token)
+    client.api.base_url = settings.TWILIO_API_BASE_URL
+    client.calls.create(**PARAMS)
+
+
+def pooled_client(account):
+    account.client().calls.create(**PARAMS)
+
+
+async def place_async(calls: int):
+    account = get_accounts()[0]
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    async with AsyncTimedHttpClient() as http_client:
+        client = account.async_client(http_client)
+
+        async def place():
+            async with semaphore:
+                await client.calls.create_async(**PARAMS)
+
+        await asyncio.gather(*(place() for _ in range(calls)))
+
+
+def timed(place, calls: int) -> float:
+    account = get_accounts()[0]
+    start = time.perf_counter()
+    for _ in range(calls):
+        place(account)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"Per-call overhead, {CALLS} calls one at a time:")
+    for name, place in [
+        ("new client", new_client_per_call),
+        ("pooled", pooled_client),
+    ]:
+        seconds = min(timed(place, CALLS) for _ in range(3))
+        print(f"{name:>20}: {seconds / CALLS * 1e6:8.0f} µs/call")
+
+    Handler.latency = LATENCY
+    calls = CALLS // 5
+    print(f"\nThroughput, {calls} calls with {LATENCY * 1000:.0f}ms responses:")
+    seconds = timed(pooled_client, calls)
+    print(f"{'pooled, sync':>20}: {calls / seconds:8.0f} calls/s")
+    start = time.perf_counter()
+    asyncio.run(place_async(calls))
+    seconds = time.perf_counter() - start
+    print(f"{f'async, {CONCURRENCY} in flight':>20}: {calls / seconds:8.0f} calls/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Compare building call_started_webhook's TwiML with VoiceResponse against the
+precompiled template.
+
+    uv run python -m benchmarks.twiml
+"""
+
+import os
+import timeit
+
+import django
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+load_dotenv(".env.local", override=True)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "storyworth.settings")
+django.setup()
+
+from django.test import RequestFactory
+
+from voice_recordings.twiml import (
+    build_call_started_twiml,
+    call_started_twiml,
+)
+
+NUMBER = 20_000
+
+
+def main():
+    request = RequestFactory().post("/", headers={"Host": "localhost"})
+    assert (
+        call_started_twiml(request, 1) == build_call_started_twiml(request, 1).encode()
+    )
+
+    for name, build in [
+        ("VoiceResponse", lambda: build_call_started_twiml(request, 12345).encode()),
+        ("precompiled", lambda: call_started_twiml(request, 12345)),
+    ]:
+        seconds = min(timeit.repeat(build, number=NUMBER, repeat=5))
+        print(f"{name:>13}: {seconds / NUMBER * 1e6:8.2f} µs/response")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Load testing harness, with a local fake of Twilio. See `__main__`.
+"""
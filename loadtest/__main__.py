@@ -0,0 +1,223 @@
+"""
+Load test the app against a local fake of Twilio, entirely offline.
+
+    uv run python -m loadtest --calls 100 --browsers 100
+    uv run python -m loadtest --calls 1000 --browsers 1000 --server wsgi
+
+This migrates the configured database and collects static files, then starts
+the fake Twilio (see `fake_twilio`), the app under gunicorn with uvicorn
+workers (ASGI, as in `Procfile`) or gunicorn's own threaded workers (WSGI),
+and the `dispatch_calls`, `process_webhooks` and `process_recordings`
+workers, all pointed at the fake. Virtual browsers (see `browsers`) then
+request calls concurrently and poll for their status until the calls end.
+
+Prints p50/p95/p99 latency and throughput for each endpoint, including the
+webhooks as timed by the fake Twilio.
+
+Pass `--url` to test a server you've started yourself instead, with
+`TWILIO_API_BASE_URL` set to the fake's URL (use `--twilio-port` to fix it).
+"""
+
+import argparse
+import math
+import os
+import secrets
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from dotenv import load_dotenv
+
+from .browsers import browse
+from .fake_twilio import Behaviour, FakeTwilio
+from .stats import Stats
+
+WORKERS = ["dispatch_calls", "process_webhooks", "process_recordings"]
+
+
+def main():
+    args = parse_args()
+    load_dotenv(".env")
+    load_dotenv(".env.local", override=True)
+
+    stats = Stats()
+    fake = FakeTwilio(
+        stats,
+        Behaviour(
+            time_scale=args.time_scale,
+            unanswered_rate=args.unanswered_rate,
+            absent_rate=args.absent_rate,
+            rate_limit_rate=args.rate_limit_rate,
+        ),
+        port=args.twilio_port,
+        seed=args.seed,
+    )
+    fake.start()
+    print(f"Fake Twilio listening on {fake.url}", file=sys.stderr)
+
+    env = {
+        **os.environ,
+        # Every process must sign recording URLs with the same key
+        "DJANGO_SECRET_KEY": os.environ.get(
+            "DJANGO_SECRET_KEY", secrets.token_urlsafe(64)
+        ),
+        "TWILIO_API_BASE_URL": fake.url,
+        "TWILIO_ACCOUNT_SID": os.environ.get("TWILIO_ACCOUNT_SID", "AC" + "0" * 32),
+        "TWILIO_AUTH_TOKEN": os.environ.get("TWILIO_AUTH_TOKEN", "0" * 32),
+        "TWILIO_FROM_NUMBER": os.environ.get("TWILIO_FROM_NUMBER", "+15550000000"),
+        # Twilio's 1 call/sec would make the dispatcher the bottleneck
+        "CALL_DISPATCH_RATE": str(args.call_rate),
+        # Every virtual browser connects from 127.0.0.1
+        "CALL_LIMIT_PER_IP": "0",
+        # The fake's recordings aren't speech, so describe them rather than
+        # needing a real engine
+        "TRANSCRIPTION_ENGINE": os.environ.get(
+            "TRANSCRIPTION_ENGINE", "voice_recordings.transcribers.StubEngine"
+        ),
+    }
+    processes = []
+    try:
+        base_url = args.url
+        if base_url is None:
+            for command in (["migrate", "--noinput"], ["collectstatic", "--noinput"]):
+                subprocess.run(
+                    [sys.executable, "manage.py", *command],
+                    env=env,
+                    check=True,
+                    stdout=subprocess.DEVNULL,
+                )
+            base_url = f"http://127.0.0.1:{args.port}/"
+            processes.append(start_server(args, env))
+            processes.extend(
+                subprocess.Popen([sys.executable, "manage.py", worker], env=env)
+                for worker in WORKERS
+            )
+            wait_until_up(base_url, processes)
+
+        # Don't count start up
+        stats = Stats()
+        fake.stats = stats
+        outcomes = run_browsers(args, base_url, stats, processes)
+        stats.finish()
+    finally:
+        fake.stop()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    print(stats.report())
+    print(", ".join(f"{count} {status}" for status, count in outcomes.most_common()))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog="python -m loadtest", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--calls", type=int, default=100, help="Calls to request.")
+    parser.add_argument(
+        "--browsers", type=int, default=100, help="Concurrent virtual browsers."
+    )
+    parser.add_argument("--server", choices=["asgi", "wsgi"], default="asgi")
+    parser.add_argument("--server-workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="Test an already running server instead.")
+    parser.add_argument("--twilio-port", type=int, default=0)
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.1,
+        help="How fast simulated calls play out, relative to real time.",
+    )
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300,
+        help="Seconds a browser waits for its call to end before giving up.",
+    )
+    parser.add_argument("--call-rate", type=float, default=1000)
+    parser.add_argument("--unanswered-rate", type=float, default=0.05)
+    parser.add_argument("--absent-rate", type=float, default=0.02)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args()
+
+
+def start_server(args, env) -> subprocess.Popen:
+    command = [
+        "gunicorn",
+        "--bind",
+        f"127.0.0.1:{args.port}",
+        "--workers",
+        str(args.server_workers),
+        # Browsers poll over kept-alive connections, which gunicorn (and
+        # uvicorn's worker) closes after 2 idle seconds by default. Closes
+        # would race with polls.
+        "--keep-alive",
+        str(math.ceil(args.poll_interval) + 5),
+    ]
+    if args.server == "asgi":
+        command += [
+            "storyworth.asgi",
+            "--worker-class",
+            "uvicorn_worker.UvicornWorker",
+        ]
+    else:
+        command += ["storyworth.wsgi", "--threads", "4"]
+    return subprocess.Popen([sys.executable, "-m", *command], env=env)
+
+
+def wait_until_up(url: str, processes, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        check_running(processes)
+        try:
+            requests.get(url, timeout=1).raise_for_status()
+            return
+        except requests.RequestException:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def check_running(processes) -> None:
+    for process in processes:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args[1:])} exited")
+
+
+def run_browsers(args, base_url: str, stats: Stats, processes) -> Counter:
+    outcomes = Counter()
+    with ThreadPoolExecutor(max_workers=args.browsers) as executor:
+        futures = [
+            executor.submit(
+                browse,
+                base_url,
+                # 555 isn't a real area code
+                f"555-{i // 10000 % 1000:03d}-{i % 10000:04d}",
+                stats,
+                poll_interval=args.poll_interval,
+                timeout=args.timeout,
+            )
+            for i in range(args.calls)
+        ]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=1)
+            for future in done:
+                try:
+                    outcomes[future.result() or "TIMED_OUT"] += 1
+                except Exception as e:  # noqa: BLE001
+                    # Whatever went wrong, count it and carry on with the others
+                    outcomes[f"ERROR ({type(e).__name__})"] += 1
+            # Calls won't end if a worker has died, so give up
+            check_running(processes)
+    return outcomes
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Virtual browsers, going through the same steps as a storyteller's:
+
+1. Load the form, and submit a phone number. If offered a callback, choose
+   to be called as soon as possible anyway.
+2. Load the recording page, then poll `recording_status` until the call
+   ends, like the page does when it can't stream events.
+3. Reload the recording page, and play the audio.
+"""
+
+import re
+import time
+import uuid
+from urllib.parse import urljoin
+
+import requests
+
+from .stats import Stats
+
+# The audio element's first source
+AUDIO_PATTERN = re.compile(r'<audio[^>]*>\s*<source src="([^"]+)"')
+
+
+def browse(
+    base_url: str,
+    phone_number: str,
+    stats: Stats,
+    poll_interval: float = 2.0,
+    timeout: float = 600,
+) -> str | None:
+    """
+    Request a call to `phone_number` and wait for it to end. Return the
+    recording's final status, or None if the browser gave up.
+    """
+    session = requests.Session()
+    # Set by the form's script
+    idempotency_key = str(uuid.uuid4())
+    with stats.time("form (GET)"):
+        session.get(base_url, timeout=30).raise_for_status()
+
+    start = time.monotonic()
+    with stats.time("form (POST)"):
+        response = session.post(
+            base_url,
+            data={
+                "tel": phone_number,
+                "idempotency_key": idempotency_key,
+                "csrfmiddlewaretoken": session.cookies["csrftoken"],
+            },
+            allow_redirects=False,
+            timeout=30,
+        )
+        response.raise_for_status()
+    if response.status_code == 200:
+        # We're too busy to call straight away. Wait anyway.
+        with stats.time("form (POST, waiting)"):
+            response = session.post(
+                base_url,
+                data={
+                    "tel": phone_number,
+                    "when": "now",
+                    "idempotency_key": idempotency_key,
+                    "csrfmiddlewaretoken": session.cookies["csrftoken"],
+                },
+                allow_redirects=False,
+                timeout=30,
+            )
+            response.raise_for_status()
+    recording_url = urljoin(base_url, response.headers["Location"])
+
+    with stats.time("recording"):
+        session.get(recording_url, timeout=30).raise_for_status()
+
+    status = "IN_PROGRESS"
+    status_url = urljoin(recording_url, "status/")
+    etag = None
+    while status == "IN_PROGRESS":
+        if time.monotonic() - start > timeout:
+            return None
+        time.sleep(poll_interval)
+        with stats.time("recording_status"):
+            response = session.get(
+                status_url,
+                headers={"If-None-Match": etag} if etag else {},
+                timeout=30,
+            )
+            response.raise_for_status()
+        if response.status_code != 304:
+            status = response.text
+            etag = response.headers.get("ETag")
+    stats.record("call (end to end)", time.monotonic() - start)
+
+    with stats.time("recording (finished)"):
+        response = session.get(recording_url, timeout=30)
+        response.raise_for_status()
+    match = AUDIO_PATTERN.search(response.text)
+    if match is not None:
+        audio_url = urljoin(recording_url, match[1])
+        # Until the `process_recordings` worker has fetched it, the audio
+        # comes from (fake) Twilio
+        endpoint = (
+            "recording_audio" if audio_url.startswith(base_url) else "twilio media"
+        )
+        with stats.time(endpoint):
+            session.get(audio_url, timeout=30).raise_for_status()
+    return status
@@ -0,0 +1,241 @@
+"""
+A local stand-in for Twilio's Voice API.
+
+`calls.create` requests (POST .../Calls.json) are answered with a queued
+call, then each call plays out in its own thread, a time-scaled version of a
+real call:
+
+1. It rings for a while, and may not be answered (busy, no-answer).
+2. Once answered, the call's `Url` (`call_started_webhook`) is requested, and
+   the greeting and recording callback are read from the TwiML it returns.
+3. The greeting is fetched, then the storyteller talks for a while.
+4. The recording callback (`recording_status_updated_webhook`) and the
+   call's `StatusCallback` (`call_status_updated_webhook`) are requested.
+   Some recordings are absent.
+
+Webhooks that fail are retried with backoff, like Twilio does with
+connection overrides. Recording media is served from .../Recordings/<sid>.mp3.
+Some `calls.create` requests are rejected with 429s, like Twilio's rate
+limit.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import requests
+
+from .stats import Stats
+
+# Silent MPEG-1 Layer III frames (128kbps, 44.1kHz), about 10 seconds' worth
+MEDIA = (b"\xff\xfb\x90\x64" + bytes(413)) * 380
+
+CALLS_PATH = re.compile(r"/2010-04-01/Accounts/(\w+)/Calls\.json")
+MEDIA_PATH = re.compile(r"/2010-04-01/Accounts/(\w+)/Recordings/(\w+)\.mp3")
+
+
+@dataclass
+class Behaviour:
+    # Multiplies every delay, so that load tests don't take as long as calls
+    time_scale: float = 0.1
+    ring_seconds: tuple[float, float] = (1, 5)
+    talk_seconds: tuple[float, float] = (10, 90)
+    unanswered_rate: float = 0.05
+    absent_rate: float = 0.02
+    rate_limit_rate: float = 0.01
+    webhook_retries: int = 3
+    webhook_timeout: float = 15
+
+
+class FakeTwilio:
+    def __init__(
+        self,
+        stats: Stats,
+        behaviour: Behaviour,
+        port: int = 0,
+        seed: int | None = None,
+    ):
+        self.stats = stats
+        self.behaviour = behaviour
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._stopping = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self) -> None:
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _chance(self, rate: float) -> bool:
+        with self._random_lock:
+            return self.random.random() < rate
+
+    def _delay(self, bounds: tuple[float, float]) -> None:
+        with self._random_lock:
+            seconds = self.random.uniform(*bounds)
+        self._stopping.wait(seconds * self.behaviour.time_scale)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                match = CALLS_PATH.fullmatch(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                params = dict(parse_qsl(self.rfile.read(length).decode()))
+                if match is None:
+                    self._send_json(404, {"status": 404, "message": "Not found"})
+                elif fake._chance(fake.behaviour.rate_limit_rate):
+                    self._send_json(
+                        429,
+                        {"code": 20429, "status": 429, "message": "Too Many Requests"},
+                    )
+                else:
+                    call = {
+                        "sid": "CA" + uuid.uuid4().hex,
+                        "account_sid": match[1],
+                        "to": params.get("To"),
+                        "from": params.get("From"),
+                        "status": "queued",
+                    }
+                    threading.Thread(
+                        target=fake._play_call, args=(call, params), daemon=True
+                    ).start()
+                    self._send_json(201, call)
+
+            def do_GET(self):
+                if MEDIA_PATH.fullmatch(self.path):
+                    self._send(200, MEDIA, "audio/mpeg")
+                else:
+                    self._send_json(404, {"status": 404, "message": "Not found"})
+
+            def _send_json(self, status, body):
+                self._send(status, json.dumps(body).encode(), "application/json")
+
+            def _send(self, status, content, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _play_call(self, call: dict, params: dict) -> None:
+        base = {
+            "CallSid": call["sid"],
+            "AccountSid": call["account_sid"],
+            "From": call["from"],
+            "To": call["to"],
+        }
+        status_callback = params.get("StatusCallback")
+
+        self._delay(self.behaviour.ring_seconds)
+        if self._chance(self.behaviour.unanswered_rate):
+            status = "busy" if self._chance(0.5) else "no-answer"
+            self._webhook(
+                "call_status_updated_webhook",
+                status_callback,
+                {**base, "CallStatus": status},
+            )
+            return
+
+        response = self._webhook(
+            "call_started_webhook",
+            params["Url"],
+            {**base, "CallStatus": "in-progress"},
+        )
+        if response is None:
+            self._webhook(
+                "call_status_updated_webhook",
+                status_callback,
+                {**base, "CallStatus": "failed"},
+            )
+            return
+
+        twiml = ET.fromstring(response.content)
+        play = twiml.find("Play")
+        if play is not None:
+            try:
+                with self.stats.time("greeting (static)"):
+                    requests.get(
+                        play.text, timeout=self.behaviour.webhook_timeout
+                    ).raise_for_status()
+            except requests.RequestException:
+                # Twilio skips greetings it can't fetch, and carries on
+                pass
+        record = twiml.find("Record")
+        recording_callback = record.get("recordingStatusCallback")
+
+        self._delay(self.behaviour.talk_seconds)
+        recording_sid = "RE" + uuid.uuid4().hex
+        recording_status = (
+            "absent" if self._chance(self.behaviour.absent_rate) else "completed"
+        )
+        self._webhook(
+            "recording_status_updated_webhook",
+            recording_callback,
+            {
+                **base,
+                "RecordingSid": recording_sid,
+                "RecordingStatus": recording_status,
+                "RecordingUrl": (
+                    f"{self.url}/2010-04-01/Accounts/{call['account_sid']}"
+                    f"/Recordings/{recording_sid}"
+                ),
+            },
+        )
+        self._webhook(
+            "call_status_updated_webhook",
+            status_callback,
+            {**base, "CallStatus": "completed"},
+        )
+
+    def _webhook(
+        self, endpoint: str, url: str | None, params: dict
+    ) -> requests.Response | None:
+        """
+        Send a webhook, retrying failures. Return the response, or None if
+        every attempt failed.
+        """
+        if not url:
+            return None
+        for attempt in range(self.behaviour.webhook_retries + 1):
+            if self._stopping.is_set():
+                return None
+            start = time.perf_counter()
+            try:
+                # Like Twilio's, each request is on a new connection
+                response = requests.post(
+                    url, data=params, timeout=self.behaviour.webhook_timeout
+                )
+            except requests.RequestException:
+                response = None
+            ok = response is not None and response.ok
+            self.stats.record(endpoint, time.perf_counter() - start, ok)
+            if ok:
+                return response
+            self._stopping.wait(2**attempt * self.behaviour.time_scale)
+        return None
@@ -0,0 +1,76 @@
+"""
+Latency and throughput statistics, by endpoint.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class Stats:
+    """
+    Thread-safe collection of request timings, by endpoint. Browsers and the
+    fake Twilio record into the same instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.started = time.monotonic()
+        self.finished: float | None = None
+
+    def record(self, endpoint: str, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self.timings[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    @contextmanager
+    def time(self, endpoint: str) -> Iterator[None]:
+        """
+        Time the body of the `with` block. Exceptions count as errors.
+        """
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(endpoint, time.perf_counter() - start, ok)
+
+    def finish(self) -> None:
+        self.finished = time.monotonic()
+
+    def report(self) -> str:
+        duration = (self.finished or time.monotonic()) - self.started
+        header = (
+            f"{'endpoint':<34} {'requests':>8} {'errors':>6} {'req/s':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        lines = [header, "-" * len(header)]
+        with self._lock:
+            for endpoint, unsorted in sorted(self.timings.items()):
+                timings = sorted(unsorted)
+                lines.append(
+                    f"{endpoint:<34} {len(timings):>8} {self.errors[endpoint]:>6} "
+                    f"{len(timings) / duration:>8.1f} "
+                    + " ".join(
+                        f"{percentile(timings, p) * 1000:>8.1f}" for p in (50, 95, 99)
+                    )
+                )
+        lines.append(f"\n{duration:.1f}s")
+        return "\n".join(lines)
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """
+    The `p`th percentile of the given sorted values, by the nearest-rank
+    method.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(round(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
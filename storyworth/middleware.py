@@ -0,0 +1,54 @@
+"""
+WhiteNoise's middleware only runs synchronously. Under ASGI, Django would
+have to run it, and with it every request, in a thread, so that the async
+views below it only gain extra switches between threads. This version
+awaits the rest of the chain directly.
+
+Static files are small and on local disk, so they are opened and read on the
+event loop too. Switching to a thread to read them costs more than reading
+them, and Django would otherwise read each one into memory (with a warning)
+to serve it asynchronously.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+
+        response = self.serve(static_file, request)
+        if response.streaming:
+            # The file stays registered to be closed with the response
+            response.streaming_content = _read(
+                response.file_to_stream, response.block_size
+            )
+        return response
+
+
+async def _read(file, block_size: int):
+    # Not modified and HEAD responses have no file, and no body
+    if file is None:
+        return
+    while chunk := file.read(block_size):
+        yield chunk
@@ -11,6 +11,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
 import os
 import secrets
 from pathlib import Path
@@ -28,6 +29,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # security features. To simplify initial setup (without hardcoding the secret in the source
 # code) we set this to a random value every time the app starts. However, this will mean many
 # Django features break whenever an app restarts (for example, sessions will be logged out).
+# Processes that don't share a key can't read each other's signed recording URLs
+# either, so set it when running more than one web process or worker locally.
 # In your production Heroku apps you should set the `DJANGO_SECRET_KEY` config var explicitly.
 # Make sure to use a long unique value, like you would for a password. See:
 # https://docs.djangoproject.com/en/5.2/ref/settings/#std-setting-SECRET_KEY
@@ -99,7 +102,11 @@ MIDDLEWARE = [
     # excellent WhiteNoise package to do so instead. The WhiteNoise middleware must be listed
     # after Django's `SecurityMiddleware` so that security redirects are still performed.
     # See: https://whitenoise.readthedocs.io
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # Our subclass also runs asynchronously, so that under ASGI (see
+    # `Procfile`) no middleware forces requests onto a thread.
+    "storyworth.middleware.AsyncWhiteNoiseMiddleware",
+    # Times everything below, but not static files. See `voice_recordings.metrics`.
+    "voice_recordings.metrics.MetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -138,12 +145,16 @@ if IS_HEROKU_APP:
     # https://devcenter.heroku.com/articles/provisioning-heroku-postgres#application-config-vars
     # https://github.com/jazzband/dj-database-url
     DATABASES = {
-        "default": dj_database_url.config(
-            env="DATABASE_URL",
-            conn_max_age=600,
-            conn_health_checks=True,
-            ssl_require=True,
-        ),
+        "default": dj_database_url.config(env="DATABASE_URL", ssl_require=True),
+    }
+    # Web dynos run under ASGI, where a request's queries may run on any of
+    # many threads, so persistent connections (which are per thread) would
+    # pile up. Share a pool of connections per process instead.
+    # https://docs.djangoproject.com/en/5.2/ref/databases/#connection-pool
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": 1,
+        "max_size": int(os.environ.get("DATABASE_POOL_SIZE", "10")),
+        "timeout": 10,
     }
 else:
     # When running locally in development or in CI, a sqlite database file will be used instead
@@ -152,9 +163,48 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # The web and worker processes all write to the database. Take the
+            # write lock when a transaction starts, and wait for it, rather than
+            # failing with "database is locked" when two transactions that
+            # started by reading both try to write.
+            "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Recording statuses are cached (see `voice_recordings.cache`), so the cache
+# must be shared by all web and worker processes or they will serve stale
+# statuses. On Heroku, this is the Heroku Key-Value Store (Redis) addon, which
+# uses self-signed certificates:
+# https://devcenter.heroku.com/articles/connecting-heroku-redis#connecting-in-python
+if "REDIS_URL" in os.environ:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+    if os.environ["REDIS_URL"].startswith("rediss://"):
+        CACHES["default"]["OPTIONS"] = {"ssl_cert_reqs": None}
+else:
+    # Shared by processes on the same machine, for local development.
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / ".cache",
         }
     }
 
+# Number of completed recording statuses each process keeps in memory.
+RECORDING_CACHE_LOCAL_SIZE = 10_000
+
+# Seconds recordings stay in the shared cache. Writes can reach the cache out
+# of order, so this bounds how long a stale copy can be served.
+RECORDING_CACHE_TIMEOUT = int(os.environ.get("RECORDING_CACHE_TIMEOUT", "300"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -196,8 +246,23 @@ STATIC_URL = "static/"
 STORAGES = {
     # Enable WhiteNoise's GZip (and Brotli, if installed) compression of static assets:
     # https://whitenoise.readthedocs.io/en/latest/django.html#add-compression-and-caching-support
+    # Also builds optimized versions of audio and images, see
+    # `voice_recordings.staticfiles`.
     "staticfiles": {
-        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+        "BACKEND": "voice_recordings.staticfiles.OptimizedStaticFilesStorage",
+    },
+    # Our copies of recordings, fetched from Twilio once they complete. Heroku's
+    # filesystem is ephemeral, so in production this should point at an object
+    # store instead (e.g. django-storages' S3 backend).
+    "recordings": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": BASE_DIR / "media" / "recordings"},
+    },
+    # Old recordings, archived out of the database. Like "recordings", this
+    # should be an object store in production.
+    "archive": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": BASE_DIR / "media" / "archive"},
     },
 }
 
@@ -209,6 +274,8 @@ WHITENOISE_KEEP_ONLY_HASHED_FILES = True
 # transcode the audio properly and it comes through as garbled noise.
 WHITENOISE_MIMETYPES = {
     ".aifc": "audio/x-aifc",
+    ".wav": "audio/wav",
+    ".webp": "image/webp",
 }
 
 
@@ -260,3 +327,104 @@ LOGGING = {
 TWILIO_ACCOUNT_SID = os.environ["TWILIO_ACCOUNT_SID"]
 TWILIO_AUTH_TOKEN = os.environ["TWILIO_AUTH_TOKEN"]
 TWILIO_FROM_NUMBER = os.environ["TWILIO_FROM_NUMBER"]
+
+# Base URL of Twilio's REST API, which recordings are downloaded from. Point
+# this at a fake server to test without talking to Twilio.
+TWILIO_API_BASE_URL = os.environ.get("TWILIO_API_BASE_URL", "https://api.twilio.com")
+
+# Seconds to wait for Twilio's API to connect or respond, and keep-alive
+# connections to it kept open per process (by `dispatch_calls --concurrency`,
+# per worker).
+TWILIO_TIMEOUT = float(os.environ.get("TWILIO_TIMEOUT", "10"))
+TWILIO_POOL_SIZE = int(os.environ.get("TWILIO_POOL_SIZE", "10"))
+
+# Outbound calls are spread across all of these accounts. Each account has its
+# own rate-limit, so adding accounts adds capacity. Extra accounts are
+# configured as a JSON list, e.g.:
+#
+#   TWILIO_EXTRA_ACCOUNTS='[
+#       {"sid": "AC...", "auth_token": "...", "from_numbers": ["+1..."]}
+#   ]'
+#
+# Accounts may also set their own "rate" (calls/sec), if Twilio has raised
+# their limit above `CALL_DISPATCH_RATE`.
+TWILIO_ACCOUNTS = [
+    {
+        "sid": TWILIO_ACCOUNT_SID,
+        "auth_token": TWILIO_AUTH_TOKEN,
+        "from_numbers": [TWILIO_FROM_NUMBER],
+    },
+    *json.loads(os.environ.get("TWILIO_EXTRA_ACCOUNTS", "[]")),
+]
+
+# Outbound calls are placed by the `dispatch_calls` worker, throttled to stay
+# within Twilio's outbound call rate-limit (1 call/sec per account by default):
+# https://help.twilio.com/articles/223180028
+CALL_DISPATCH_RATE = float(os.environ.get("CALL_DISPATCH_RATE", "1"))
+CALL_DISPATCH_BURST = 1
+CALL_DISPATCH_MAX_ATTEMPTS = 5
+
+# When a call requested through the form would wait longer than this many
+# seconds to be placed, the storyteller is offered a callback slot instead.
+# See `voice_recordings.admission`.
+CALL_WAIT_THRESHOLD = int(os.environ.get("CALL_WAIT_THRESHOLD", "120"))
+# Callbacks are booked into slots this long, each taking up to this share of
+# our outbound rate, and this many slots are offered at a time.
+CALLBACK_SLOT_MINUTES = 15
+CALLBACK_CAPACITY_SHARE = 0.5
+CALLBACK_SLOTS_OFFERED = 8
+
+# Submitting the form again for a number we're still calling, within this
+# many seconds, shows an error instead of placing another call.
+# See `voice_recordings.views.form`.
+CALL_DEDUPE_SECONDS = 10 * 60
+# The form places at most this many calls to one number, and for one client
+# IP address, in any CALL_LIMIT_WINDOW seconds. 0 turns a limit off. See
+# `voice_recordings.limits`.
+CALL_LIMIT_PER_NUMBER = int(os.environ.get("CALL_LIMIT_PER_NUMBER", "5"))
+CALL_LIMIT_PER_IP = int(os.environ.get("CALL_LIMIT_PER_IP", "20"))
+CALL_LIMIT_WINDOW = 60 * 60
+# Heroku's router tells us the client's address in X-Forwarded-For
+USE_X_FORWARDED_FOR = IS_HEROKU_APP
+
+# Completed recordings are post-processed (e.g. downloaded from Twilio) by the
+# `process_recordings` worker. Failed steps are retried this many times.
+RECORDING_PROCESSING_MAX_ATTEMPTS = 5
+
+# Bits per second to re-encode recordings' audio at, once it has been fetched
+# (see `voice_recordings.encoding`). Twilio's mp3s are 32 kbps, where Opus
+# only needs about 12 for the 8 kHz speech of a phone call.
+RECORDING_AUDIO_BITRATE = 12_000
+
+# Engine that transcribes recordings, once their audio has been encoded (see
+# `voice_recordings.transcription` and `voice_recordings.transcribers`).
+# Recordings aren't transcribed without one. Each of TRANSCRIPTION_PROCESSES
+# worker processes constructs its own, with OPTIONS as keyword arguments.
+TRANSCRIPTION_ENGINE = {
+    "BACKEND": os.environ.get("TRANSCRIPTION_ENGINE", ""),
+    "OPTIONS": json.loads(os.environ.get("TRANSCRIPTION_ENGINE_OPTIONS", "{}")),
+}
+TRANSCRIPTION_PROCESSES = int(
+    os.environ.get("TRANSCRIPTION_PROCESSES", os.cpu_count() or 1)
+)
+
+# Recording URLs carry a signed token instead of the recording id (see
+# `voice_recordings.tokens`), valid for this many seconds.
+RECORDING_TOKEN_MAX_AGE = 90 * 24 * 60 * 60
+
+# Whether URLs with integer recording ids, from before we used tokens, still
+# work. Turn this off once links and Twilio callbacks using them have expired.
+RECORDING_INT_URLS = os.environ.get("RECORDING_INT_URLS", "true") == "true"
+
+# Recordings are moved from the database into the "archive" storage (see
+# `voice_recordings.archive`) a calendar month at a time, once the month ended
+# this many days ago.
+RECORDING_RETENTION_DAYS = int(os.environ.get("RECORDING_RETENTION_DAYS", "31"))
+
+# Each process saves its request and Twilio API timings to the default cache
+# this often (in seconds), for the /metrics/ view to merge. See
+# `voice_recordings.metrics`.
+METRICS_FLUSH_INTERVAL = 10
+# Prometheus scrapes /metrics/ with this bearer token. Staff can also view it
+# in the browser.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
@@ -1,3 +1,332 @@
-from django.contrib import admin
+"""
+The admin, for ops.
 
-# Register your models here.
+The recordings table has millions of rows, so its changelist is built to
+take the same time on any page, however big the table gets:
+
+- Pages are fetched by keyset (newest first, older than the last id on the
+  previous page) rather than by offset, which would read and throw away
+  every row before the page.
+- The number of recordings is the planner's estimate (see
+  `estimate_count`) rather than a COUNT(*) over the table, and filters
+  don't count their choices.
+- The status and created filters, and search, are backed by indexes, and
+  search only finds exact phone numbers and Twilio SIDs.
+- Actions work through the selected recordings in batches, with bulk
+  updates.
+"""
+
+import csv
+import json
+from collections.abc import Iterator
+from datetime import timedelta
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .calls import _normalize_phone_number
+from .campaigns import call_times, import_campaign, queue_calls
+from .models import CallJob, Campaign, Recording
+from .signals import recording_updated
+
+# Query string parameter for the id that the changelist page starts after
+CURSOR_VAR = "cursor"
+
+# Databases without planner estimates count up to this many rows
+COUNT_LIMIT = 10_000
+
+# Recordings updated at a time by actions
+ACTION_BATCH_SIZE = 1000
+
+
+class CampaignForm(forms.ModelForm):
+    csv_file = forms.FileField(
+        label="CSV file",
+        help_text=(
+            "Phone numbers, with a header row. Large lists are better imported "
+            "with the import_campaign command, which isn't subject to request "
+            "timeouts."
+        ),
+    )
+    column = forms.CharField(initial="phone_number")
+
+    class Meta:
+        model = Campaign
+        fields = ("name",)
+
+    def clean(self):
+        """
+        Check the CSV has the column before the campaign is saved.
+        """
+        cleaned_data = super().clean()
+        csv_file = cleaned_data.get("csv_file")
+        column = cleaned_data.get("column")
+        if csv_file is None or column is None:
+            return cleaned_data
+
+        try:
+            # Spreadsheet exports often start with a byte order mark
+            header = next(csv.reader([csv_file.readline().decode("utf-8-sig")]), [])
+        except UnicodeDecodeError as e:
+            raise forms.ValidationError("The CSV file must be UTF-8.") from e
+        finally:
+            csv_file.seek(0)
+        if column not in header:
+            self.add_error("column", f"CSV has no {column!r} column")
+        return cleaned_data
+
+
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ("name", "created_at", "queued", "duplicates", "invalid")
+    readonly_fields = (
+        "created_at",
+        "rows",
+        "queued",
+        "duplicates",
+        "invalid",
+        "imported_at",
+    )
+
+    def get_form(self, request, obj=None, **kwargs):
+        # Campaigns are only uploaded when they're added
+        if obj is None:
+            kwargs["form"] = CampaignForm
+        return super().get_form(request, obj, **kwargs)
+
+    def get_fields(self, request, obj=None):
+        if obj is None:
+            return ["name", "csv_file", "column"]
+        return ["name", *self.readonly_fields]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            return
+
+        try:
+            import_campaign(
+                obj,
+                form.cleaned_data["csv_file"],
+                base_url=request.build_absolute_uri("/"),
+                column=form.cleaned_data["column"],
+                total_bytes=form.cleaned_data["csv_file"].size,
+            )
+        except ValueError as e:
+            # As the import_campaign command does
+            obj.delete()
+            messages.error(request, str(e))
+            return
+        messages.success(
+            request,
+            f"{obj.queued} calls queued, {obj.duplicates} duplicates, "
+            f"{obj.invalid} invalid numbers.",
+        )
+
+
+def estimate_count(queryset) -> int:
+    """
+    The planner's estimate of the number of rows the queryset matches, from
+    PostgreSQL's table statistics, without reading them. Other databases
+    (SQLite in development) count them, up to `COUNT_LIMIT`.
+    """
+    queryset = queryset.order_by()
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset[:COUNT_LIMIT].count()
+    plan = json.loads(queryset.explain(format="json"))
+    # Depending on the driver, a list with one plan, or the plan itself
+    if isinstance(plan, list):
+        plan = plan[0]
+    return int(plan["Plan"]["Plan Rows"])
+
+
+class KeysetChangeList(ChangeList):
+    """
+    A changelist that pages through its results newest first, by id, and
+    estimates how many there are. See the module docstring.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        super().__init__(request, *args, **kwargs)
+        # Filtering or searching starts from the newest again
+        self.params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        # Column sorting is disabled (`sortable_by`), as pages are keyed on id
+        return ["-pk"]
+
+    def get_results(self, request):
+        queryset = self.queryset
+        self.cursor = request.GET.get(CURSOR_VAR)
+        if self.cursor:
+            try:
+                queryset = queryset.filter(pk__lt=int(self.cursor))
+            except ValueError as e:
+                raise IncorrectLookupParameters from e
+        # One more than a page, to find out whether there's another
+        results = list(queryset[: self.list_per_page + 1])
+        self.result_list = results[: self.list_per_page]
+        self.next_url = None
+        if len(results) > self.list_per_page:
+            self.next_url = self.get_query_string({CURSOR_VAR: self.result_list[-1].pk})
+
+        if self.cursor or self.next_url:
+            self.result_count = estimate_count(self.queryset)
+            self.count_is_estimate = True
+        else:
+            # Everything is on this page
+            self.result_count = len(self.result_list)
+            self.count_is_estimate = False
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_url)
+        self.paginator = None
+
+
+class CreatedFilter(admin.SimpleListFilter):
+    title = "created"
+    parameter_name = "created"
+    DAYS = (("1", "Past 24 hours"), ("7", "Past 7 days"), ("31", "Past 31 days"))
+
+    def lookups(self, request, model_admin):
+        return self.DAYS
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        if self.value() not in dict(self.DAYS):
+            raise IncorrectLookupParameters
+        since = timezone.now() - timedelta(days=int(self.value()))
+        # Ids go up with created_at, so the first recording created since then
+        # (found with recording_created_at_idx) bounds the ids too, and pages
+        # only scan the primary key or recording_status_idx from there.
+        first_id = (
+            Recording.objects.filter(created_at__gte=since)
+            .order_by("created_at")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if first_id is None:
+            return queryset.none()
+        return queryset.filter(pk__gte=first_id, created_at__gte=since)
+
+
+@admin.register(Recording)
+class RecordingAdmin(admin.ModelAdmin):
+    list_display = ("id", "created_at", "phone_number", "status", "campaign")
+    list_filter = ("status", CreatedFilter)
+    list_select_related = ("campaign",)
+    sortable_by = ()
+    show_facets = admin.ShowFacets.NEVER
+    # Only used to show the search box. See `get_search_results`.
+    search_fields = (
+        "=normalized_phone_number",
+        "=twilio_call_sid",
+        "=twilio_recording_sid",
+    )
+    search_help_text = "A phone number, call SID (CA…) or recording SID (RE…)."
+    actions = ("retry_call", "mark_failed")
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.startswith("CA"):
+            return queryset.filter(twilio_call_sid=term), False
+        if term.startswith("RE"):
+            return queryset.filter(twilio_recording_sid=term), False
+        try:
+            number = _normalize_phone_number(term)
+        except ValueError:
+            return queryset.none(), False
+        return queryset.filter(normalized_phone_number=number), False
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in Recording._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Recordings are deleted by archiving them. Deleting a selection
+        # across pages would also load every one of them.
+        return False
+
+    @admin.action(description="Retry selected failed calls")
+    def retry_call(self, request, queryset):
+        """
+        Call the numbers of the selected failed recordings again, each as a
+        new recording, spaced out like a campaign's calls.
+        """
+        base_url = request.build_absolute_uri("/")
+        times = call_times()
+        queued = 0
+        for ids in _batches(queryset.filter(status=Recording.Status.FAILED)):
+            rows = Recording.objects.filter(pk__in=ids).values(
+                "phone_number", "normalized_phone_number", "campaign_id"
+            )
+            with transaction.atomic():
+                recordings = Recording.objects.bulk_create(
+                    Recording(**row) for row in rows
+                )
+                queued += len(queue_calls(recordings, base_url, times))
+        messages.success(request, f"{queued} calls queued.")
+
+    @admin.action(description="Mark selected calls in progress as failed")
+    def mark_failed(self, request, queryset):
+        """
+        Mark the selected recordings in progress as failed, and drop their
+        calls if they haven't been placed yet.
+        """
+        failed = 0
+        for ids in _batches(queryset.filter(status=Recording.Status.IN_PROGRESS)):
+            with transaction.atomic():
+                now = timezone.now()
+                recordings = list(
+                    Recording.objects.select_for_update(of=("self",))
+                    .filter(pk__in=ids, status=Recording.Status.IN_PROGRESS)
+                    # Being placed right now. Saving the call's SID would
+                    # undo the update.
+                    .exclude(call_job__locked_until__gt=now)
+                )
+                Recording.objects.filter(pk__in=[r.pk for r in recordings]).update(
+                    status=Recording.Status.FAILED, updated_at=now
+                )
+                CallJob.objects.filter(recording__in=recordings).delete()
+
+                # update() bypasses save(), so tell everyone else ourselves
+                for recording in recordings:
+                    recording.status = Recording.Status.FAILED
+                    recording.updated_at = now
+                    recording_updated.send(sender=Recording, recording=recording)
+            failed += len(recordings)
+        messages.success(request, f"{failed} calls marked as failed.")
+
+
+def _batches(queryset, batch_size: int = ACTION_BATCH_SIZE) -> Iterator[list[int]]:
+    # Keyset pagination by id, as in `archive`
+    last_id = 0
+    while True:
+        ids = list(
+            queryset.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
@@ -0,0 +1,137 @@
+"""
+Admission control for calls requested through the form.
+
+We can only place calls as fast as our Twilio accounts' rate-limits add up
+to, so when more storytellers ask for a call than that, the queue grows and
+"we'll call you now" stops being true. Before queueing a call, the form view
+asks for the estimated wait. Once it's over `CALL_WAIT_THRESHOLD`, the
+storyteller is told how long they'd wait, and offered a callback slot
+instead.
+
+The backlog is kept as the time it will have cleared by (see `CallBacklog`),
+rather than counted: each call pushes it back by `1 / total rate` seconds,
+and time passing drains it, so it needs no updating when calls are placed.
+Calls queued otherwise (campaigns, callbacks coming due) aren't in it. But
+calls are placed in `run_at` order, so a call requested now also waits for
+every call that's already due, and the wait is at least how overdue the
+oldest of those is.
+
+Callbacks are booked into fixed windows of `CALLBACK_SLOT_MINUTES`. Each
+window takes up to `CALLBACK_CAPACITY_SHARE` of our outbound rate, and its
+calls are spread evenly across it, rather than all being due at its start.
+"""
+
+import math
+from datetime import UTC, datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import CallBacklog, CallbackSlot, CallJob
+from .twilio_accounts import get_accounts
+
+BACKLOG = "calls"
+
+
+class SlotUnavailableError(Exception):
+    pass
+
+
+def total_rate() -> float:
+    """
+    Calls per second we can place, from all our accounts.
+    """
+    return sum(account.rate for account in get_accounts())
+
+
+def estimated_wait(now: datetime | None = None) -> timedelta:
+    """
+    How long a call requested now would wait to be placed.
+    """
+    now = now or timezone.now()
+    clears_at = (
+        CallBacklog.objects.filter(name=BACKLOG)
+        .values_list("clears_at", flat=True)
+        .first()
+    )
+    # Found with the (run_at, id) index
+    oldest_due = CallJob.objects.filter(run_at__lte=now).aggregate(
+        oldest=Min("run_at")
+    )["oldest"]
+    wait = max(clears_at or now, now) - now
+    if oldest_due is not None:
+        wait = max(wait, now - oldest_due)
+    return wait
+
+
+def admit_call() -> None:
+    """
+    Add a call to the backlog.
+    """
+    now = timezone.now()
+    interval = timedelta(seconds=1 / total_rate())
+    # One atomic update, so concurrent requests don't lose each other's calls
+    updated = CallBacklog.objects.filter(name=BACKLOG).update(
+        clears_at=Greatest(F("clears_at"), Value(now)) + interval
+    )
+    if not updated:
+        CallBacklog.objects.get_or_create(
+            name=BACKLOG, defaults={"clears_at": now + interval}
+        )
+
+
+def slot_length() -> timedelta:
+    return timedelta(minutes=settings.CALLBACK_SLOT_MINUTES)
+
+
+def slot_capacity() -> int:
+    """
+    Calls that can be booked into each callback slot.
+    """
+    seconds = slot_length().total_seconds()
+    return max(math.floor(seconds * total_rate() * settings.CALLBACK_CAPACITY_SHARE), 1)
+
+
+def callback_slots(now: datetime | None = None) -> list[datetime]:
+    """
+    Start times of the slots that can be booked now: those that start after
+    calls requested now would have been placed, and aren't full.
+    """
+    starts = _offered_slots(now)
+    full = set(
+        CallbackSlot.objects.filter(
+            start__in=starts, booked__gte=slot_capacity()
+        ).values_list("start", flat=True)
+    )
+    return [start for start in starts if start not in full]
+
+
+def book_callback(start: datetime) -> tuple[CallbackSlot, datetime]:
+    """
+    Book a call in the slot starting at `start`, one of `callback_slots()`.
+    Return the slot, and when the call should be placed. Raises
+    SlotUnavailableError if the slot has filled up or is no longer offered.
+    """
+    if start not in _offered_slots():
+        raise SlotUnavailableError(start)
+
+    capacity = slot_capacity()
+    with transaction.atomic():
+        slot, _ = CallbackSlot.objects.select_for_update().get_or_create(start=start)
+        if slot.booked >= capacity:
+            raise SlotUnavailableError(start)
+        run_at = slot.start + slot_length() * slot.booked / capacity
+        slot.booked += 1
+        slot.save(update_fields=["booked"])
+    return slot, run_at
+
+
+def _offered_slots(now: datetime | None = None) -> list[datetime]:
+    now = now or timezone.now()
+    length = slot_length().total_seconds()
+    earliest = (now + estimated_wait(now)).timestamp()
+    first = datetime.fromtimestamp(math.ceil(earliest / length) * length, tz=UTC)
+    return [first + slot_length() * i for i in range(settings.CALLBACK_SLOTS_OFFERED)]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VoiceRecordingsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "voice_recordings"
+
+    def ready(self):
+        # Connect signal receivers
+        from . import cache, encoding, events, media, pages, signals  # noqa: F401
@@ -0,0 +1,223 @@
+"""
+Cold storage for old recordings, so that the Recording table only holds
+about a month of them.
+
+`archive_recordings` moves each calendar month (in UTC) that has fallen out
+of `RECORDING_RETENTION_DAYS` from the database into the "archive" storage:
+
+1. Finished recordings created that month are read in chunks of ids, and
+   each chunk is written as its own gzip member of
+   `recordings-YYYY-MM-<timestamp>.jsonl.gz`, one JSON object per line.
+2. `recordings-YYYY-MM-<timestamp>.index.json` is written next to it, with the range of
+   ids in each chunk and where its member starts and ends. An archive without
+   an index is incomplete, and is ignored.
+3. The archived rows are deleted, without touching their media (archived
+   recordings can still be played).
+
+`find_recording` reads an archived recording back by id, decompressing only
+the chunk that holds it. `cache.get_recording` falls back to it, so archived
+recordings' pages keep working.
+
+Recordings that are still in progress, or have jobs or webhook events
+waiting on them, stay in the database until a later run. Rows are only
+deleted once their archive is complete, so an interrupted run at worst
+archives some recordings twice, which reads back the same.
+"""
+
+import gzip
+import json
+import tempfile
+from collections.abc import Iterator
+from datetime import UTC, datetime, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from .models import Recording, TranscriptChunk, WebhookEvent
+
+ARCHIVE_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".index.json"
+
+# Index files never change once written, and there are only a couple a month,
+# so keep them all around.
+indexes = {}
+
+
+def get_storage() -> Storage:
+    return storages["archive"]
+
+
+def archive_recordings(
+    retention: timedelta | None = None, chunk_size: int = 1000
+) -> dict[str, int]:
+    """
+    Archive every month that ended more than `retention` ago. Return the
+    number of recordings archived from each, by archive name.
+    """
+    if retention is None:
+        retention = timedelta(days=settings.RECORDING_RETENTION_DAYS)
+    cutoff = timezone.now() - retention
+
+    archived = {}
+    oldest = Recording.objects.aggregate(oldest=Min("created_at"))["oldest"]
+    if oldest is None:
+        return archived
+    month = _month_start(oldest)
+    while (end := _next_month(month)) <= cutoff:
+        name, count = archive_month(month, chunk_size=chunk_size)
+        if count:
+            archived[name] = count
+        month = end
+    return archived
+
+
+def archive_month(month: datetime, chunk_size: int = 1000) -> tuple[str, int]:
+    """
+    Archive the finished recordings created in the month starting at
+    `month`, and delete them. Return the archive's name and the number of
+    recordings archived.
+    """
+    storage = get_storage()
+    recordings = (
+        Recording.objects.filter(
+            created_at__gte=month, created_at__lt=_next_month(month)
+        )
+        .exclude(status=Recording.Status.IN_PROGRESS)
+        .exclude(call_job__isnull=False)
+        .exclude(processing_jobs__isnull=False)
+        .exclude(
+            Exists(
+                WebhookEvent.objects.filter(
+                    recording=OuterRef("pk"), processed_at__isnull=True
+                )
+            )
+        )
+    )
+
+    chunks = []
+    with tempfile.TemporaryFile() as file:
+        for rows in _chunks(recordings, chunk_size):
+            lines = "".join(
+                json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows
+            )
+            member = gzip.compress(lines.encode())
+            chunks.append(
+                {
+                    "first_id": rows[0]["id"],
+                    "last_id": rows[-1]["id"],
+                    "ids": [row["id"] for row in rows],
+                    "offset": file.tell(),
+                    "length": len(member),
+                }
+            )
+            file.write(member)
+        if not chunks:
+            return "", 0
+
+        file.seek(0)
+        # Late finishers are archived by a later run, into a separate archive
+        stem = f"recordings-{month:%Y-%m}-{timezone.now():%Y%m%d%H%M%S}"
+        name = storage.save(stem + ARCHIVE_SUFFIX, File(file))
+
+    index = {
+        "name": name,
+        "chunks": [
+            {key: chunk[key] for key in ("first_id", "last_id", "offset", "length")}
+            for chunk in chunks
+        ],
+    }
+    storage.save(stem + INDEX_SUFFIX, ContentFile(json.dumps(index).encode()))
+
+    count = 0
+    for chunk in chunks:
+        with transaction.atomic():
+            # Processed events are only kept for the inbox's sake
+            WebhookEvent.objects.filter(recording__in=chunk["ids"]).delete()
+            # Left behind by transcriptions that gave up
+            TranscriptChunk.objects.filter(recording__in=chunk["ids"]).delete()
+            # Delete the rows without sending post_delete, which would delete
+            # their media too. Nothing else refers to them (see above).
+            Recording.objects.filter(pk__in=chunk["ids"])._raw_delete(
+                Recording.objects.db
+            )
+        count += len(chunk["ids"])
+    return name, count
+
+
+def find_recording(recording_id: int) -> Recording | None:
+    """
+    Return the archived recording with the given id, or None if it hasn't
+    been archived. The returned instance isn't in the database, so don't
+    save it.
+    """
+    storage = get_storage()
+    try:
+        _, names = storage.listdir("")
+    except FileNotFoundError:
+        # Nothing archived yet
+        return None
+
+    for name in sorted(names):
+        if not name.endswith(INDEX_SUFFIX):
+            continue
+        index = _load_index(name)
+        for chunk in index["chunks"]:
+            if not chunk["first_id"] <= recording_id <= chunk["last_id"]:
+                continue
+            for row in _read_chunk(index["name"], chunk):
+                if row["id"] == recording_id:
+                    return _to_recording(row)
+    return None
+
+
+def _chunks(recordings, chunk_size: int) -> Iterator[list[dict]]:
+    # Keyset pagination by id, rather than offsets
+    last_id = 0
+    while True:
+        rows = list(
+            recordings.filter(id__gt=last_id).order_by("id").values()[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+
+
+def _load_index(name: str) -> dict:
+    index = indexes.get(name)
+    if index is None:
+        with get_storage().open(name, "rb") as f:
+            index = json.load(f)
+        indexes[name] = index
+    return index
+
+
+def _read_chunk(name: str, chunk: dict) -> Iterator[dict]:
+    with get_storage().open(name, "rb") as f:
+        f.seek(chunk["offset"])
+        member = f.read(chunk["length"])
+    for line in gzip.decompress(member).splitlines():
+        yield json.loads(line)
+
+
+def _to_recording(row: dict) -> Recording:
+    fields = {
+        key: Recording._meta.get_field(key).to_python(value)
+        for key, value in row.items()
+    }
+    return Recording(**fields)
+
+
+def _month_start(when: datetime) -> datetime:
+    when = when.astimezone(UTC)
+    return when.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
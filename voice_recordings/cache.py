@@ -0,0 +1,152 @@
+"""
+Write-through cache in front of Recording lookups, so that polling a
+recording's status doesn't touch the database.
+
+There are two tiers:
+
+1. Django's default cache, shared by every process, holding whole Recording
+   instances. Every write to a recording updates it once the write has been
+   committed, unless a newer copy is already cached. Entries expire after
+   `RECORDING_CACHE_TIMEOUT`, in case writes race one another.
+2. A small LRU in each process, holding the status of completed recordings.
+   Other processes can't invalidate it, so it only holds statuses that can
+   never change again.
+"""
+
+import threading
+from collections import Counter, OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import archive
+from .models import Recording
+from .signals import recording_updated
+
+# Hit/miss counters for this process
+stats = Counter()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+local_statuses = LRUCache(maxsize=settings.RECORDING_CACHE_LOCAL_SIZE)
+
+
+def get_recording(recording_id: int) -> Recording:
+    """
+    Return the given Recording, from the cache if possible, or from the
+    archive if it has been archived. Raises Recording.DoesNotExist like
+    `Recording.objects.get`.
+    """
+    key = _key(recording_id)
+    recording = cache.get(key)
+    if recording is not None:
+        stats["hits"] += 1
+        return recording
+
+    stats["misses"] += 1
+    try:
+        recording = Recording.objects.get(pk=recording_id)
+    except Recording.DoesNotExist:
+        # Archived recordings never change, so they can be cached too
+        recording = archive.find_recording(recording_id)
+        if recording is None:
+            raise
+    # Use add() rather than set(), so that we don't overwrite a newer version
+    # written through by a save() that committed after our query.
+    cache.add(key, recording, timeout=settings.RECORDING_CACHE_TIMEOUT)
+    return recording
+
+
+def get_status(recording_id: int) -> Recording.Status:
+    status = local_statuses.get(recording_id)
+    if status is not None:
+        stats["local_hits"] += 1
+        return status
+
+    status = Recording.Status(get_recording(recording_id).status)
+    if status == Recording.Status.COMPLETE:
+        local_statuses.set(recording_id, status)
+    return status
+
+
+async def aget_recording(recording_id: int) -> Recording:
+    """
+    Async version of `get_recording`.
+    """
+    key = _key(recording_id)
+    recording = await cache.aget(key)
+    if recording is not None:
+        stats["hits"] += 1
+        return recording
+
+    stats["misses"] += 1
+    try:
+        recording = await Recording.objects.aget(pk=recording_id)
+    except Recording.DoesNotExist:
+        recording = await sync_to_async(archive.find_recording)(recording_id)
+        if recording is None:
+            raise
+    await cache.aadd(key, recording, timeout=settings.RECORDING_CACHE_TIMEOUT)
+    return recording
+
+
+async def aget_status(recording_id: int) -> Recording.Status:
+    status = local_statuses.get(recording_id)
+    if status is not None:
+        stats["local_hits"] += 1
+        return status
+
+    status = Recording.Status((await aget_recording(recording_id)).status)
+    if status == Recording.Status.COMPLETE:
+        local_statuses.set(recording_id, status)
+    return status
+
+
+def _key(recording_id: int) -> str:
+    # Bump the version whenever the pickled Recording changes shape.
+    # v2: statuses became integers.
+    return f"recording:v2:{recording_id}"
+
+
+@receiver(recording_updated)
+def _write_through(sender, recording, **kwargs):
+    transaction.on_commit(lambda: _set_unless_older(recording))
+
+
+def _set_unless_older(recording: Recording) -> None:
+    # Concurrent writes can commit in one order and reach us in the other.
+    # Another write can still slip in between get() and set(), but then the
+    # stale copy only lasts until it expires.
+    key = _key(recording.pk)
+    cached = cache.get(key)
+    if cached is not None and cached.updated_at > recording.updated_at:
+        return
+    cache.set(key, recording, timeout=settings.RECORDING_CACHE_TIMEOUT)
@@ -0,0 +1,377 @@
+"""
+Outbound call queue.
+
+The form view doesn't call Twilio itself. Instead it enqueues a `CallJob`,
+which the `dispatch_calls` management command picks up and places from one of
+our Twilio accounts. Each account has a token bucket shared by every worker,
+so that we stay within Twilio's outbound call rate-limit no matter how many
+processes are running.
+
+A worker places one call at a time, so it can place at most 1 / (Twilio's
+response time) calls a second. `dispatch_calls --concurrency` places calls
+with Twilio's async API instead, keeping several requests in flight.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from twilio.base.exceptions import TwilioException, TwilioRestException
+from twilio.rest import Client
+
+from .leases import backoff, claim_next
+from .models import CallbackSlot, CallJob, RateLimit, Recording
+from .twilio_accounts import AsyncTimedHttpClient, TwilioAccount, get_accounts
+
+logger = logging.getLogger(__name__)
+
+PHONE_NUMBER_PATTERN = "[0-9]{3}-?[0-9]{3}-?[0-9]{4}"
+E164_PATTERN = r"\+1[0-9]{10}"
+
+# How long a worker may hold on to a job before another worker is allowed to
+# pick it up again.
+JOB_LEASE = timedelta(seconds=60)
+
+# What placing a call can fail with: Twilio's errors, invalid numbers
+# (ValueError), and network errors, which are all OSErrors for requests but not
+# for aiohttp. Anything else is a bug, and leaves the job to be retried once its
+# lease runs out.
+CALL_ERRORS = (TwilioException, ValueError, OSError, aiohttp.ClientError)
+
+
+def enqueue_call(
+    recording: Recording,
+    webhook_url: str,
+    status_callback_url: str,
+    run_at: datetime | None = None,
+    callback_slot: CallbackSlot | None = None,
+) -> CallJob:
+    """
+    Queue up a call for the given recording, to be placed now or at `run_at`.
+    Twilio will request `webhook_url` once the call connects, and
+    `status_callback_url` once it ends.
+    """
+    return CallJob.objects.create(
+        recording=recording,
+        webhook_url=webhook_url,
+        status_callback_url=status_callback_url,
+        run_at=run_at or timezone.now(),
+        callback_slot=callback_slot,
+    )
+
+
+class TokenBucket:
+    """
+    A token bucket stored in the database, so that the limit holds across all
+    web and worker processes. Tokens refill at `rate` per second, up to
+    `capacity`.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float = 1):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    def acquire(self) -> float:
+        """
+        Try to take a token from the bucket. Return 0 if we got one, otherwise
+        the number of seconds to wait before trying again.
+        """
+        with transaction.atomic():
+            bucket, _ = RateLimit.objects.select_for_update().get_or_create(
+                name=self.name,
+                defaults={"tokens": self.capacity, "updated_at": timezone.now()},
+            )
+            now = timezone.now()
+            tokens = self.available(bucket, now)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            bucket.tokens = tokens
+            bucket.updated_at = now
+            bucket.save()
+        return wait
+
+    def available(self, bucket: RateLimit | None, now: datetime) -> float:
+        """
+        Return the number of tokens in the bucket at the given time.
+        """
+        if bucket is None:
+            return self.capacity
+        elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+        return min(self.capacity, bucket.tokens + elapsed * self.rate)
+
+
+class CallScheduler:
+    """
+    Spread calls over our Twilio accounts, favouring whichever account has the
+    most of its rate-limit left. Total throughput is the sum of the accounts'
+    rates.
+    """
+
+    def __init__(self, accounts: list[TwilioAccount]):
+        self.accounts = accounts
+        self.rate_limits = {
+            account.sid: TokenBucket(
+                f"outbound_calls:{account.sid}",
+                rate=account.rate,
+                capacity=settings.CALL_DISPATCH_BURST,
+            )
+            for account in accounts
+        }
+
+    def acquire(self) -> tuple[TwilioAccount | None, float]:
+        """
+        Take a token from one of the accounts. Return the account, or None
+        and the number of seconds to wait before trying again.
+        """
+        now = timezone.now()
+        buckets = RateLimit.objects.in_bulk(
+            [rate_limit.name for rate_limit in self.rate_limits.values()]
+        )
+        remaining = {
+            sid: rate_limit.available(buckets.get(rate_limit.name), now)
+            for sid, rate_limit in self.rate_limits.items()
+        }
+        # Other workers may take tokens between us reading the buckets and
+        # acquiring a token, so fall back to the next best account.
+        waits = []
+        for account in sorted(self.accounts, key=lambda a: -remaining[a.sid]):
+            wait = self.rate_limits[account.sid].acquire()
+            if wait == 0:
+                return account, 0.0
+            waits.append(wait)
+        return None, min(waits)
+
+
+def get_call_scheduler() -> CallScheduler:
+    return CallScheduler(get_accounts())
+
+
+def claim_next_job() -> CallJob | None:
+    """
+    Lease the next due job, or return None if there is nothing to do.
+    """
+    pk = claim_next(CallJob, JOB_LEASE)
+    if pk is None:
+        return None
+    return CallJob.objects.select_related("recording").get(pk=pk)
+
+
+def dispatch_next_call(scheduler: CallScheduler) -> bool:
+    """
+    Place the next queued call, waiting for the rate-limit if necessary.
+    Return False if the queue is empty.
+    """
+    job = claim_next_job()
+    if job is None:
+        return False
+
+    account, wait = scheduler.acquire()
+    while account is None:
+        if not _extend_lease(job, wait):
+            return True
+        time.sleep(wait)
+        account, wait = scheduler.acquire()
+
+    run_job(job, account)
+    return True
+
+
+async def dispatch_calls_async(
+    scheduler: CallScheduler,
+    concurrency: int,
+    once: bool = False,
+    poll_interval: float = 0.5,
+) -> None:
+    """
+    Place queued calls with up to `concurrency` Twilio API requests in flight
+    at once, so that one worker can keep up with a rate-limit higher than
+    1 / Twilio's response time. With `once`, return once the queue is empty.
+    """
+    claim = sync_to_async(claim_next_job)
+    acquire = sync_to_async(scheduler.acquire)
+    extend_lease = sync_to_async(_extend_lease)
+    placing = set()
+    async with AsyncTimedHttpClient() as http_client:
+        while True:
+            if len(placing) >= concurrency:
+                _, placing = await asyncio.wait(
+                    placing, return_when=asyncio.FIRST_COMPLETED
+                )
+                continue
+
+            job = await claim()
+            if job is None:
+                if once:
+                    if placing:
+                        await asyncio.wait(placing)
+                    return
+                await asyncio.sleep(poll_interval)
+                continue
+
+            account, wait = await acquire()
+            while account is None:
+                if not await extend_lease(job, wait):
+                    break
+                await asyncio.sleep(wait)
+                account, wait = await acquire()
+            if account is None:
+                continue
+
+            task = asyncio.create_task(run_job_async(job, account, http_client))
+            placing.add(task)
+            task.add_done_callback(placing.discard)
+
+
+def _extend_lease(job: CallJob, wait: float) -> bool:
+    """
+    Hold on to a job for another `wait` seconds (plus `JOB_LEASE`) while we
+    wait for the rate-limit, so that no other worker claims it and calls the
+    number twice. Return False if another worker already has.
+    """
+    locked_until = timezone.now() + timedelta(seconds=wait) + JOB_LEASE
+    extended = CallJob.objects.filter(pk=job.pk, locked_until=job.locked_until).update(
+        locked_until=locked_until
+    )
+    if not extended:
+        logger.warning("Lost the lease on call job %s, skipping it", job.pk)
+        return False
+    job.locked_until = locked_until
+    return True
+
+
+def run_job(job: CallJob, account: TwilioAccount) -> None:
+    try:
+        call_sid = _place_call(job, account.client(), account)
+    except CALL_ERRORS as e:
+        _call_failed(job, e)
+    else:
+        _call_placed(job, account, call_sid)
+
+
+async def run_job_async(
+    job: CallJob, account: TwilioAccount, http_client: AsyncTimedHttpClient
+) -> None:
+    """
+    Like `run_job`, placing the call with Twilio's async API.
+    """
+    try:
+        call_sid = await _place_call_async(
+            job, account.async_client(http_client), account
+        )
+    except CALL_ERRORS as e:
+        await sync_to_async(_call_failed)(job, e)
+    else:
+        await sync_to_async(_call_placed)(job, account, call_sid)
+
+
+def _call_placed(job: CallJob, account: TwilioAccount, call_sid: str) -> None:
+    with transaction.atomic():
+        # Read afresh, as a quick status callback may already have failed the
+        # call. Only our fields are saved, and the cache gets the current row.
+        recording = Recording.objects.select_for_update().get(pk=job.recording_id)
+        recording.twilio_account_sid = account.sid
+        recording.twilio_call_sid = call_sid
+        recording.placed_at = timezone.now()
+        recording.save(
+            update_fields=[
+                "twilio_account_sid",
+                "twilio_call_sid",
+                "placed_at",
+                "updated_at",
+            ]
+        )
+        job.delete()
+
+
+def _call_failed(job: CallJob, error: Exception) -> None:
+    recording = job.recording
+    job.attempts += 1
+    if _is_transient(error) and job.attempts < settings.CALL_DISPATCH_MAX_ATTEMPTS:
+        delay = backoff(job.attempts)
+        logger.warning(
+            "Call for recording %s failed, retrying in %ss: %s",
+            recording.pk,
+            delay,
+            error,
+        )
+        job.run_at = timezone.now() + timedelta(seconds=delay)
+        job.locked_until = None
+        job.last_error = str(error)
+        job.save()
+        return
+
+    logger.error("Call for recording %s failed", recording.pk, exc_info=error)
+    with transaction.atomic():
+        recording = Recording.objects.select_for_update().get(pk=job.recording_id)
+        recording.status = Recording.Status.FAILED
+        recording.save(update_fields=["status", "updated_at"])
+        job.delete()
+
+
+def _is_transient(error: Exception) -> bool:
+    """
+    Return True if the failed call is worth retrying: Twilio is rate-limiting
+    us or having problems of its own, or we couldn't reach it at all.
+    Anything else (an invalid number, bad credentials) will fail again.
+    """
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    # requests' exceptions, socket errors and timeouts are all OSErrors.
+    # aiohttp's (from the async path) aren't all.
+    return isinstance(error, (OSError, aiohttp.ClientError))
+
+
+def _place_call(job: CallJob, client: Client, account: TwilioAccount) -> str:
+    """
+    Using the Twilio Voice API, place the job's call from the given account.
+    Return the call's Twilio SID.
+    """
+    call = client.calls.create(**_call_params(job, account))
+    return call.sid
+
+
+async def _place_call_async(
+    job: CallJob, client: Client, account: TwilioAccount
+) -> str:
+    call = await client.calls.create_async(**_call_params(job, account))
+    return call.sid
+
+
+def _call_params(job: CallJob, account: TwilioAccount) -> dict:
+    recording = job.recording
+    # Jobs queued before we asked for call status callbacks don't have a url
+    status_callback = (
+        {"status_callback": job.status_callback_url} if job.status_callback_url else {}
+    )
+    return {
+        "to": _normalize_phone_number(recording.phone_number),
+        "from_": account.from_number(recording.pk),
+        "url": job.webhook_url,
+        **status_callback,
+    }
+
+
+def _normalize_phone_number(tel: str) -> str:
+    """
+    Return the given phone number in E.164 format, as Twilio expects. Raises
+    ValueError if it isn't a valid number.
+    """
+    tel = tel.strip()
+    if re.fullmatch(E164_PATTERN, tel):
+        # Already normalized, e.g. imported with a campaign
+        return tel
+    if not re.fullmatch(PHONE_NUMBER_PATTERN, tel):
+        raise ValueError(f"Invalid phone number: {tel!r}")
+    without_dashes = tel.replace("-", "")
+    return f"+1{without_dashes}"  # US numbers only for now
@@ -0,0 +1,164 @@
+"""
+Bulk call campaigns: calling every phone number in a CSV.
+
+`import_campaign` reads the CSV a line at a time. For each batch of rows it
+validates and normalizes the numbers, skips ones that are already in the
+campaign, bulk creates their recordings and queues their calls. Memory use
+depends on the batch size, not the size of the file: duplicates are found
+with the (campaign, phone_number) index rather than a set of every number
+seen so far.
+
+Calls are spaced out at our total outbound rate (the sum of our Twilio
+accounts' rates), after any calls already scheduled. The `dispatch_calls`
+worker then places them as fast as it's allowed to, and calls requested
+through the form in the meantime don't have to wait for the whole campaign.
+See `call_times`, which the admin also uses to retry failed calls.
+"""
+
+import csv
+import itertools
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import BinaryIO
+
+from django.db import transaction
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import timezone
+
+from .calls import _normalize_phone_number
+from .models import CallJob, Campaign, Recording
+from .twilio_accounts import get_accounts
+
+
+@dataclass
+class ImportProgress:
+    campaign: Campaign
+    total_bytes: int | None = None
+    bytes_read: int = 0
+    started: float = field(default_factory=time.monotonic)
+    # When the last call queued so far is due to be placed
+    last_call_at: datetime | None = None
+
+    @property
+    def eta(self) -> float | None:
+        """
+        Seconds until the import finishes, going by how much of the file we've
+        read so far, if we know its size.
+        """
+        if not self.total_bytes or not self.bytes_read:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed * (self.total_bytes - self.bytes_read) / self.bytes_read
+
+
+def import_campaign(
+    campaign: Campaign,
+    file: BinaryIO,
+    base_url: str,
+    column: str = "phone_number",
+    batch_size: int = 1000,
+    total_bytes: int | None = None,
+    progress: Callable[[ImportProgress], None] | None = None,
+) -> ImportProgress:
+    """
+    Queue calls to the numbers in the given column of a CSV file (opened in
+    binary mode). Twilio's webhooks are sent to `base_url`, which should be
+    the site's root URL, e.g. "https://example.com/". `progress` is called
+    after each batch.
+    """
+    state = ImportProgress(campaign, total_bytes=total_bytes)
+    reader = csv.DictReader(_lines(file, state))
+    if reader.fieldnames is None or column not in reader.fieldnames:
+        raise ValueError(f"CSV has no {column!r} column")
+
+    times = call_times()
+    for rows in itertools.batched(reader, batch_size, strict=False):
+        numbers = []
+        for row in rows:
+            try:
+                numbers.append(_normalize_phone_number(row[column] or ""))
+            except ValueError:
+                campaign.invalid += 1
+        campaign.rows += len(rows)
+
+        unique = list(dict.fromkeys(numbers))
+        existing = set(
+            Recording.objects.filter(
+                campaign=campaign, phone_number__in=unique
+            ).values_list("phone_number", flat=True)
+        )
+        new = [number for number in unique if number not in existing]
+        campaign.duplicates += len(numbers) - len(new)
+
+        with transaction.atomic():
+            recordings = Recording.objects.bulk_create(
+                Recording(
+                    phone_number=number,
+                    normalized_phone_number=number,
+                    campaign=campaign,
+                )
+                for number in new
+            )
+            jobs = queue_calls(recordings, base_url, times)
+            if jobs:
+                state.last_call_at = jobs[-1].run_at
+            campaign.queued += len(jobs)
+            campaign.save()
+
+        if progress is not None:
+            progress(state)
+
+    campaign.imported_at = timezone.now()
+    campaign.save(update_fields=["imported_at"])
+    return state
+
+
+def call_times() -> Iterator[datetime]:
+    """
+    When to place calls queued in bulk: one every 1 / (our total outbound
+    rate) seconds, starting after any calls already scheduled.
+    """
+    rate = sum(account.rate for account in get_accounts())
+    interval = timedelta(seconds=1 / rate)
+    now = timezone.now()
+    # Callbacks are booked into their own share of our capacity, later on
+    scheduled = CallJob.objects.filter(callback_slot__isnull=True).aggregate(
+        last=Max("run_at")
+    )["last"]
+    run_at = max(now, scheduled + interval) if scheduled else now
+    while True:
+        yield run_at
+        run_at += interval
+
+
+def queue_calls(
+    recordings: Iterable[Recording], base_url: str, times: Iterator[datetime]
+) -> list[CallJob]:
+    """
+    Queue calls for the given recordings, at the next of `times` each.
+    """
+    return CallJob.objects.bulk_create(
+        CallJob(
+            recording=recording,
+            webhook_url=_url(base_url, "call_started_webhook", recording),
+            status_callback_url=_url(
+                base_url, "call_status_updated_webhook", recording
+            ),
+            run_at=next(times),
+        )
+        for recording in recordings
+    )
+
+
+def _lines(file: BinaryIO, state: ImportProgress) -> Iterator[str]:
+    for line in file:
+        state.bytes_read += len(line)
+        # Spreadsheet exports often start with a byte order mark
+        yield line.decode("utf-8-sig")
+
+
+def _url(base_url: str, view_name: str, recording: Recording) -> str:
+    return base_url.rstrip("/") + reverse(view_name, args=[recording.pk])
@@ -0,0 +1,198 @@
+"""
+Compact storage for recordings' audio.
+
+Twilio records phone calls as mp3s, at more bits per second than 8 kHz
+speech needs. Once a recording has been fetched and analyzed (see `media`
+and `waveforms`), the `process_recordings` worker runs `encode_audio`, which
+re-encodes our copy with Opus, a codec made for speech, at
+`RECORDING_AUDIO_BITRATE`, and deletes the mp3.
+
+Encoded audio is stored as an `AudioBlob`, named after the SHA-256 of the
+mp3 it was encoded from. Recordings with the same audio (a call whose
+recording was fetched twice, say) share one blob, and each mp3 is only
+encoded once. The hash is of the mp3 rather than of the blob, because Ogg
+files start with a random stream serial number, so encoding the same audio
+twice doesn't give the same bytes.
+
+Twilio already trims leading and trailing silence from recordings (see the
+`trim` option in `twiml`), and doesn't tell us how much it trimmed, so
+recordings are encoded whole.
+
+`savings` and `total_savings` report how many bytes this saves. See the
+`audio_savings_report` command.
+"""
+
+import hashlib
+import logging
+import tempfile
+from collections.abc import Iterator
+
+import soundfile
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .media import get_storage
+from .models import AudioBlob, Recording
+
+logger = logging.getLogger(__name__)
+
+# Frames to decode at a time
+BLOCK_SIZE = 64 * 1024
+
+# The only sample rates Opus encodes. Twilio records at 8 kHz.
+OPUS_SAMPLE_RATES = {8000, 12000, 16000, 24000, 48000}
+
+# libsndfile sets Opus' bitrate from a compression level between 0 and 1,
+# linearly from 256 kbps (per channel) down to 6 kbps
+MAX_BITRATE = 256_000
+MIN_BITRATE = 6_000
+
+
+def encode_audio(recording: Recording) -> None:
+    """
+    Replace the given recording's mp3 with an `AudioBlob`, encoding one if
+    there isn't already a blob of the same audio.
+    """
+    if recording.audio_blob_id or not recording.media_name:
+        return
+
+    storage = get_storage()
+    media_name = recording.media_name
+    with storage.open(media_name, "rb") as file:
+        sha256, source_size = _hash(file)
+        if not _add_reference(sha256, recording):
+            file.seek(0)
+            if not _encode(file, sha256, source_size, recording):
+                return
+
+    with transaction.atomic():
+        recording.media_name = ""
+        recording.save(update_fields=["media_name", "updated_at"])
+        transaction.on_commit(lambda: storage.delete(media_name))
+
+
+def savings() -> Iterator[tuple[int, int, int]]:
+    """
+    Yield the id of each recording in the database with encoded audio, the
+    bytes of its mp3, and the bytes stored for it: the size of its blob, or
+    nothing for recordings that share the blob of an earlier one.
+    """
+    last_sha256 = None
+    recordings = (
+        Recording.objects.filter(audio_blob__isnull=False)
+        .order_by("audio_blob", "pk")
+        .values_list("pk", "audio_blob", "audio_blob__source_size", "audio_blob__size")
+    )
+    for pk, sha256, source_size, size in recordings.iterator():
+        yield pk, source_size, size if sha256 != last_sha256 else 0
+        last_sha256 = sha256
+
+
+def total_savings() -> tuple[int, int]:
+    """
+    Return the bytes of every encoded recording's mp3, archived ones
+    included, and the bytes of their blobs.
+    """
+    totals = AudioBlob.objects.aggregate(
+        source_size=Sum(F("source_size") * F("references")), size=Sum("size")
+    )
+    return totals["source_size"] or 0, totals["size"] or 0
+
+
+def compression_level(bitrate: int) -> float:
+    """
+    libsndfile's compression level for a mono Opus stream of about `bitrate`
+    bits per second.
+    """
+    level = (MAX_BITRATE - bitrate) / (MAX_BITRATE - MIN_BITRATE)
+    return min(max(level, 0.0), 1.0)
+
+
+def _hash(file) -> tuple[str, int]:
+    sha256 = hashlib.sha256()
+    size = 0
+    while chunk := file.read(BLOCK_SIZE):
+        sha256.update(chunk)
+        size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+def _add_reference(sha256: str, recording: Recording) -> bool:
+    """
+    Point the recording at the existing blob with the given hash. Return
+    False if there isn't one.
+    """
+    with transaction.atomic():
+        # One atomic update, so the blob's last other recording can't be
+        # deleted (and the blob with it) in between
+        if not AudioBlob.objects.filter(pk=sha256).update(
+            references=F("references") + 1
+        ):
+            return False
+        recording.audio_blob_id = sha256
+        recording.save(update_fields=["audio_blob", "updated_at"])
+    return True
+
+
+def _encode(file, sha256: str, source_size: int, recording: Recording) -> bool:
+    """
+    Encode the recording's audio as a new blob, and point the recording at
+    it. Return False if it can't be encoded.
+    """
+    storage = get_storage()
+    with soundfile.SoundFile(file) as audio:
+        if audio.samplerate not in OPUS_SAMPLE_RATES:
+            # Not from Twilio. Keep the mp3.
+            logger.warning(
+                "Not encoding recording %s, at %s Hz", recording.pk, audio.samplerate
+            )
+            return False
+
+        with tempfile.TemporaryFile() as encoded:
+            with soundfile.SoundFile(
+                encoded,
+                "w",
+                samplerate=audio.samplerate,
+                channels=audio.channels,
+                format="OGG",
+                subtype="OPUS",
+                compression_level=compression_level(settings.RECORDING_AUDIO_BITRATE),
+            ) as output:
+                for block in audio.blocks(BLOCK_SIZE, dtype="float32"):
+                    output.write(block)
+            size = encoded.tell()
+            encoded.seek(0)
+            name = storage.save(AudioBlob.storage_name(sha256), File(encoded))
+
+    if name != AudioBlob.storage_name(sha256):
+        # Another worker stored the same audio first, so use theirs
+        storage.delete(name)
+
+    with transaction.atomic():
+        blob, created = AudioBlob.objects.get_or_create(
+            pk=sha256,
+            defaults={"source_size": source_size, "size": size, "references": 1},
+        )
+        if not created:
+            AudioBlob.objects.filter(pk=sha256).update(references=F("references") + 1)
+        recording.audio_blob = blob
+        recording.save(update_fields=["audio_blob", "updated_at"])
+    return True
+
+
+@receiver(post_delete, sender=Recording)
+def _release_blob(sender, instance, **kwargs):
+    sha256 = instance.audio_blob_id
+    if not sha256:
+        return
+
+    AudioBlob.objects.filter(pk=sha256).update(references=F("references") - 1)
+    deleted, _ = AudioBlob.objects.filter(pk=sha256, references=0).delete()
+    if deleted:
+        transaction.on_commit(
+            lambda: get_storage().delete(AudioBlob.storage_name(sha256))
+        )
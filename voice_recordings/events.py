@@ -0,0 +1,131 @@
+"""
+Publish/subscribe for recording status changes, used to push updates to the
+recording page as server-sent events.
+
+Every process has a single broker, which fans updates out to all of the
+streams open in that process. On Postgres, updates are published with NOTIFY
+and each process listens on one dedicated connection, so a status change
+written by any process reaches every open stream. Elsewhere (SQLite, in
+development) updates only reach streams served by the process that wrote
+them.
+"""
+
+import asyncio
+import contextlib
+import logging
+import threading
+import weakref
+from collections import defaultdict
+from collections.abc import AsyncIterator
+
+from django.db import connection, transaction
+from django.dispatch import receiver
+
+from .signals import recording_updated
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "recording_status"
+
+
+class Broker:
+    """
+    In-process broker. Subscribers are asyncio queues, which may live on
+    different event loops to the thread that publishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, recording_id: int, status: int) -> None:
+        self.deliver(recording_id, status)
+
+    def deliver(self, recording_id: int, status: int) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(recording_id, ()))
+        for loop, queue in subscribers:
+            # RuntimeError if the subscriber's event loop has been closed
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(queue.put_nowait, status)
+
+    async def start(self) -> None:
+        pass
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, recording_id: int) -> AsyncIterator[asyncio.Queue]:
+        """
+        Yield a queue that receives the given recording's status every time
+        it is written.
+        """
+        await self.start()
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[recording_id].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[recording_id].discard(subscriber)
+                if not self._subscribers[recording_id]:
+                    del self._subscribers[recording_id]
+
+
+class PostgresBroker(Broker):
+    """
+    Broker that publishes through Postgres' NOTIFY, and delivers
+    notifications from one LISTEN connection per event loop.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._listeners = weakref.WeakKeyDictionary()
+
+    def publish(self, recording_id: int, status: int) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)", [CHANNEL, f"{recording_id}:{status}"]
+            )
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None or listener.done():
+            self._listeners[loop] = loop.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        # Only this broker needs psycopg, and only in production, on Postgres
+        import psycopg
+
+        params = connection.get_connection_params()
+        # Django's cursor factory and adapters are for sync connections
+        params.pop("cursor_factory", None)
+        params.pop("context", None)
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    autocommit=True, **params
+                ) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    async for notification in conn.notifies():
+                        recording_id, status = notification.payload.split(":")
+                        self.deliver(int(recording_id), int(status))
+            except psycopg.Error:
+                logger.exception("Lost %s listener connection", CHANNEL)
+                await asyncio.sleep(1)
+
+
+_broker: Broker | None = None
+
+
+def get_broker() -> Broker:
+    global _broker
+    if _broker is None:
+        _broker = PostgresBroker() if connection.vendor == "postgresql" else Broker()
+    return _broker
+
+
+@receiver(recording_updated)
+def _publish_status(sender, recording, **kwargs):
+    recording_id, status = recording.pk, recording.status
+    transaction.on_commit(lambda: get_broker().publish(recording_id, status))
@@ -0,0 +1,57 @@
+"""
+Resizing images for the web, at collectstatic time. See `staticfiles`.
+"""
+
+import io
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from PIL import Image
+
+FORMATS = {
+    "WEBP": ("image/webp", ".webp", {"quality": 80}),
+    "PNG": ("image/png", ".png", {"optimize": True}),
+    "JPEG": ("image/jpeg", ".jpg", {"quality": 85, "optimize": True}),
+}
+
+
+@dataclass(frozen=True)
+class ResizedImage:
+    width: int
+    height: int
+    type: str
+    extension: str
+    content: bytes
+
+
+def resize(data: bytes, widths: Iterable[int]) -> list[ResizedImage]:
+    """
+    Resize an image to each of the given widths that is smaller than the
+    original, and encode each size as WebP and in the original format (for
+    browsers without WebP support).
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        fallback = "PNG" if image.format == "PNG" else "JPEG"
+        widths = [width for width in widths if width < image.width] or [image.width]
+
+        resized = []
+        for width in widths:
+            height = round(image.height * width / image.width)
+            scaled = image.resize((width, height), Image.Resampling.LANCZOS)
+            resized.extend(_encode(scaled, name) for name in ("WEBP", fallback))
+        return resized
+
+
+def _encode(image: Image.Image, name: str) -> ResizedImage:
+    content_type, extension, options = FORMATS[name]
+    if name == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=name, **options)
+    return ResizedImage(
+        width=image.width,
+        height=image.height,
+        type=content_type,
+        extension=extension,
+        content=buffer.getvalue(),
+    )
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.db.models import Model, Q
+from django.utils import timezone
+
+
+def claim_next(model: type[Model], lease: timedelta) -> int | None:
+    """
+    Lease the next due job from a job table (one with `run_at` and
+    `locked_until` columns), and return its primary key. Return None if no
+    jobs are due.
+
+    Jobs are claimed with a conditional update rather than row locks, so this
+    works the same on every database. A worker that dies mid-job only holds
+    on to it until the lease runs out.
+    """
+    now = timezone.now()
+    unlocked = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    candidates = (
+        model.objects.filter(unlocked, run_at__lte=now)
+        .order_by("run_at", "id")
+        .values_list("pk", flat=True)[:10]
+    )
+    for pk in candidates:
+        # Another worker may have claimed this job since we looked, in which
+        # case the update matches no rows and we try the next one.
+        claimed = model.objects.filter(unlocked, pk=pk).update(locked_until=now + lease)
+        if claimed:
+            return pk
+    return None
+
+
+def backoff(attempts: int) -> int:
+    """
+    Return the number of seconds to wait before retrying a failed job.
+    """
+    return min(2**attempts, 300)
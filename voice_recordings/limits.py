@@ -0,0 +1,84 @@
+"""
+Limits on how many calls the form places to one phone number, and for one
+client, so that nobody can use up our outbound call rate (see `admission`)
+by requesting call after call.
+
+Each limit is a sliding window counter in the default cache (Redis in
+production), rather than a log of every request. It keeps a count for each
+fixed window, and estimates the sliding window's count from the current
+window's, plus the previous window's weighted by how much of it the sliding
+window still covers. That assumes the previous window's requests were spread
+evenly across it, which is close enough to stop abuse, and costs one cache
+read and one write per check.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+@dataclass
+class SlidingWindowLimit:
+    name: str
+    # Requests allowed in any `window`. 0 allows any number.
+    limit: int
+    window: timedelta
+
+    def allow(self, key: str, now: datetime | None = None) -> bool:
+        """
+        Count a request for `key` and return True, unless there have already
+        been `limit` requests in the last `window`. Requests that aren't
+        allowed aren't counted.
+        """
+        if self.limit <= 0:
+            return True
+
+        now = now or timezone.now()
+        seconds = self.window.total_seconds()
+        index, elapsed = divmod(now.timestamp(), seconds)
+        current = self._key(key, int(index))
+        previous = self._key(key, int(index) - 1)
+        counts = cache.get_many([previous, current])
+        # The part of the previous window the sliding window still covers
+        overlap = 1 - elapsed / seconds
+        estimate = counts.get(previous, 0) * overlap + counts.get(current, 0)
+        if estimate >= self.limit:
+            return False
+
+        # Kept until the sliding window no longer covers it
+        if not cache.add(current, 1, timeout=2 * seconds):
+            try:
+                cache.incr(current)
+            except ValueError:
+                # Expired in between
+                cache.set(current, 1, timeout=2 * seconds)
+        return True
+
+    def _key(self, key: str, index: int) -> str:
+        return f"limit:{self.name}:{key}:{index}"
+
+
+def allow_call(phone_number: str, client_ip: str) -> bool:
+    """
+    Count a call to the given (normalized) number, requested by the given
+    client, against the limits. Return False if either is over its limit.
+    """
+    window = timedelta(seconds=settings.CALL_LIMIT_WINDOW)
+    per_ip = SlidingWindowLimit("calls-per-ip", settings.CALL_LIMIT_PER_IP, window)
+    per_number = SlidingWindowLimit(
+        "calls-per-number", settings.CALL_LIMIT_PER_NUMBER, window
+    )
+    # The client first, so that calls it isn't allowed to request aren't held
+    # against the number
+    return per_ip.allow(client_ip) and per_number.allow(phone_number)
+
+
+def client_ip(request) -> str:
+    if settings.USE_X_FORWARDED_FOR and "X-Forwarded-For" in request.headers:
+        # The router appends the address it was connected from. Earlier
+        # entries come from the client, so can't be trusted.
+        return request.headers["X-Forwarded-For"].split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from voice_recordings.archive import archive_recordings
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished recordings from months older than the retention window "
+        "into the archive storage. Run periodically, e.g. daily from a scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.RECORDING_RETENTION_DAYS,
+            help="Archive months that ended more than this many days ago.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Recordings to read, compress and delete at a time.",
+        )
+
+    def handle(self, *args, retention_days, chunk_size=1000, **options):
+        archived = archive_recordings(
+            timedelta(days=retention_days), chunk_size=chunk_size
+        )
+        for name, count in archived.items():
+            self.stdout.write(f"{name}: {count} recordings")
+        if not archived:
+            self.stdout.write("Nothing to archive")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from voice_recordings.encoding import savings, total_savings
+
+
+class Command(BaseCommand):
+    help = (
+        "Report how many bytes re-encoding recordings' audio, and sharing "
+        "blobs between recordings with the same audio, saves over their mp3s."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--summary",
+            action="store_true",
+            help="Only report the totals, not each recording",
+        )
+
+    def handle(self, *args, **options):
+        if not options["summary"]:
+            for pk, source_size, size in savings():
+                stored = f"{size:,} bytes" if size else "shared"
+                self.stdout.write(
+                    f"Recording {pk}: {source_size:,} bytes, {stored} "
+                    f"({_saving(source_size, size)})"
+                )
+
+        source_size, size = total_savings()
+        self.stdout.write(
+            f"Total: {source_size:,} bytes, {size:,} bytes "
+            f"({_saving(source_size, size)})"
+        )
+
+
+def _saving(source_size: int, size: int) -> str:
+    saving = 1 - size / source_size if source_size else 0
+    return f"{source_size - size:,} bytes, {saving:.1%} smaller"
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from voice_recordings.calls import (
+    dispatch_calls_async,
+    dispatch_next_call,
+    get_call_scheduler,
+)
+
+
+class Command(BaseCommand):
+    help = "Place queued outbound calls, throttled to the Twilio rate-limit."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for more calls.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0.5,
+            help="Seconds to wait between checks of an empty queue.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Twilio API requests to keep in flight at once.",
+        )
+
+    def handle(self, *args, once=False, poll_interval=0.5, concurrency=1, **options):
+        scheduler = get_call_scheduler()
+        if concurrency > 1:
+            asyncio.run(
+                dispatch_calls_async(
+                    scheduler, concurrency, once=once, poll_interval=poll_interval
+                )
+            )
+            return
+
+        while True:
+            if dispatch_next_call(scheduler):
+                continue
+            if once:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,71 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from voice_recordings.campaigns import ImportProgress, import_campaign
+from voice_recordings.models import Campaign
+
+
+class Command(BaseCommand):
+    help = "Queue calls to every phone number in a CSV file, as a new campaign."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file, with a header row.")
+        parser.add_argument(
+            "--base-url",
+            required=True,
+            help="The site's root URL, for Twilio's webhooks, e.g. https://example.com/",
+        )
+        parser.add_argument("--name", help="Campaign name. Defaults to the file name.")
+        parser.add_argument(
+            "--column",
+            default="phone_number",
+            help="Name of the column holding phone numbers.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows to validate and queue at a time.",
+        )
+
+    def handle(self, *args, path, base_url, name, column, batch_size, **options):
+        campaign = Campaign.objects.create(name=name or os.path.basename(path))
+        with open(path, "rb") as f:
+            try:
+                state = import_campaign(
+                    campaign,
+                    f,
+                    base_url=base_url,
+                    column=column,
+                    batch_size=batch_size,
+                    total_bytes=os.fstat(f.fileno()).st_size,
+                    progress=self.report,
+                )
+            except ValueError as e:
+                campaign.delete()
+                raise CommandError(str(e)) from e
+
+        self.stdout.write(
+            f"Campaign {campaign.pk}: {campaign.queued} calls queued, "
+            f"{campaign.duplicates} duplicates, {campaign.invalid} invalid numbers"
+        )
+        if state.last_call_at is not None:
+            self.stdout.write(
+                f"Last call due at {state.last_call_at:%Y-%m-%d %H:%M:%S}"
+            )
+
+    def report(self, state: ImportProgress):
+        campaign = state.campaign
+        line = f"{campaign.rows} rows, {campaign.queued} calls queued"
+        if state.total_bytes:
+            line += f", {state.bytes_read / state.total_bytes:.0%}"
+        if state.eta is not None:
+            line += f", ETA {timedelta(seconds=round(state.eta))}"
+        if state.last_call_at is not None:
+            calls_left = max(state.last_call_at - timezone.now(), timedelta(0))
+            calls_left = timedelta(seconds=round(calls_left.total_seconds()))
+            line += f", calls placed in {calls_left}"
+        self.stderr.write(line)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from voice_recordings.processing import run_next_job
+
+
+class Command(BaseCommand):
+    help = "Run post-processing steps for completed recordings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for more recordings.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between checks of an empty queue.",
+        )
+
+    def handle(self, *args, once=False, poll_interval=1.0, **options):
+        while True:
+            if run_next_job():
+                continue
+            if once:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from voice_recordings.webhooks import process_webhook_events
+
+
+class Command(BaseCommand):
+    help = "Apply Twilio status callbacks from the webhook inbox to recordings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the inbox is empty instead of waiting for more events.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0.2,
+            help="Seconds to wait between checks of an empty inbox.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, once=False, poll_interval=0.2, batch_size=500, **options):
+        while True:
+            if process_webhook_events(batch_size=batch_size):
+                continue
+            if once:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from voice_recordings.reaper import reap_stale_recordings
+
+
+class Command(BaseCommand):
+    help = (
+        "Complete or fail recordings that have been in progress for too long, "
+        "according to Twilio. Run periodically, e.g. from a scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=120,
+            help="Minutes a recording must have been in progress to be reconciled.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Recordings to reconcile per batch of Twilio requests.",
+        )
+
+    def handle(self, *args, older_than=120, batch_size=100, **options):
+        counts = reap_stale_recordings(
+            timedelta(minutes=older_than), batch_size=batch_size
+        )
+        self.stdout.write(
+            f"{counts['complete']} completed, {counts['failed']} failed, "
+            f"{counts['unresolved']} still in progress"
+        )
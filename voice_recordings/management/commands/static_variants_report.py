@@ -0,0 +1,26 @@
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the size of each optimized static file variant built by "
+        "collectstatic, and how many bytes it saves over the original."
+    )
+
+    def handle(self, *args, **options):
+        variants = getattr(staticfiles_storage, "variants", None)
+        if not variants:
+            raise CommandError("No static file variants found. Run collectstatic.")
+
+        for name, name_variants in sorted(variants.items()):
+            original = staticfiles_storage.size(staticfiles_storage.stored_name(name))
+            self.stdout.write(f"{name}: {original:,} bytes")
+            for variant, info in sorted(
+                name_variants.items(), key=lambda v: v[1]["bytes"]
+            ):
+                saving = 1 - info["bytes"] / original
+                self.stdout.write(
+                    f"  {variant}: {info['bytes']:,} bytes "
+                    f"({original - info['bytes']:,} bytes, {saving:.1%} smaller)"
+                )
@@ -0,0 +1,171 @@
+"""
+Our own copies of recordings, so that playback doesn't go through Twilio.
+
+Once a recording completes, the `process_recordings` worker downloads it into
+the "recordings" storage (see `fetch_media`). `views.recording_audio` then
+serves it from there, with support for range requests so that browsers can
+seek without downloading the whole file.
+"""
+
+import re
+from collections.abc import Iterator
+
+import requests
+from django.core.files import File
+from django.core.files.storage import Storage, storages
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from . import metrics
+from .models import Recording
+from .twilio_accounts import get_account
+
+CHUNK_SIZE = 64 * 1024
+
+# Seconds to wait for Twilio to connect, or to send the next chunk
+FETCH_TIMEOUT = 30
+
+# A single range. Requests for several ranges at once are served the whole
+# file, which the spec allows, and browsers don't make them for audio anyway.
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def get_storage() -> Storage:
+    return storages["recordings"]
+
+
+def fetch_media(recording: Recording) -> None:
+    """
+    Download the given completed recording from Twilio into storage.
+    """
+    if recording.media_name or recording.audio_blob_id:
+        return
+
+    account = get_account(recording.twilio_account_sid)
+    storage = get_storage()
+    name = storage.get_available_name(f"{recording.twilio_recording_sid}.mp3")
+    url = recording.twilio_recording_url
+    with (
+        metrics.time_twilio_request("GET", url),
+        requests.get(
+            url,
+            auth=(account.sid, account.auth_token),
+            stream=True,
+            timeout=FETCH_TIMEOUT,
+        ) as response,
+    ):
+        response.raise_for_status()
+        # Copy the body into storage a chunk at a time, rather than reading
+        # the whole recording into memory.
+        response.raw.decode_content = True
+        try:
+            name = storage.save(name, File(response.raw, name=name))
+        except Exception:
+            # Don't leave a partial download behind
+            storage.delete(name)
+            raise
+
+    recording.media_name = name
+    recording.save(update_fields=["media_name", "updated_at"])
+
+
+def serve(request, name: str, content_type: str = "audio/mpeg") -> HttpResponse:
+    """
+    Serve the named file from storage, honouring conditional and range
+    requests.
+    """
+    storage = get_storage()
+    size = storage.size(name)
+    # Stored recordings never change, so the name and size identify them.
+    etag = quote_etag(f"{name}-{size}")
+
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    byte_range = None
+    if "Range" in request.headers and request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = parse_range(request.headers["Range"], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    file = storage.open(name, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        first, last = byte_range
+        file.seek(first)
+        if last == size - 1:
+            # Runs to the end of the file, so FileResponse can serve it from
+            # the current position, with sendfile under servers that support
+            # it. This covers the `Range: bytes=N-` requests that browsers
+            # make when seeking.
+            response = FileResponse(file, status=206, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                _read(file, last - first + 1), status=206, content_type=content_type
+            )
+            response["Content-Length"] = last - first + 1
+        response["Content-Range"] = f"bytes {first}-{last}/{size}"
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, max_age=3600)
+    return response
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Return the first and last byte positions asked for by a Range header, or
+    None if the header should be ignored and the whole file served. Raises
+    ValueError if the range can't be satisfied.
+    """
+    match = RANGE_PATTERN.fullmatch(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+
+    if not first:
+        if not last:
+            return None
+        # The last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError(header)
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def _read(file, length: int) -> Iterator[bytes]:
+    with file:
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+@receiver(post_delete, sender=Recording)
+def _delete_media(sender, instance, **kwargs):
+    names = [name for name in [instance.media_name, instance.peaks_name] if name]
+
+    def delete():
+        for name in names:
+            get_storage().delete(name)
+
+    if names:
+        transaction.on_commit(delete)
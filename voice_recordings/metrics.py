@@ -0,0 +1,393 @@
+"""
+Request and Twilio API timings, for finding out where slow responses spend
+their time.
+
+`MetricsMiddleware` times every request, and counts the database queries it
+makes and the time they take. Twilio API requests are timed by
+`twilio_accounts.TimedHttpClient` (and media downloads by `media`). Each
+request's timings are sent back in a `Server-Timing` header, so they show up
+in the browser's developer tools, and added to histograms kept in memory.
+
+Recording a timing only takes a lock and a few additions. Every
+`METRICS_FLUSH_INTERVAL` seconds, the next timing recorded also saves this
+process' histograms to Django's default cache, under a key of its own. The
+`prometheus_metrics` view merges every process' histograms, so scraping any
+one gunicorn worker (or dyno) covers all of them, and the workers' Twilio
+requests too.
+"""
+
+import bisect
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.db.models import Min
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CallJob, Recording
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of histogram buckets
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    "storyworth_request_duration_seconds": (
+        "Time taken to respond to requests, by view.",
+        SECONDS_BUCKETS,
+    ),
+    "storyworth_request_db_queries": (
+        "Database queries made per request, by view.",
+        QUERIES_BUCKETS,
+    ),
+    "storyworth_request_db_duration_seconds": (
+        "Time spent in database queries per request, by view.",
+        SECONDS_BUCKETS,
+    ),
+    "storyworth_twilio_request_duration_seconds": (
+        "Time taken by Twilio API requests, by endpoint.",
+        SECONDS_BUCKETS,
+    ),
+}
+COUNTERS = {
+    "storyworth_requests_total": "Requests, by view and response status.",
+    "storyworth_twilio_errors_total": (
+        "Twilio API requests that failed, by endpoint and response status."
+    ),
+}
+
+# Processes' histograms are kept this long after they were last saved, so
+# that those of processes that have exited eventually drop out.
+PROCESS_TTL = 24 * 60 * 60
+PROCESSES_KEY = "metrics:processes"
+
+SID_PATTERN = re.compile(r"\b[A-Z]{2}[0-9a-f]{32}\b")
+
+
+@dataclass
+class RequestTimings:
+    """
+    Timings of the request being handled, for the `Server-Timing` header.
+    """
+
+    start: float
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    twilio_requests: int = 0
+    twilio_seconds: float = 0.0
+
+
+# Set while a request is being handled. Context variables are copied into
+# the threads that async views run sync code (e.g. queries) in.
+current_request: ContextVar[RequestTimings | None] = ContextVar(
+    "current_request", default=None
+)
+
+_lock = threading.Lock()
+# Histograms, by (name, labels): the count in each bucket (not cumulative),
+# then the +Inf bucket, then the sum of the observed values
+_histograms = {}
+_counters = Counter()
+_saved_at = time.monotonic()
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    buckets = HISTOGRAMS[name][1]
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(buckets, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        histogram[index] += 1
+        histogram[-1] += value
+
+
+def increment(name: str, **labels: str) -> None:
+    with _lock:
+        _counters[(name, tuple(sorted(labels.items())))] += 1
+
+
+def reset() -> None:
+    """
+    Forget this process' timings.
+    """
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "histograms": {key: list(value) for key, value in _histograms.items()},
+            "counters": dict(_counters),
+        }
+
+
+def save_if_due() -> None:
+    global _saved_at
+    now = time.monotonic()
+    if now - _saved_at < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _saved_at = now
+    try:
+        save()
+    except Exception:
+        # Losing metrics mustn't take requests or workers down with them
+        logger.exception("Couldn't save metrics")
+
+
+def save() -> None:
+    """
+    Save this process' timings to the cache, for `collect`.
+    """
+    key = f"metrics:{socket.gethostname()}:{os.getpid()}"
+    cache.set(key, snapshot(), PROCESS_TTL)
+    processes = cache.get(PROCESSES_KEY, set())
+    if key not in processes:
+        # Two processes registering at once can lose one of the keys, but
+        # that process adds itself back the next time it saves.
+        cache.set(PROCESSES_KEY, processes | {key}, None)
+
+
+def collect() -> dict:
+    """
+    Merge the timings saved by every process, including this one.
+    """
+    save()
+    processes = cache.get(PROCESSES_KEY, set())
+    snapshots = cache.get_many(processes)
+    if len(snapshots) < len(processes):
+        # Forget processes whose timings have expired
+        cache.set(PROCESSES_KEY, set(snapshots), None)
+
+    histograms = {}
+    counters = Counter()
+    for process in snapshots.values():
+        for key, values in process["histograms"].items():
+            if key in histograms:
+                # Not strict, as processes from before a deploy may have had
+                # other buckets, until their timings expire
+                histograms[key] = [
+                    a + b for a, b in zip(histograms[key], values, strict=False)
+                ]
+            else:
+                histograms[key] = values
+        counters.update(process["counters"])
+    return {"histograms": histograms, "counters": counters}
+
+
+def gauges() -> dict[str, tuple[str, float]]:
+    """
+    The current state of calls, as read from the database, by metric name:
+    the metric's help text and value.
+    """
+    now = timezone.now()
+    # Calls scheduled for later (e.g. by campaigns) aren't late yet
+    oldest = CallJob.objects.filter(run_at__lte=now).aggregate(Min("run_at"))
+    oldest = oldest["run_at__min"]
+    return {
+        "storyworth_recordings_in_progress": (
+            "Recordings whose calls are queued or haven't ended.",
+            # Counted from recording_in_progress_idx
+            Recording.objects.filter(status=Recording.Status.IN_PROGRESS).count(),
+        ),
+        "storyworth_calls_queued": (
+            "Calls waiting to be placed, including those scheduled for later.",
+            CallJob.objects.count(),
+        ),
+        "storyworth_oldest_pending_call_age_seconds": (
+            "How long the longest-waiting call that's due has been waiting.",
+            (now - oldest).total_seconds() if oldest else 0,
+        ),
+    }
+
+
+def render(metrics: dict, gauges: dict[str, tuple[str, float]]) -> str:
+    """
+    Format merged timings and gauges in Prometheus' text exposition format.
+    """
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (metric, labels), values in sorted(metrics["histograms"].items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            # Stops short of the last value, which is the sum
+            for bound, count in zip([*buckets, "+Inf"], values, strict=False):
+                cumulative += count
+                le = bound if bound == "+Inf" else float(bound)
+                lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    for name, help_text in COUNTERS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (metric, labels), count in sorted(metrics["counters"].items()):
+            if metric == name:
+                lines.append(f"{name}{_labels(labels)} {count}")
+    for name, (help_text, value) in gauges.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple, **extra) -> str:
+    labels = [*labels, *extra.items()]
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = current_request.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_queries += 1
+        timings.db_seconds += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """
+    Time every query made on the connection, for the request making it.
+    """
+    # Wrappers outlive the underlying connection, which may be reopened
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def twilio_endpoint(url: str) -> str:
+    """
+    The path of a Twilio API URL with its SIDs replaced, so that requests to
+    the same endpoint share a histogram.
+    """
+    return SID_PATTERN.sub("{sid}", urlsplit(url).path)
+
+
+@contextmanager
+def time_twilio_request(method: str, url: str) -> Iterator[None]:
+    """
+    Time the Twilio API request made in the body of the `with` block. The
+    block should raise for error responses (or set the status with
+    `record_twilio_status`).
+    """
+    labels = {"method": method.upper(), "endpoint": twilio_endpoint(url)}
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        increment(
+            "storyworth_twilio_errors_total",
+            **labels,
+            status=str(status or "error"),
+        )
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe("storyworth_twilio_request_duration_seconds", seconds, **labels)
+        timings = current_request.get()
+        if timings is not None:
+            timings.twilio_requests += 1
+            timings.twilio_seconds += seconds
+        save_if_due()
+
+
+def record_twilio_status(method: str, url: str, status: int) -> None:
+    if status >= 400:
+        increment(
+            "storyworth_twilio_errors_total",
+            method=method.upper(),
+            endpoint=twilio_endpoint(url),
+            status=str(status),
+        )
+
+
+class MetricsMiddleware:
+    """
+    Time requests, and their database queries and Twilio API requests. Only
+    the time to the start of streamed responses is counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = RequestTimings(start=time.perf_counter())
+        token = current_request.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.finish(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings(start=time.perf_counter())
+        token = current_request.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.finish(request, response, timings)
+        return response
+
+    def finish(self, request, response, timings: RequestTimings) -> None:
+        seconds = time.perf_counter() - timings.start
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+
+        observe("storyworth_request_duration_seconds", seconds, view=view)
+        observe("storyworth_request_db_queries", timings.db_queries, view=view)
+        observe("storyworth_request_db_duration_seconds", timings.db_seconds, view=view)
+        increment(
+            "storyworth_requests_total", view=view, status=str(response.status_code)
+        )
+        save_if_due()
+
+        entries = [
+            f"app;dur={seconds * 1000:.1f}",
+            (
+                f"db;dur={timings.db_seconds * 1000:.1f}"
+                f';desc="{timings.db_queries} queries"'
+            ),
+        ]
+        if timings.twilio_requests:
+            entries.append(
+                f"twilio;dur={timings.twilio_seconds * 1000:.1f};"
+                f'desc="{timings.twilio_requests} requests"'
+            )
+        response["Server-Timing"] = ", ".join(entries)
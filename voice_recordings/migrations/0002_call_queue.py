@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0001_initial'),
+    )
+
+    operations = (
+        migrations.CreateModel(
+            name='RateLimit',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CallJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('webhook_url', models.URLField(max_length=500)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('recording', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='call_job', to='voice_recordings.recording')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run_at', 'id'], name='voice_recor_run_at_661520_idx')],
+            },
+        ),
+    )
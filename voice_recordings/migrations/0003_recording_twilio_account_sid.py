@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0002_call_queue'),
+    )
+
+    operations = (
+        migrations.AddField(
+            model_name='recording',
+            name='twilio_account_sid',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    )
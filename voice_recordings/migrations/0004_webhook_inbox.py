@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0003_recording_twilio_account_sid'),
+    )
+
+    operations = (
+        migrations.AddField(
+            model_name='calljob',
+            name='status_callback_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('kind', models.CharField(choices=[('CALL', 'Call'), ('RECORDING', 'Recording')], max_length=20)),
+                ('sid', models.CharField(blank=True, max_length=100)),
+                ('status', models.CharField(blank=True, max_length=100)),
+                ('params', models.JSONField()),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('recording', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='voice_recordings.recording')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='webhookevent_unprocessed_idx')],
+            },
+        ),
+    )
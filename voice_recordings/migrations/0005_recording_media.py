@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0004_webhook_inbox'),
+    )
+
+    operations = (
+        migrations.AddField(
+            model_name='recording',
+            name='media_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(choices=[('FETCH_MEDIA', 'Fetch Media')], max_length=50)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('recording', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='processing_jobs', to='voice_recordings.recording')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run_at', 'id'], name='voice_recor_run_at_e51c59_idx')],
+                'constraints': [models.UniqueConstraint(fields=('recording', 'step'), name='processingjob_unique_step')],
+            },
+        ),
+    )
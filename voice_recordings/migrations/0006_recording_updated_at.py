@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0005_recording_media'),
+    )
+
+    operations = (
+        migrations.AddField(
+            model_name='recording',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    )
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+STATUSES = {"IN_PROGRESS": 0, "COMPLETE": 1, "FAILED": 2}
+
+
+def status_to_smallint(apps, schema_editor):
+    Recording = apps.get_model("voice_recordings", "Recording")
+    for name, value in STATUSES.items():
+        Recording.objects.filter(status=name).update(status_code=value)
+
+
+def status_to_text(apps, schema_editor):
+    Recording = apps.get_model("voice_recordings", "Recording")
+    for name, value in STATUSES.items():
+        Recording.objects.filter(status_code=value).update(status=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0006_recording_updated_at'),
+    )
+
+    operations = (
+        # Text can't be cast to an integer in place, so convert through a new
+        # column.
+        migrations.AddField(
+            model_name='recording',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(status_to_smallint, status_to_text),
+        migrations.RemoveField(
+            model_name='recording',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='recording',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.AlterField(
+            model_name='recording',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'In Progress'), (1, 'Complete'), (2, 'Failed')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(condition=models.Q(('status', 0)), fields=['created_at'], name='recording_in_progress_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recording',
+            constraint=models.UniqueConstraint(condition=models.Q(('twilio_call_sid', ''), _negated=True), fields=('twilio_call_sid',), name='recording_unique_call_sid'),
+        ),
+        migrations.AddConstraint(
+            model_name='recording',
+            constraint=models.UniqueConstraint(condition=models.Q(('twilio_recording_sid', ''), _negated=True), fields=('twilio_recording_sid',), name='recording_unique_recording_sid'),
+        ),
+    )
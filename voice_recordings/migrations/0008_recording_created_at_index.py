@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0007_recording_sid_indexes_status_smallint'),
+    )
+
+    operations = (
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['created_at'], name='recording_created_at_idx'),
+        ),
+    )
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0009_campaigns'),
+    )
+
+    operations = (
+        migrations.CreateModel(
+            name='CallBacklog',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('clears_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CallbackSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(unique=True)),
+                ('booked', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='calljob',
+            name='callback_slot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='voice_recordings.callbackslot'),
+        ),
+    )
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0010_call_admission'),
+    )
+
+    operations = (
+        migrations.AddField(
+            model_name='recording',
+            name='duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='loudness',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='peaks_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='processingjob',
+            name='step',
+            field=models.CharField(choices=[('FETCH_MEDIA', 'Fetch Media'), ('ANALYZE_AUDIO', 'Analyze Audio')], max_length=50),
+        ),
+    )
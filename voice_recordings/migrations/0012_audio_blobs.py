@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0011_waveforms'),
+    )
+
+    operations = (
+        migrations.CreateModel(
+            name='AudioBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('source_size', models.PositiveBigIntegerField()),
+                ('size', models.PositiveBigIntegerField()),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='processingjob',
+            name='step',
+            field=models.CharField(choices=[('FETCH_MEDIA', 'Fetch Media'), ('ANALYZE_AUDIO', 'Analyze Audio'), ('ENCODE_AUDIO', 'Encode Audio')], max_length=50),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='audio_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='recordings', to='voice_recordings.audioblob'),
+        ),
+    )
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0012_audio_blobs'),
+    )
+
+    operations = (
+        migrations.AddField(
+            model_name='recording',
+            name='transcript',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='processingjob',
+            name='step',
+            field=models.CharField(choices=[('FETCH_MEDIA', 'Fetch Media'), ('ANALYZE_AUDIO', 'Analyze Audio'), ('ENCODE_AUDIO', 'Encode Audio'), ('TRANSCRIBE', 'Transcribe')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='TranscriptChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('start', models.FloatField()),
+                ('end', models.FloatField()),
+                ('text', models.TextField(blank=True)),
+                ('recording', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transcript_chunks', to='voice_recordings.recording')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('recording', 'index'), name='transcriptchunk_unique_index')],
+            },
+        ),
+    )
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0013_transcripts'),
+    )
+
+    operations = (
+        migrations.AddField(
+            model_name='recording',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='normalized_phone_number',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(condition=models.Q(('status', 0)), fields=['normalized_phone_number', 'created_at'], name='recording_progress_phone_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recording',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key', ''), _negated=True), fields=('idempotency_key',), name='recording_unique_idempotency_key'),
+        ),
+    )
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0014_call_dedupe'),
+    )
+
+    operations = (
+        migrations.RemoveIndex(
+            model_name='recording',
+            name='recording_progress_phone_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['normalized_phone_number', 'created_at'], name='recording_phone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['status', 'id'], name='recording_status_idx'),
+        ),
+    )
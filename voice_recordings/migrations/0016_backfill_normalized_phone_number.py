@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:55
+
+import re
+
+from django.db import migrations
+
+# As in calls._normalize_phone_number when this was written
+PHONE_NUMBER_PATTERN = "[0-9]{3}-?[0-9]{3}-?[0-9]{4}"
+E164_PATTERN = r"\+1[0-9]{10}"
+
+BATCH_SIZE = 1000
+
+
+def normalize(tel):
+    tel = tel.strip()
+    if re.fullmatch(E164_PATTERN, tel):
+        return tel
+    if re.fullmatch(PHONE_NUMBER_PATTERN, tel):
+        return "+1" + tel.replace("-", "")
+    # Invalid numbers stay blank
+    return ""
+
+
+def backfill_normalized_phone_numbers(apps, schema_editor):
+    Recording = apps.get_model("voice_recordings", "Recording")
+    # Keyset pagination by id, each batch committed on its own, so that the
+    # table isn't locked for the whole backfill
+    last_id = 0
+    while True:
+        recordings = list(
+            Recording.objects.filter(id__gt=last_id, normalized_phone_number="")
+            .order_by("id")
+            .only("id", "phone_number")[:BATCH_SIZE]
+        )
+        if not recordings:
+            return
+        for recording in recordings:
+            recording.normalized_phone_number = normalize(recording.phone_number)
+        Recording.objects.bulk_update(
+            [r for r in recordings if r.normalized_phone_number],
+            ["normalized_phone_number"],
+        )
+        last_id = recordings[-1].id
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = (
+        ('voice_recordings', '0015_recording_admin_indexes'),
+    )
+
+    operations = (
+        migrations.RunPython(
+            backfill_normalized_phone_numbers, migrations.RunPython.noop
+        ),
+    )
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = (
+        ('voice_recordings', '0016_backfill_normalized_phone_number'),
+    )
+
+    operations = (
+        migrations.AddField(
+            model_name='recording',
+            name='placed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    )
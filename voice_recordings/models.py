@@ -1,28 +1,391 @@
-from typing import Optional
-
 from django.conf import settings
 from django.db import models
+from django.urls import reverse
+from django.utils import timezone
 
 
 class Recording(models.Model):
-    class Status(models.TextChoices):
-        IN_PROGRESS = "IN_PROGRESS"
-        COMPLETE = "COMPLETE"
-        FAILED = "FAILED"
+    # Stored as a small integer. Use `status_name` wherever the status leaves
+    # the app (pages, status responses, events).
+    class Status(models.IntegerChoices):
+        IN_PROGRESS = 0
+        COMPLETE = 1
+        FAILED = 2
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Saves that pass update_fields must include this
+    updated_at = models.DateTimeField(auto_now=True)
     phone_number = models.CharField(max_length=100)
+    # `phone_number` in E.164, for finding calls to a number however it was
+    # typed. Blank for invalid numbers, which the form accepted before it
+    # validated them.
+    normalized_phone_number = models.CharField(blank=True, max_length=20)
+    # Sent with the form, so that submitting it again finds the recording the
+    # first submission created. See `views.form`.
+    idempotency_key = models.CharField(blank=True, max_length=64)
+    # The Twilio account the call was placed from. Blank for calls placed
+    # before we had more than one account.
+    twilio_account_sid = models.CharField(blank=True, max_length=100)
     twilio_call_sid = models.CharField(blank=True, max_length=100)
+    # When the call was placed, which for calls queued in bulk may be long
+    # after the recording was created. Blank for calls placed before we
+    # stored it.
+    placed_at = models.DateTimeField(blank=True, null=True)
     twilio_recording_sid = models.CharField(blank=True, max_length=100)
-    status = models.CharField(
+    status = models.PositiveSmallIntegerField(
         choices=Status,
         default=Status.IN_PROGRESS,
-        max_length=100,
     )
+    # Name of our copy of the recording in the "recordings" storage, once the
+    # `process_recordings` worker has fetched it from Twilio. See `media`.
+    media_name = models.CharField(blank=True, max_length=255)
+    # Waveform peaks for the recording page, in the same storage, and the
+    # recording's length (in seconds) and loudness (mean square, in dBFS).
+    # Set once the media has been analyzed. See `waveforms`.
+    peaks_name = models.CharField(blank=True, max_length=255)
+    duration = models.FloatField(blank=True, null=True)
+    loudness = models.FloatField(blank=True, null=True)
+    # The recording's audio, re-encoded for storage. Replaces `media_name`
+    # once set. See `encoding`.
+    audio_blob = models.ForeignKey(
+        "AudioBlob",
+        blank=True,
+        null=True,
+        on_delete=models.PROTECT,
+        related_name="recordings",
+    )
+    # What was said, as a list of {"start": seconds, "end": seconds, "text"}
+    # in order, once the whole recording has been transcribed. Until then,
+    # the chunks transcribed so far are `transcript_chunks`. See
+    # `transcription`.
+    transcript = models.JSONField(blank=True, null=True)
+    # Set for calls imported in bulk, rather than requested through the form
+    campaign = models.ForeignKey(
+        "Campaign",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="recordings",
+        # Covered by recording_campaign_phone_idx
+        db_index=False,
+    )
+
+    class Meta:
+        constraints = (
+            # Blank until the call is placed, or the recording completes
+            models.UniqueConstraint(
+                fields=["twilio_call_sid"],
+                condition=~models.Q(twilio_call_sid=""),
+                name="recording_unique_call_sid",
+            ),
+            models.UniqueConstraint(
+                fields=["twilio_recording_sid"],
+                condition=~models.Q(twilio_recording_sid=""),
+                name="recording_unique_recording_sid",
+            ),
+            models.UniqueConstraint(
+                fields=["idempotency_key"],
+                condition=~models.Q(idempotency_key=""),
+                name="recording_unique_idempotency_key",
+            ),
+        )
+        indexes = (
+            # Finding calls that have been in progress for too long. (Status
+            # isn't in scope here, 0 is IN_PROGRESS.)
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status=0),
+                name="recording_in_progress_idx",
+            ),
+            # Finding calls in progress to the same number, when the form is
+            # submitted again (see `views.form`), and searching for a number
+            # in the admin
+            models.Index(
+                fields=["normalized_phone_number", "created_at"],
+                name="recording_phone_idx",
+            ),
+            # Filtering by status in the admin, newest first
+            models.Index(fields=["status", "id"], name="recording_status_idx"),
+            # Archiving a month at a time. See `archive`.
+            models.Index(fields=["created_at"], name="recording_created_at_idx"),
+            # Skipping numbers already in a campaign. See `campaigns`.
+            models.Index(
+                fields=["campaign", "phone_number"],
+                name="recording_campaign_phone_idx",
+            ),
+        )
+
+    @property
+    def status_name(self) -> str:
+        return self.Status(self.status).name
+
+    @property
+    def duration_display(self) -> str:
+        """
+        The recording's length as "m:ss", or blank until it's known.
+        """
+        if self.duration is None:
+            return ""
+        return minutes_seconds(self.duration)
 
     @property
-    def twilio_recording_url(self) -> Optional[str]:
+    def transcript_lines(self) -> list[tuple[str, str]]:
+        """
+        When each part of the transcript starts ("m:ss"), and its text. Falls
+        back to the chunks transcribed so far while transcription is running.
+        """
+        if self.transcript is not None:
+            segments = self.transcript
+        else:
+            segments = self.transcript_chunks.order_by("index").values("start", "text")
+        return [
+            (minutes_seconds(segment["start"]), segment["text"])
+            for segment in segments
+            if segment["text"]
+        ]
+
+    @property
+    def twilio_recording_url(self) -> str | None:
         if self.status != self.Status.COMPLETE:
             return None
 
-        return f"https://api.twilio.com/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Recordings/{self.twilio_recording_sid}.mp3"
+        account_sid = self.twilio_account_sid or settings.TWILIO_ACCOUNT_SID
+        return (
+            f"{settings.TWILIO_API_BASE_URL}/2010-04-01/Accounts/{account_sid}"
+            f"/Recordings/{self.twilio_recording_sid}.mp3"
+        )
+
+    @property
+    def audio_url(self) -> str | None:
+        """
+        URL to play the recording back from: our own copy once we have it,
+        Twilio's until then.
+        """
+        if self.audio_name:
+            return reverse("recording_audio", args=[self.pk])
+        return self.twilio_recording_url
+
+    @property
+    def audio_name(self) -> str:
+        """
+        Name of our copy of the recording's audio in the "recordings"
+        storage, or blank until it has been fetched.
+        """
+        if self.audio_blob_id:
+            return AudioBlob.storage_name(self.audio_blob_id)
+        return self.media_name
+
+    @property
+    def audio_content_type(self) -> str:
+        return AudioBlob.CONTENT_TYPE if self.audio_blob_id else "audio/mpeg"
+
+
+class AudioBlob(models.Model):
+    """
+    Recorded audio, encoded compactly, in the "recordings" storage. Named
+    after the SHA-256 of the audio it was encoded from, so recordings with
+    the same audio share a blob. See `encoding`.
+    """
+
+    CONTENT_TYPE = "audio/ogg"
+
+    sha256 = models.CharField(primary_key=True, max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bytes, of the audio it was encoded from, and of the blob
+    source_size = models.PositiveBigIntegerField()
+    size = models.PositiveBigIntegerField()
+    # Recordings that refer to it, archived ones included, which the foreign
+    # key can't tell us about. Deleted along with the last of them.
+    references = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def storage_name(sha256: str) -> str:
+        return f"audio/{sha256[:2]}/{sha256}.opus"
+
+    @property
+    def name(self) -> str:
+        return self.storage_name(self.sha256)
+
+
+class CallJob(models.Model):
+    """
+    An outbound call waiting to be placed by the `dispatch_calls` worker.
+
+    Jobs are claimed by setting `locked_until`, so a worker that dies
+    mid-call only holds on to its job until the lease runs out. Once the call
+    has been placed (or has failed for good) the job is deleted, which keeps
+    this table as small as the backlog.
+    """
+
+    recording = models.OneToOneField(
+        Recording,
+        on_delete=models.CASCADE,
+        related_name="call_job",
+    )
+    webhook_url = models.URLField(max_length=500)
+    status_callback_url = models.URLField(blank=True, max_length=500)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    # Set for calls booked for later, when we were too busy to call straight
+    # away. See `admission`.
+    callback_slot = models.ForeignKey(
+        "CallbackSlot",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="jobs",
+    )
+
+    class Meta:
+        indexes = (models.Index(fields=["run_at", "id"]),)
+
+
+class CallBacklog(models.Model):
+    """
+    When the calls requested through the form so far will all have been
+    placed, at our total outbound rate. Maintained by `admission`, so that
+    estimating how long a new call will wait takes a single row lookup.
+    """
+
+    name = models.CharField(max_length=100, primary_key=True)
+    clears_at = models.DateTimeField()
+
+
+class CallbackSlot(models.Model):
+    """
+    A window of time that storytellers can book a call in, when we're too busy
+    to call them straight away. See `admission`.
+    """
+
+    start = models.DateTimeField(unique=True)
+    booked = models.PositiveIntegerField(default=0)
+
+
+class RateLimit(models.Model):
+    """
+    Token bucket state, shared by every process that talks to the database.
+    See `calls.TokenBucket`.
+    """
+
+    name = models.CharField(max_length=100, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+
+class WebhookEvent(models.Model):
+    """
+    A status callback from Twilio. Webhook handlers only append these, and
+    leave it to the `process_webhooks` worker to apply them to recordings in
+    batches. See `webhooks.process_webhook_events`.
+    """
+
+    class Kind(models.TextChoices):
+        CALL = "CALL"
+        RECORDING = "RECORDING"
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    recording = models.ForeignKey(Recording, on_delete=models.CASCADE)
+    kind = models.CharField(choices=Kind, max_length=20)
+    # The CallSid or RecordingSid, depending on the kind of event
+    sid = models.CharField(blank=True, max_length=100)
+    # Twilio's CallStatus or RecordingStatus
+    status = models.CharField(blank=True, max_length=100)
+    params = models.JSONField()
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="webhookevent_unprocessed_idx",
+            ),
+        )
+
+
+class ProcessingJob(models.Model):
+    """
+    A post-processing step for a completed recording, run by the
+    `process_recordings` worker. Claimed and retried like `CallJob`, and
+    deleted once the step has succeeded. See `processing`.
+    """
+
+    class Step(models.TextChoices):
+        FETCH_MEDIA = "FETCH_MEDIA"
+        ANALYZE_AUDIO = "ANALYZE_AUDIO"
+        ENCODE_AUDIO = "ENCODE_AUDIO"
+        TRANSCRIBE = "TRANSCRIBE"
+
+    recording = models.ForeignKey(
+        Recording,
+        on_delete=models.CASCADE,
+        related_name="processing_jobs",
+    )
+    step = models.CharField(choices=Step, max_length=50)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=["recording", "step"], name="processingjob_unique_step"
+            ),
+        )
+        indexes = (models.Index(fields=["run_at", "id"]),)
+
+
+class TranscriptChunk(models.Model):
+    """
+    The transcript of a stretch of a recording, saved as soon as it has been
+    transcribed. Once every chunk is done, they are stitched together into
+    `Recording.transcript` and deleted. See `transcription`.
+    """
+
+    recording = models.ForeignKey(
+        Recording,
+        on_delete=models.CASCADE,
+        related_name="transcript_chunks",
+    )
+    index = models.PositiveIntegerField()
+    # Seconds from the start of the recording
+    start = models.FloatField()
+    end = models.FloatField()
+    text = models.TextField(blank=True)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=["recording", "index"], name="transcriptchunk_unique_index"
+            ),
+        )
+
+
+class Campaign(models.Model):
+    """
+    A batch of calls to a list of phone numbers, imported from a CSV by the
+    `import_campaign` command or the admin. See `campaigns`.
+    """
+
+    name = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Import progress, updated after each batch
+    rows = models.PositiveIntegerField(default=0)
+    queued = models.PositiveIntegerField(default=0)
+    duplicates = models.PositiveIntegerField(default=0)
+    invalid = models.PositiveIntegerField(default=0)
+    imported_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return self.name
+
+
+def minutes_seconds(seconds: float) -> str:
+    """
+    Format a number of seconds as "m:ss".
+    """
+    minutes, seconds = divmod(round(seconds), 60)
+    return f"{minutes}:{seconds:02}"
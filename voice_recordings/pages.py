@@ -0,0 +1,113 @@
+"""
+Full-page response cache for the landing form and finished recording pages.
+
+1. The landing form is the same for every visitor apart from its CSRF token.
+   Each process renders it once with a placeholder token, and splices each
+   visitor's token into the cached bytes.
+2. A finished (complete or failed) recording's page only changes when the
+   recording is written, e.g. once its audio has been fetched. These pages
+   are kept in Django's cache until then (or until the signed links in them
+   are due to expire), and carry an ETag and
+   Last-Modified so that browsers can revalidate them with conditional
+   requests.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .cache import LRUCache
+from .models import Recording
+from .signals import recording_updated
+
+# CSRF tokens are alphanumeric, so this can't be mistaken for one.
+CSRF_PLACEHOLDER = "__csrf_token__"
+
+# Rendered pages split around the CSRF placeholder, by template and static
+# files manifest.
+csrf_pages = LRUCache(maxsize=32)
+
+
+def render_with_csrf_token(request, template_name: str, context: dict) -> HttpResponse:
+    """
+    Like `render`, for templates whose output only varies by CSRF token.
+    `context` must be the same on every call.
+    """
+    key = (template_name, _manifest_hash())
+    page = csrf_pages.get(key)
+    if page is None:
+        content = render_to_string(
+            template_name, {**context, "csrf_token": CSRF_PLACEHOLDER}
+        )
+        page = content.encode().split(CSRF_PLACEHOLDER.encode())
+        csrf_pages.set(key, page)
+
+    return HttpResponse(get_token(request).encode().join(page))
+
+
+def render_finished_recording(
+    request, recording: Recording, template_name: str, context: dict
+) -> HttpResponse:
+    """
+    Like `render`, for the page of a recording that is no longer in progress.
+    The page is served from the cache until the recording is next written.
+    """
+    key = _key(recording.pk)
+    # Pages rendered from a version of the recording that was overwritten
+    # while we rendered them never match, even if they're cached after the
+    # write evicted the old page.
+    version = (recording.updated_at.isoformat(), _manifest_hash())
+    page = cache.get(key)
+    if page is None or page["version"] != version:
+        content = render_to_string(template_name, context, request).encode()
+        page = {
+            "version": version,
+            "content": content,
+            "etag": quote_etag(hashlib.md5(content, usedforsecurity=False).hexdigest()),
+            "last_modified": int(recording.updated_at.timestamp()),
+        }
+        # The page links to the recording by token (see `tokens`), so it can
+        # only be cached while those links are valid.
+        cache.set(key, page, timeout=settings.RECORDING_TOKEN_MAX_AGE // 2)
+
+    response = HttpResponse(page["content"])
+    response["ETag"] = page["etag"]
+    response["Last-Modified"] = http_date(page["last_modified"])
+    # Revalidate every time, since the page changes when the recording does
+    patch_cache_control(response, no_cache=True)
+    return get_conditional_response(
+        request,
+        etag=page["etag"],
+        last_modified=page["last_modified"],
+        response=response,
+    )
+
+
+def _manifest_hash() -> str:
+    # Changes when static files are collected, e.g. on deploy
+    return getattr(staticfiles_storage, "manifest_hash", "")
+
+
+def _key(recording_id: int) -> str:
+    return f"recording_page:v1:{recording_id}"
+
+
+@receiver(recording_updated)
+def _evict_page(sender, recording, **kwargs):
+    recording_id = recording.pk
+    transaction.on_commit(lambda: cache.delete(_key(recording_id)))
+
+
+@receiver(setting_changed)
+def _clear_csrf_pages(**kwargs):
+    csrf_pages.clear()
@@ -0,0 +1,100 @@
+"""
+Post-processing for completed recordings, run by the `process_recordings`
+worker.
+
+Each step is a `ProcessingJob`, queued when the recording completes and
+leased like a `CallJob`. Steps that need another step's output are queued
+once that step has succeeded.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import encoding, media, transcription, waveforms
+from .leases import backoff, claim_next
+from .models import ProcessingJob, Recording
+
+logger = logging.getLogger(__name__)
+
+# How long a worker has to finish a step before another worker may retry it
+JOB_LEASE = timedelta(minutes=5)
+
+STEPS = {
+    ProcessingJob.Step.FETCH_MEDIA: media.fetch_media,
+    ProcessingJob.Step.ANALYZE_AUDIO: waveforms.analyze_audio,
+    ProcessingJob.Step.ENCODE_AUDIO: encoding.encode_audio,
+    ProcessingJob.Step.TRANSCRIBE: transcription.transcribe_audio,
+}
+
+# Steps to queue as soon as a recording completes
+FIRST_STEPS = [ProcessingJob.Step.FETCH_MEDIA]
+
+# Steps to queue once the given step has succeeded
+NEXT_STEPS = {
+    ProcessingJob.Step.FETCH_MEDIA: [ProcessingJob.Step.ANALYZE_AUDIO],
+    # Encoding deletes the mp3 that analysis reads
+    ProcessingJob.Step.ANALYZE_AUDIO: [ProcessingJob.Step.ENCODE_AUDIO],
+    ProcessingJob.Step.ENCODE_AUDIO: [ProcessingJob.Step.TRANSCRIBE],
+    ProcessingJob.Step.TRANSCRIBE: [],
+}
+
+
+def enqueue_processing(recording: Recording) -> None:
+    """
+    Queue post-processing for a recording that has just completed. Call this
+    in the same transaction that marks the recording complete.
+    """
+    _enqueue(recording, FIRST_STEPS)
+
+
+def run_next_job() -> bool:
+    """
+    Run the next due step. Return False if there was nothing to do.
+    """
+    pk = claim_next(ProcessingJob, JOB_LEASE)
+    if pk is None:
+        return False
+    run_job(ProcessingJob.objects.select_related("recording").get(pk=pk))
+    return True
+
+
+def run_job(job: ProcessingJob) -> None:
+    try:
+        STEPS[job.step](job.recording)
+    except Exception as e:
+        job.attempts += 1
+        if job.attempts >= settings.RECORDING_PROCESSING_MAX_ATTEMPTS:
+            # The recording can still be played from Twilio, so just give up
+            logger.exception(
+                "Giving up on %s for recording %s", job.step, job.recording_id
+            )
+            job.delete()
+            return
+
+        logger.warning(
+            "%s failed for recording %s, retrying: %s",
+            job.step,
+            job.recording_id,
+            e,
+        )
+        job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+        job.locked_until = None
+        job.last_error = str(e)
+        job.save(update_fields=["attempts", "run_at", "locked_until", "last_error"])
+        return
+
+    with transaction.atomic():
+        _enqueue(job.recording, NEXT_STEPS[job.step])
+        job.delete()
+
+
+def _enqueue(recording: Recording, steps: list[ProcessingJob.Step]) -> None:
+    ProcessingJob.objects.bulk_create(
+        [ProcessingJob(recording=recording, step=step) for step in steps],
+        # Already queued, e.g. by a duplicate status callback
+        ignore_conflicts=True,
+    )
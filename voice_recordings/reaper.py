@@ -0,0 +1,283 @@
+"""
+Reconciling recordings that are stuck in progress, e.g. because Twilio's
+status callback never reached us.
+
+`reap_stale_recordings` walks stale IN_PROGRESS recordings in batches, in
+order of creation (using the partial index on in progress recordings). Each
+batch is split into windows of recordings whose calls were placed within
+`LIST_SPAN` of each other. For each window it lists the calls and recordings
+Twilio has for that stretch of time, a page at a time, rather than fetching
+each call. Windows with fewer than `MIN_LISTED` recordings fetch their calls
+one by one instead, as listing a stretch of time costs as much however few of
+its calls we're after. So are calls a listing didn't find, e.g. ones placed
+long after their recording was created. Either way, what we ask Twilio for
+grows with the number of stale recordings, not with all the calls made while
+they were. It then
+completes or fails the recordings Twilio has an answer for, and leaves the
+rest alone.
+
+Each batch is committed on its own, and reconciled recordings drop out of
+the IN_PROGRESS index, so an interrupted run picks up where it left off the
+next time it's run. Recordings are locked and re-checked before they're
+updated, so running alongside the `process_webhooks` worker (or another
+reaper) is safe: whichever gets to a recording first wins.
+"""
+
+import logging
+from collections import Counter, defaultdict
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+from twilio.base.exceptions import TwilioRestException
+
+from .models import Recording
+from .processing import enqueue_processing
+from .signals import recording_updated
+from .twilio_accounts import get_account
+from .webhooks import FAILED_CALL_STATUSES, FAILED_RECORDING_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# How long after a call is placed Twilio might still be working on it:
+# Twilio's 4 hour call limit, and time for it to start. For calls placed
+# before we stored when, it's counted from when the recording was created, so
+# it also covers time spent in our dispatch queue. Calls that start later
+# than that aren't listed, and are fetched one by one instead.
+CALL_WINDOW = timedelta(hours=6)
+
+# Calls that haven't finished yet
+ACTIVE_CALL_STATUSES = {"queued", "ringing", "in-progress"}
+
+# Twilio's maximum page size
+PAGE_SIZE = 1000
+
+# Recordings whose calls were placed within this long of the first in a
+# window are reconciled together, by listing calls over the window
+LIST_SPAN = timedelta(hours=1)
+# Windows with fewer recordings than this fetch each call instead
+MIN_LISTED = 5
+
+
+def reap_stale_recordings(older_than: timedelta, batch_size: int = 100) -> Counter:
+    """
+    Reconcile recordings that have been in progress for longer than
+    `older_than` with Twilio. Return the number of recordings completed,
+    failed, and left in progress.
+    """
+    counts = Counter()
+    cutoff = timezone.now() - older_than
+    for batch in _stale_batches(cutoff, batch_size):
+        outcomes = {}
+        for account_sid, recordings in _by_account(batch).items():
+            outcomes.update(_reconcile(account_sid, recordings))
+        counts += _apply(outcomes)
+        counts["unresolved"] += len(batch) - len(outcomes)
+    # Drop zero counts
+    return +counts
+
+
+def _stale_batches(cutoff, batch_size: int) -> Iterator[list[Recording]]:
+    """
+    Yield stale recordings in batches, paginated by (created_at, id) so that
+    recordings we can't resolve don't come round again.
+    """
+    stale = (
+        Recording.objects.filter(
+            status=Recording.Status.IN_PROGRESS, created_at__lt=cutoff
+        )
+        # Still waiting for the `dispatch_calls` worker to place the call
+        .exclude(call_job__isnull=False)
+        .order_by("created_at", "id")
+    )
+    after = Q()
+    while True:
+        batch = list(stale.filter(after)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+        after = Q(created_at__gt=last.created_at) | Q(
+            created_at=last.created_at, id__gt=last.id
+        )
+
+
+def _by_account(recordings: list[Recording]) -> dict[str, list[Recording]]:
+    by_account = defaultdict(list)
+    for recording in recordings:
+        by_account[recording.twilio_account_sid].append(recording)
+    return by_account
+
+
+def _reconcile(
+    account_sid: str, recordings: list[Recording]
+) -> dict[int, tuple[Recording.Status, str]]:
+    """
+    Return the new status (and RecordingSid) of each of the given recordings
+    that Twilio has an answer for.
+    """
+    outcomes = {}
+    placed = []
+    for recording in recordings:
+        if recording.twilio_call_sid:
+            placed.append(recording)
+        else:
+            # Never placed, and no longer queued
+            outcomes[recording.pk] = (Recording.Status.FAILED, "")
+    if not placed:
+        return outcomes
+
+    client = get_account(account_sid).client()
+    for window in _windows(placed):
+        if len(window) < MIN_LISTED:
+            found = _fetch(client, window)
+        else:
+            found = _list(client, window)
+            # Calls placed long after their recording was created (e.g. late
+            # in a big campaign) start outside the stretch of time listed
+            found.update(
+                _fetch(client, [r for r in window if r.twilio_call_sid not in found])
+            )
+        for recording in window:
+            call_status, twilio_recording = found.get(
+                recording.twilio_call_sid, (None, None)
+            )
+            if call_status is None:
+                logger.warning(
+                    "Call %s for recording %s not found in Twilio",
+                    recording.twilio_call_sid,
+                    recording.pk,
+                )
+            outcome = _outcome(call_status, twilio_recording)
+            if outcome is not None:
+                outcomes[recording.pk] = outcome
+    return outcomes
+
+
+def _placed_at(recording: Recording) -> datetime:
+    # For calls placed before we stored when, assume it was soon after the
+    # recording was created. Any that weren't are fetched one by one.
+    return recording.placed_at or recording.created_at
+
+
+def _windows(recordings: list[Recording]) -> list[list[Recording]]:
+    """
+    Split recordings into runs whose calls were placed within `LIST_SPAN` of
+    the first of each.
+    """
+    windows = []
+    for recording in sorted(recordings, key=_placed_at):
+        if windows and _placed_at(recording) - _placed_at(windows[-1][0]) <= LIST_SPAN:
+            windows[-1].append(recording)
+        else:
+            windows.append([recording])
+    return windows
+
+
+def _list(client, recordings: list[Recording]) -> dict[str, tuple]:
+    """
+    The status and Twilio recording of every call made around when the given
+    recordings were created, by call SID.
+    """
+    start = _placed_at(recordings[0]) - timedelta(minutes=1)
+    end = min(timezone.now(), _placed_at(recordings[-1]) + CALL_WINDOW)
+    calls = {
+        call.sid: call.status
+        for call in client.calls.stream(
+            start_time_after=start, start_time_before=end, page_size=PAGE_SIZE
+        )
+    }
+    twilio_recordings = {}
+    if any(calls.get(r.twilio_call_sid) == "completed" for r in recordings):
+        twilio_recordings = {
+            twilio_recording.call_sid: twilio_recording
+            for twilio_recording in client.recordings.stream(
+                date_created_after=start, date_created_before=end, page_size=PAGE_SIZE
+            )
+        }
+    return {sid: (status, twilio_recordings.get(sid)) for sid, status in calls.items()}
+
+
+def _fetch(client, recordings: list[Recording]) -> dict[str, tuple]:
+    """
+    The status and Twilio recording of each of the given recordings' calls,
+    by call SID, fetched one at a time.
+    """
+    found = {}
+    for recording in recordings:
+        sid = recording.twilio_call_sid
+        try:
+            call = client.calls(sid).fetch()
+        except TwilioRestException as e:
+            if e.status == 404:
+                continue
+            raise
+        twilio_recording = None
+        if call.status == "completed":
+            twilio_recording = next(
+                iter(client.recordings.list(call_sid=sid, limit=1)), None
+            )
+        found[sid] = (call.status, twilio_recording)
+    return found
+
+
+def _outcome(
+    call_status: str | None, twilio_recording
+) -> tuple[Recording.Status, str] | None:
+    if call_status is None:
+        # Not in the stretch of time we listed, so we can't tell
+        return None
+    if call_status in FAILED_CALL_STATUSES:
+        return Recording.Status.FAILED, ""
+    if call_status in ACTIVE_CALL_STATUSES:
+        return None
+
+    # The call completed. Did it leave a recording?
+    if twilio_recording is None:
+        return Recording.Status.FAILED, ""
+    if twilio_recording.status == "completed":
+        return Recording.Status.COMPLETE, twilio_recording.sid
+    if twilio_recording.status in FAILED_RECORDING_STATUSES:
+        return Recording.Status.FAILED, ""
+    # Still processing
+    return None
+
+
+def _apply(outcomes: dict[int, tuple[Recording.Status, str]]) -> Counter:
+    counts = Counter()
+    if not outcomes:
+        return counts
+
+    with transaction.atomic():
+        # Lock the recordings, and skip any that a webhook has resolved since
+        # we read them.
+        recordings = list(
+            Recording.objects.select_for_update().filter(
+                pk__in=outcomes, status=Recording.Status.IN_PROGRESS
+            )
+        )
+        if not recordings:
+            return counts
+
+        now = timezone.now()
+        Recording.objects.filter(pk__in=[r.pk for r in recordings]).update(
+            status=Case(
+                *(When(pk=r.pk, then=Value(outcomes[r.pk][0])) for r in recordings)
+            ),
+            twilio_recording_sid=Case(
+                *(When(pk=r.pk, then=Value(outcomes[r.pk][1])) for r in recordings)
+            ),
+            updated_at=now,
+        )
+
+        # update() bypasses save(), so tell everyone else ourselves
+        for recording in recordings:
+            recording.status, recording.twilio_recording_sid = outcomes[recording.pk]
+            recording.updated_at = now
+            recording_updated.send(sender=Recording, recording=recording)
+            if recording.status == Recording.Status.COMPLETE:
+                enqueue_processing(recording)
+            counts[recording.Status(recording.status).name.lower()] += 1
+    return counts
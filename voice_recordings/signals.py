@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save
+from django.dispatch import Signal, receiver
+
+from .models import Recording
+
+# Sent with a `recording` argument whenever a Recording is written. Saves send
+# it automatically; code that updates recordings in bulk, bypassing save(),
+# must send it itself.
+recording_updated = Signal()
+
+
+@receiver(post_save, sender=Recording)
+def _send_recording_updated(sender, instance, **kwargs):
+    recording_updated.send(sender=Recording, recording=instance)
@@ -0,0 +1,121 @@
+"""
+Static files storage that also builds optimized variants of some files.
+
+When static files are collected, each source file may get variants built
+next to it, which are hashed and compressed like any other static file:
+
+- AIFF/AIFC audio gets phone quality versions (see `telephony`), since Twilio
+  downloads the audio we ask it to play at the start of every call.
+- PNG/JPEG images get resized WebP and PNG/JPEG versions (see `images`), for
+  the `responsive_image` template tag to choose from.
+
+The variants and their sizes are stored in the manifest, so that pages can
+pick between them without touching the disk, and so that the
+`static_variants_report` command can report the savings.
+"""
+
+import json
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from . import images, telephony
+
+AUDIO_EXTENSIONS = (".aif", ".aiff", ".aifc")
+
+# Extension of each telephony variant, and how to encode it
+TELEPHONY_VARIANTS = {
+    ".8k.wav": telephony.ulaw_wav,
+    ".8k.aifc": telephony.ulaw_aifc,
+}
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Widths to resize images to, in pixels. Our images are displayed at most 128
+# CSS pixels wide, so this covers screens up to 3x pixel density.
+IMAGE_WIDTHS = (128, 256, 384)
+
+
+class OptimizedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    def load_manifest(self):
+        hashed_files, manifest_hash = super().load_manifest()
+        content = self.read_manifest()
+        self.variants = json.loads(content).get("variants", {}) if content else {}
+        if settings.DEBUG:
+            # Static files are served from the apps' directories in debug
+            # mode, where the variants don't exist.
+            self.variants = {}
+        return hashed_files, manifest_hash
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            self.variants = {}
+            paths = {**paths, **self._build_variants(paths)}
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def save_manifest(self):
+        super().save_manifest()
+        manifest = json.loads(self.read_manifest())
+        manifest["variants"] = self.variants
+        self.manifest_storage.delete(self.manifest_name)
+        self.manifest_storage._save(
+            self.manifest_name, ContentFile(json.dumps(manifest).encode())
+        )
+
+    def smallest_variant(self, name: str) -> str:
+        """
+        Return the name of the smallest variant of the given static file, or
+        the name itself if it has no variants.
+        """
+        variants = self.variants.get(name)
+        if not variants:
+            return name
+        return min(variants, key=lambda variant: variants[variant]["bytes"])
+
+    def _build_variants(self, paths: dict) -> dict:
+        built = {}
+        for path, (storage, source_path) in paths.items():
+            if path.endswith(AUDIO_EXTENSIONS):
+                build = _audio_variants
+            elif path.endswith(IMAGE_EXTENSIONS):
+                build = _image_variants
+            else:
+                continue
+
+            with storage.open(source_path) as f:
+                variants = build(path, f.read())
+
+            self.variants[path] = {}
+            for variant, (content, info) in variants.items():
+                # Saved unhashed, like collectstatic does with source files,
+                # for post-processing to hash.
+                if self.exists(variant):
+                    self.delete(variant)
+                self._save(variant, ContentFile(content))
+                built[variant] = (self, variant)
+                self.variants[path][variant] = {"bytes": len(content), **info}
+        return built
+
+
+def _audio_variants(path: str, data: bytes) -> dict[str, tuple[bytes, dict]]:
+    samples, rate = telephony.read_aiff(data)
+    samples = telephony.resample(samples, rate, telephony.TELEPHONY_RATE)
+    root, _ = posixpath.splitext(path)
+    return {
+        root + extension: (encode(samples), {})
+        for extension, encode in TELEPHONY_VARIANTS.items()
+    }
+
+
+def _image_variants(path: str, data: bytes) -> dict[str, tuple[bytes, dict]]:
+    root, _ = posixpath.splitext(path)
+    variants = {}
+    for image in images.resize(data, IMAGE_WIDTHS):
+        name = f"{root}.{image.width}w{image.extension}"
+        variants[name] = (
+            image.content,
+            {"width": image.width, "height": image.height, "type": image.type},
+        )
+    return variants
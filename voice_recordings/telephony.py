@@ -0,0 +1,190 @@
+"""
+Transcoding audio for playback over the phone.
+
+Phone calls carry 8 kHz, 8-bit mu-law audio, so anything we ask Twilio to
+<Play> at a higher quality is just more bytes for Twilio to download and
+transcode before the caller hears anything. These functions convert AIFF/AIFC
+files (as exported by most audio editors) into 8 kHz mu-law WAV and AIFC,
+which Twilio can play as is.
+
+Pure Python, since the standard library's `aifc` and `audioop` modules are
+gone. That's fast enough for a few seconds of greeting at collectstatic time.
+"""
+
+import math
+import struct
+import sys
+from array import array
+from functools import lru_cache
+
+TELEPHONY_RATE = 8000
+
+# Width of the resampling filter, in zero crossings either side of each sample
+ZERO_CROSSINGS = 16
+
+
+def read_aiff(data: bytes) -> tuple[list[float], int]:
+    """
+    Decode an uncompressed AIFF or AIFC file into mono samples between -1 and
+    1, and the sample rate.
+    """
+    form, _, form_type = struct.unpack(">4sI4s", data[:12])
+    if form != b"FORM" or form_type not in (b"AIFF", b"AIFC"):
+        raise ValueError("Not an AIFF file")
+
+    comm = ssnd = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack(">4sI", data[offset : offset + 8])
+        body = data[offset + 8 : offset + 8 + size]
+        if chunk_id == b"COMM":
+            comm = body
+        elif chunk_id == b"SSND":
+            (data_offset,) = struct.unpack(">I", body[:4])
+            ssnd = body[8 + data_offset :]
+        # Chunks are padded to an even length
+        offset += 8 + size + (size & 1)
+    if comm is None or ssnd is None:
+        raise ValueError("AIFF file is missing COMM or SSND chunk")
+
+    channels, frames, sample_size = struct.unpack(">hIh", comm[:8])
+    rate = _unpack_extended(comm[8:18])
+    compression = comm[18:22] if form_type == b"AIFC" else b"NONE"
+
+    if compression in (b"NONE", b"twos", b"sowt") and sample_size in (8, 16, 32):
+        typecode = {8: "b", 16: "h", 32: "i"}[sample_size]
+        scale = 2 ** (sample_size - 1)
+        little_endian = compression == b"sowt"
+    elif compression in (b"fl32", b"FL32"):
+        typecode, scale, little_endian = "f", 1, False
+    elif compression in (b"fl64", b"FL64"):
+        typecode, scale, little_endian = "d", 1, False
+    else:
+        raise ValueError(f"Unsupported AIFF encoding: {compression!r} {sample_size}")
+
+    samples = array(typecode)
+    samples.frombytes(ssnd[: frames * channels * samples.itemsize])
+    if samples.itemsize > 1 and little_endian != (sys.byteorder == "little"):
+        samples.byteswap()
+
+    # Mix down to mono
+    mono = [
+        sum(samples[i : i + channels]) / (channels * scale)
+        for i in range(0, len(samples), channels)
+    ]
+    return mono, rate
+
+
+def resample(samples: list[float], rate: int, new_rate: int) -> list[float]:
+    """
+    Resample with a windowed-sinc filter, which also filters out frequencies
+    above the new rate's Nyquist frequency.
+    """
+    if rate == new_rate:
+        return list(samples)
+
+    step = rate / new_rate
+    # Low-pass at whichever Nyquist frequency is lower, relative to the input
+    cutoff = min(1.0, 1 / step)
+    half_width = ZERO_CROSSINGS / cutoff
+
+    resampled = []
+    for i in range(int(len(samples) / step)):
+        center = i * step
+        first = max(0, math.ceil(center - half_width))
+        # Round the phase, so that e.g. integer ratios only need one kernel
+        weights = _kernel(round(center - first, 6), cutoff, half_width)
+        window = samples[first : first + len(weights)]
+        resampled.append(sum(map(float.__mul__, weights, window)))
+    return resampled
+
+
+@lru_cache(maxsize=1024)
+def _kernel(offset: float, cutoff: float, half_width: float) -> tuple[float, ...]:
+    weights = []
+    x = -offset
+    while x <= half_width:
+        # Hann-windowed sinc
+        window = 0.5 + 0.5 * math.cos(math.pi * x / half_width)
+        sinc = math.sin(math.pi * cutoff * x) / (math.pi * x) if x else cutoff
+        weights.append(sinc * window)
+        x += 1
+    # Unity gain, however the kernel lines up with the input
+    total = sum(weights)
+    return tuple(w / total for w in weights)
+
+
+def encode_ulaw(samples: list[float]) -> bytes:
+    """
+    Encode samples between -1 and 1 as G.711 mu-law.
+    """
+    return bytes(_ulaw(round(max(-1.0, min(1.0, s)) * 32767)) for s in samples)
+
+
+def _ulaw(sample: int) -> int:
+    # https://www.itu.int/rec/T-REC-G.711
+    sign = 0x80 if sample < 0 else 0
+    magnitude = min(abs(sample), 32635) + 0x84
+    exponent = magnitude.bit_length() - 8
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return ~(sign | (exponent << 4) | mantissa) & 0xFF
+
+
+def ulaw_wav(samples: list[float], rate: int = TELEPHONY_RATE) -> bytes:
+    """
+    Encode mono samples as a mu-law WAV file.
+    """
+    data = encode_ulaw(samples)
+    # WAVE_FORMAT_MULAW, mono, 1 byte per sample, no extra format bytes
+    fmt = struct.pack("<HHIIHHH", 7, 1, rate, rate, 1, 8, 0)
+    # Non-PCM formats need a fact chunk with the number of samples
+    fact = struct.pack("<I", len(samples))
+    chunks = (
+        _chunk(b"fmt ", fmt, "<")
+        + _chunk(b"fact", fact, "<")
+        + _chunk(b"data", data, "<")
+    )
+    return struct.pack("<4sI4s", b"RIFF", 4 + len(chunks), b"WAVE") + chunks
+
+
+def ulaw_aifc(samples: list[float], rate: int = TELEPHONY_RATE) -> bytes:
+    """
+    Encode mono samples as a mu-law AIFC file.
+    """
+    data = encode_ulaw(samples)
+    name = b"\x08\xb5law 2:1"  # Pascal string, "µLaw 2:1" in Mac Roman
+    comm = (
+        struct.pack(">hIh", 1, len(samples), 16)
+        + _pack_extended(rate)
+        + b"ulaw"
+        + name
+        + b"\x00" * (len(name) & 1)
+    )
+    chunks = (
+        _chunk(b"FVER", struct.pack(">I", 0xA2805140), ">")
+        + _chunk(b"COMM", comm, ">")
+        + _chunk(b"SSND", struct.pack(">II", 0, 0) + data, ">")
+    )
+    return struct.pack(">4sI4s", b"FORM", 4 + len(chunks), b"AIFC") + chunks
+
+
+def _chunk(chunk_id: bytes, body: bytes, byte_order: str) -> bytes:
+    padding = b"\x00" * (len(body) & 1)
+    return struct.pack(f"{byte_order}4sI", chunk_id, len(body)) + body + padding
+
+
+def _unpack_extended(data: bytes) -> int:
+    # 80-bit IEEE 754 extended precision, with an explicit integer bit
+    exponent, mantissa = struct.unpack(">HQ", data)
+    sign = -1 if exponent & 0x8000 else 1
+    exponent &= 0x7FFF
+    if exponent == mantissa == 0:
+        return 0
+    return round(sign * mantissa * 2.0 ** (exponent - 16383 - 63))
+
+
+def _pack_extended(value: int) -> bytes:
+    if value == 0:
+        return bytes(10)
+    mantissa, exponent = math.frexp(value)
+    return struct.pack(">HQ", exponent + 16382, int(mantissa * 2**64))
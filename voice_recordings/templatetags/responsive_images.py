@@ -0,0 +1,48 @@
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(name: str, sizes: str, **attrs) -> str:
+    """
+    Render the given static image as a <picture>, offering the browser the
+    resized variants built by collectstatic (see `staticfiles`). `sizes` is
+    the width the image is displayed at, e.g. "8rem". Other keyword arguments
+    become attributes of the <img>, e.g. `class`.
+
+    Falls back to a plain <img> for images without variants, e.g. when static
+    files haven't been collected in development.
+    """
+    variants = getattr(staticfiles_storage, "variants", {}).get(name)
+    if not variants:
+        return format_html('<img src="{}"{} />', static(name), flatatt(attrs))
+
+    webp, fallback = [], []
+    for variant, info in sorted(variants.items(), key=lambda v: v[1]["width"]):
+        sources = webp if info["type"] == "image/webp" else fallback
+        sources.append((static(variant), info))
+
+    # Dimensions of the smallest variant, so the browser can reserve space
+    # for the image before it loads.
+    smallest_url, smallest = fallback[0]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}" />'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}"{} /></picture>',
+        _srcset(webp),
+        sizes,
+        smallest_url,
+        _srcset(fallback),
+        sizes,
+        smallest["width"],
+        smallest["height"],
+        flatatt(attrs),
+    )
+
+
+def _srcset(sources: list[tuple[str, dict]]) -> str:
+    return ", ".join(f"{url} {info['width']}w" for url, info in sources)
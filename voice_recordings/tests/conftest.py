@@ -1,12 +1,19 @@
-import os
+import base64
+import json
+import threading
+import uuid
+from datetime import UTC, datetime
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
 
 import pytest
+from django.core.cache import cache
 from django.core.management import call_command
 from django.test import override_settings
 
-# Needed for Playwright test to run locally.
-# TODO: Figure out why we need this and if we can remove it.
-os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
+from voice_recordings import archive, metrics, twilio_accounts
+from voice_recordings.cache import local_statuses, stats
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -18,3 +25,212 @@ def staticfiles(tmp_path_factory):
     with override_settings(STATIC_ROOT=static_root):
         call_command("collectstatic", "--noinput")
         yield
+
+
+@pytest.fixture(scope="session", autouse=True)
+def locmem_cache():
+    """
+    Use an in-memory cache instead of the development cache.
+    """
+    with override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    ):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def recordings_storage(settings, tmp_path):
+    """
+    Store recordings in a temporary directory.
+    """
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "recordings": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": tmp_path / "recordings"},
+        },
+    }
+    return tmp_path / "recordings"
+
+
+@pytest.fixture(autouse=True)
+def archive_storage(settings, tmp_path):
+    """
+    Archive recordings to a temporary directory.
+    """
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "archive": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": tmp_path / "archive"},
+        },
+    }
+    return tmp_path / "archive"
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """
+    Recording ids are reused between tests, so don't let cached recordings
+    leak from one test to the next.
+    """
+    yield
+    cache.clear()
+    local_statuses.clear()
+    stats.clear()
+    archive.indexes.clear()
+    metrics.reset()
+    twilio_accounts.reset_clients()
+
+
+class FakeTwilio:
+    """
+    State of the fake Twilio API served by the `twilio_api` fixture. Add
+    media files by path, and calls and recordings as dicts of their fields,
+    with `start_time` and `date_created` as datetimes. Set `status` to make
+    requests fail.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.calls = []
+        self.recordings = []
+        self.status = 200
+        # Paths of the requests made, for checking that we page through
+        # lists rather than fetching one call at a time.
+        self.requests = []
+        # Parameters of the calls placed
+        self.placed = []
+        # Connections made, for checking that clients reuse them
+        self.connections = 0
+
+
+@pytest.fixture
+def twilio_api(settings):
+    """
+    Serve a local fake of the bits of Twilio's REST API that we use, and
+    point Twilio clients and media downloads at it.
+    """
+    fake = FakeTwilio()
+    authorizations = {
+        "Basic "
+        + base64.b64encode(f"{a['sid']}:{a['auth_token']}".encode()).decode(): a["sid"]
+        for a in settings.TWILIO_ACCOUNTS
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            fake.connections += 1
+            super().setup()
+
+        def do_POST(self):
+            fake.requests.append(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            params = dict(parse_qsl(self.rfile.read(length).decode()))
+            account_sid = authorizations.get(self.headers["Authorization"])
+            if account_sid is None:
+                self.send_error(401)
+            elif fake.status != 200:
+                self.send_error(fake.status)
+            elif self.path == f"/2010-04-01/Accounts/{account_sid}/Calls.json":
+                call = {"sid": "CA" + uuid.uuid4().hex, "account_sid": account_sid}
+                fake.placed.append({**call, **params})
+                self._send(
+                    json.dumps({**call, "status": "queued"}).encode(),
+                    "application/json",
+                    status=201,
+                )
+            else:
+                self.send_error(404)
+
+        def do_GET(self):
+            fake.requests.append(self.path)
+            url = urlsplit(self.path)
+            account_sid = authorizations.get(self.headers["Authorization"])
+            if account_sid is None:
+                self.send_error(401)
+            elif fake.status != 200:
+                self.send_error(fake.status)
+            elif url.path in fake.files:
+                self._send(fake.files[url.path], "audio/mpeg")
+            elif url.path == f"/2010-04-01/Accounts/{account_sid}/Calls.json":
+                self._send_page(url, "calls", fake.calls, "start_time", "StartTime")
+            elif url.path.startswith(f"/2010-04-01/Accounts/{account_sid}/Calls/"):
+                sid = url.path.rsplit("/", 1)[1].removesuffix(".json")
+                call = next((c for c in fake.calls if c["sid"] == sid), None)
+                if call is None:
+                    self.send_error(404)
+                else:
+                    body = {
+                        **call,
+                        "start_time": format_datetime(call["start_time"], usegmt=True),
+                    }
+                    self._send(json.dumps(body).encode(), "application/json")
+            elif url.path == f"/2010-04-01/Accounts/{account_sid}/Recordings.json":
+                self._send_page(
+                    url, "recordings", fake.recordings, "date_created", "DateCreated"
+                )
+            else:
+                self.send_error(404)
+
+        def _send_page(self, url, key, resources, date_field, date_param):
+            params = dict(parse_qsl(url.query))
+            matches = [
+                resource
+                for resource in resources
+                if _in_range(
+                    resource[date_field],
+                    params.get(f"{date_param}>"),
+                    params.get(f"{date_param}<"),
+                )
+                # Recordings can also be filtered by call
+                and params.get("CallSid") in (None, resource.get("call_sid"))
+            ]
+            page_size = int(params.get("PageSize", 50))
+            page = int(params.get("Page", 0))
+            items = matches[page * page_size : (page + 1) * page_size]
+            next_page_uri = None
+            if (page + 1) * page_size < len(matches):
+                next_page_uri = url.path + "?" + urlencode({**params, "Page": page + 1})
+            body = {
+                key: [
+                    {
+                        **item,
+                        date_field: format_datetime(item[date_field], usegmt=True),
+                    }
+                    for item in items
+                ],
+                "page": page,
+                "page_size": page_size,
+                "next_page_uri": next_page_uri,
+            }
+            self._send(json.dumps(body).encode(), "application/json")
+
+        def _send(self, content, content_type, status=200):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.TWILIO_API_BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+def _in_range(value, after, before) -> bool:
+    def parse(param):
+        return datetime.strptime(param, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=UTC)
+
+    return (after is None or value >= parse(after)) and (
+        before is None or value <= parse(before)
+    )
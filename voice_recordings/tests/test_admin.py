@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from voice_recordings.admin import RecordingAdmin
+from voice_recordings.models import CallJob, Recording
+
+URL = reverse("admin:voice_recordings_recording_changelist")
+
+
+def ids(response) -> list[int]:
+    return [recording.pk for recording in response.context["cl"].result_list]
+
+
+@pytest.mark.django_db
+def test_recordings_are_paged_by_id(admin_client, monkeypatch):
+    monkeypatch.setattr(RecordingAdmin, "list_per_page", 2)
+    recordings = [
+        Recording.objects.create(phone_number=f"555-000-000{i}") for i in range(5)
+    ]
+    newest_first = [recording.pk for recording in reversed(recordings)]
+
+    response = admin_client.get(URL)
+    assert ids(response) == newest_first[:2]
+    content = response.content.decode()
+    assert "About 5 recordings" in content
+    assert f"?cursor={newest_first[1]}" in content
+
+    response = admin_client.get(URL, {"cursor": newest_first[3]})
+    assert ids(response) == newest_first[4:]
+    assert "Older" not in response.content.decode()
+
+    assert admin_client.get(URL, {"cursor": "x"}).status_code == 302
+
+    change_url = reverse(
+        "admin:voice_recordings_recording_change", args=[recordings[0].pk]
+    )
+    assert "555-000-0000" in admin_client.get(change_url).content.decode()
+
+
+@pytest.mark.django_db
+def test_recordings_can_be_filtered_and_searched(admin_client):
+    old = Recording.objects.create(
+        phone_number="555-123-4567",
+        normalized_phone_number="+15551234567",
+        status=Recording.Status.FAILED,
+    )
+    Recording.objects.filter(pk=old.pk).update(
+        created_at=timezone.now() - timedelta(days=10)
+    )
+    new = Recording.objects.create(
+        phone_number="555-765-4321",
+        normalized_phone_number="+15557654321",
+        twilio_call_sid="CA123",
+        twilio_recording_sid="RE123",
+        status=Recording.Status.COMPLETE,
+    )
+
+    assert ids(admin_client.get(URL, {"status__exact": 2})) == [old.pk]
+    assert ids(admin_client.get(URL, {"created": "7"})) == [new.pk]
+    assert ids(admin_client.get(URL, {"created": "31"})) == [new.pk, old.pk]
+    assert ids(admin_client.get(URL, {"created": "31", "status__exact": 1})) == [new.pk]
+
+    # Exact matches only, however the number is typed
+    assert ids(admin_client.get(URL, {"q": "5551234567"})) == [old.pk]
+    assert ids(admin_client.get(URL, {"q": "+15557654321"})) == [new.pk]
+    assert ids(admin_client.get(URL, {"q": "CA123"})) == [new.pk]
+    assert ids(admin_client.get(URL, {"q": "RE123"})) == [new.pk]
+    assert ids(admin_client.get(URL, {"q": "555"})) == []
+
+
+@pytest.mark.django_db
+def test_calls_can_be_marked_failed(admin_client, monkeypatch):
+    monkeypatch.setattr("voice_recordings.admin.ACTION_BATCH_SIZE", 2)
+    queued, placing, placed, complete = [
+        Recording.objects.create(phone_number="555-123-4567") for _ in range(4)
+    ]
+    CallJob.objects.create(recording=queued, webhook_url="https://example.com/")
+    CallJob.objects.create(
+        recording=placing,
+        webhook_url="https://example.com/",
+        locked_until=timezone.now() + timedelta(minutes=1),
+    )
+    Recording.objects.filter(pk=complete.pk).update(status=Recording.Status.COMPLETE)
+
+    response = admin_client.post(
+        URL,
+        {
+            "action": "mark_failed",
+            # Selecting every recording, across pages
+            "_selected_action": [queued.pk],
+            "select_across": "1",
+            "index": "0",
+        },
+        follow=True,
+    )
+    assert "2 calls marked as failed." in response.content.decode()
+    statuses = dict(Recording.objects.values_list("pk", "status"))
+    assert statuses == {
+        queued.pk: Recording.Status.FAILED,
+        placing.pk: Recording.Status.IN_PROGRESS,
+        placed.pk: Recording.Status.FAILED,
+        complete.pk: Recording.Status.COMPLETE,
+    }
+    assert list(CallJob.objects.values_list("recording", flat=True)) == [placing.pk]
+
+
+@pytest.mark.django_db
+def test_failed_calls_can_be_retried(admin_client):
+    failed = Recording.objects.create(
+        phone_number="555-123-4567",
+        normalized_phone_number="+15551234567",
+        status=Recording.Status.FAILED,
+    )
+    complete = Recording.objects.create(
+        phone_number="555-765-4321", status=Recording.Status.COMPLETE
+    )
+
+    response = admin_client.post(
+        URL,
+        {"action": "retry_call", "_selected_action": [failed.pk, complete.pk]},
+        follow=True,
+    )
+    assert "1 calls queued." in response.content.decode()
+    job = CallJob.objects.select_related("recording").get()
+    assert job.recording.pk not in (failed.pk, complete.pk)
+    assert job.recording.normalized_phone_number == "+15551234567"
+    assert job.recording.status == Recording.Status.IN_PROGRESS
+    assert job.webhook_url.startswith("http://testserver/")
@@ -0,0 +1,128 @@
+import io
+from datetime import timedelta
+
+import pytest
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from voice_recordings import admission
+from voice_recordings.campaigns import import_campaign
+from voice_recordings.models import CallbackSlot, CallJob, Campaign, Recording
+
+
+@pytest.fixture
+def busy(settings):
+    """
+    One call every 10 seconds, and callbacks offered once a call would wait
+    more than 30.
+    """
+    settings.CALL_DISPATCH_RATE = 0.1
+    settings.CALL_WAIT_THRESHOLD = 30
+    settings.CALLBACK_SLOT_MINUTES = 15
+    settings.CALLBACK_CAPACITY_SHARE = 0.5
+    settings.CALLBACK_SLOTS_OFFERED = 4
+
+
+@pytest.mark.django_db
+def test_estimated_wait_grows_with_admitted_calls(busy):
+    assert admission.estimated_wait() == timedelta(0)
+    for _ in range(3):
+        admission.admit_call()
+
+    wait = admission.estimated_wait()
+    assert timedelta(seconds=29) < wait <= timedelta(seconds=30)
+    # And drains as time passes
+    later = timezone.now() + timedelta(seconds=20)
+    assert admission.estimated_wait(later) <= timedelta(seconds=10)
+    assert admission.estimated_wait(later + wait) == timedelta(0)
+
+
+@pytest.mark.django_db
+def test_estimated_wait_includes_overdue_campaign_calls(client, busy):
+    csv = b"phone_number\n" + b"".join(f"555-000-000{i}\n".encode() for i in range(6))
+    import_campaign(
+        Campaign.objects.create(name="Customers"),
+        io.BytesIO(csv),
+        base_url="https://example.com/",
+    )
+    # Scheduled at our whole rate, one every 10 seconds from now
+    assert admission.estimated_wait() < timedelta(seconds=1)
+
+    # Until the dispatcher falls behind with them
+    CallJob.objects.update(run_at=F("run_at") - timedelta(minutes=1))
+    wait = admission.estimated_wait()
+    assert timedelta(seconds=60) <= wait < timedelta(seconds=61)
+    response = client.post(reverse("form"), {"tel": "555-123-4567"})
+    assert response.status_code == 200
+    assert "it could take about 2 minutes" in response.content.decode()
+    assert CallJob.objects.count() == 6
+
+
+@pytest.mark.django_db
+def test_form_calls_straight_away_when_not_busy(client, busy):
+    response = client.post(reverse("form"), {"tel": "555-123-4567"})
+    assert response.status_code == 302
+    job = CallJob.objects.get()
+    assert job.run_at <= timezone.now()
+    assert job.callback_slot is None
+
+
+@pytest.mark.django_db
+def test_form_offers_callbacks_when_busy(client, busy):
+    for _ in range(4):
+        admission.admit_call()
+
+    response = client.post(reverse("form"), {"tel": "555-123-4567"})
+    assert response.status_code == 200
+    assert not Recording.objects.exists()
+    content = response.content.decode()
+    assert "it could take about 1 minute" in content
+    slots = admission.callback_slots()
+    assert len(slots) == 4
+    assert f'value="{slots[0].isoformat()}"' in content
+
+    # Storytellers can still choose to wait
+    response = client.post(reverse("form"), {"tel": "555-123-4567", "when": "now"})
+    assert response.status_code == 302
+    assert CallJob.objects.get().run_at <= timezone.now()
+    assert admission.estimated_wait() > timedelta(seconds=40)
+
+
+@pytest.mark.django_db
+def test_callbacks_are_spread_over_their_slot(client, busy, settings):
+    # 2 callbacks in a 15 minute slot
+    settings.CALL_DISPATCH_RATE = 1 / 225
+    start = admission.callback_slots()[0]
+
+    for tel in ["555-000-0001", "555-000-0002"]:
+        response = client.post(reverse("form"), {"tel": tel, "when": start.isoformat()})
+        assert response.status_code == 302
+
+    jobs = list(CallJob.objects.order_by("run_at"))
+    assert [job.run_at for job in jobs] == [start, start + timedelta(minutes=7.5)]
+    assert CallbackSlot.objects.get().booked == 2
+    assert all(job.callback_slot.start == start for job in jobs)
+
+    # Full slots aren't offered, or bookable
+    assert start not in admission.callback_slots()
+    response = client.post(
+        reverse("form"), {"tel": "555-000-0003", "when": start.isoformat()}
+    )
+    assert response.status_code == 200
+    assert "that time is no longer available" in response.content.decode()
+    assert CallJob.objects.count() == 2
+
+    # The recording page says when we'll call
+    response = client.get(reverse("recording", args=[jobs[1].recording.pk]))
+    assert f'datetime="{jobs[1].run_at.isoformat()}"' in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_callback_slots_start_after_the_backlog(busy):
+    for _ in range(100):
+        admission.admit_call()
+
+    assert admission.callback_slots()[0] >= timezone.now() + timedelta(seconds=990)
+    with pytest.raises(admission.SlotUnavailableError):
+        admission.book_callback(timezone.now().replace(microsecond=0))
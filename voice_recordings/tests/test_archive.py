@@ -0,0 +1,133 @@
+import gzip
+import json
+from datetime import UTC, datetime
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from voice_recordings import cache
+from voice_recordings.archive import archive_recordings, find_recording
+from voice_recordings.models import ProcessingJob, Recording, WebhookEvent
+from voice_recordings.webhooks import record_webhook_event
+
+NOW = datetime(2026, 10, 18, 12, tzinfo=UTC)
+
+
+@pytest.fixture(autouse=True)
+def now(monkeypatch):
+    monkeypatch.setattr("django.utils.timezone.now", lambda: NOW)
+
+
+def recording_created_at(created_at: datetime, **fields) -> Recording:
+    fields.setdefault("status", Recording.Status.COMPLETE)
+    rec = Recording.objects.create(phone_number="123-456-7890", **fields)
+    Recording.objects.filter(pk=rec.pk).update(created_at=created_at)
+    rec.refresh_from_db()
+    return rec
+
+
+@pytest.mark.django_db
+def test_old_months_are_archived(archive_storage):
+    august = [
+        recording_created_at(
+            datetime(2026, 8, day, tzinfo=UTC),
+            twilio_recording_sid=f"RE{day}",
+            media_name=f"RE{day}.mp3",
+        )
+        for day in range(1, 6)
+    ]
+    failed = recording_created_at(
+        datetime(2026, 8, 31, 23, tzinfo=UTC), status=Recording.Status.FAILED
+    )
+    stuck = recording_created_at(
+        datetime(2026, 8, 20, tzinfo=UTC), status=Recording.Status.IN_PROGRESS
+    )
+    fetching = recording_created_at(datetime(2026, 8, 21, tzinfo=UTC))
+    ProcessingJob.objects.create(
+        recording=fetching, step=ProcessingJob.Step.FETCH_MEDIA
+    )
+    # September ended less than a month ago
+    september = recording_created_at(datetime(2026, 9, 30, tzinfo=UTC))
+
+    archived = archive_recordings(chunk_size=2)
+    assert list(archived.values()) == [6]
+    [name] = archived
+    assert name.startswith("recordings-2026-08-")
+    assert set(Recording.objects.values_list("pk", flat=True)) == {
+        stuck.pk,
+        fetching.pk,
+        september.pk,
+    }
+
+    # Each chunk is a separate gzip member, listed in the index
+    index = json.loads(
+        (archive_storage / name.replace(".jsonl.gz", ".index.json")).read_text()
+    )
+    assert [(chunk["first_id"], chunk["last_id"]) for chunk in index["chunks"]] == [
+        (august[0].pk, august[1].pk),
+        (august[2].pk, august[3].pk),
+        (august[4].pk, failed.pk),
+    ]
+    lines = gzip.decompress((archive_storage / name).read_bytes()).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [
+        *(rec.pk for rec in august),
+        failed.pk,
+    ]
+
+    for rec in [*august, failed]:
+        archived_rec = find_recording(rec.pk)
+        for field in Recording._meta.concrete_fields:
+            assert getattr(archived_rec, field.attname) == getattr(rec, field.attname)
+    assert find_recording(september.pk) is None
+
+    # Nothing more to do until September falls out of the window
+    assert archive_recordings() == {}
+
+
+@pytest.mark.django_db
+def test_recordings_with_pending_events_are_kept():
+    rec = recording_created_at(datetime(2026, 7, 1, tzinfo=UTC))
+    record_webhook_event(
+        rec.pk, WebhookEvent.Kind.CALL, {"CallSid": "CA1", "CallStatus": "completed"}
+    )
+    assert archive_recordings() == {}
+
+    WebhookEvent.objects.update(processed_at=NOW)
+    assert list(archive_recordings().values()) == [1]
+    assert not WebhookEvent.objects.exists()
+
+
+@pytest.mark.django_db
+def test_archived_recordings_can_be_viewed(client, recordings_storage):
+    rec = recording_created_at(
+        datetime(2026, 8, 1, tzinfo=UTC),
+        twilio_recording_sid="RE1",
+        media_name="RE1.mp3",
+    )
+    recordings_storage.mkdir()
+    (recordings_storage / "RE1.mp3").write_bytes(b"audio")
+    archive_recordings()
+    cache.cache.clear()
+
+    response = client.get(reverse("recording", args=[rec.pk]))
+    assert response.status_code == 200
+    assert reverse("recording_audio", args=[rec.pk]) in response.content.decode()
+
+    # Archiving leaves the media alone
+    response = client.get(reverse("recording_audio", args=[rec.pk]))
+    assert b"".join(response.streaming_content) == b"audio"
+
+    response = client.get(reverse("recording_status", args=[rec.pk]))
+    assert response.content == b"COMPLETE"
+
+
+@pytest.mark.django_db
+def test_archive_recordings_command(capsys):
+    recording_created_at(datetime(2026, 6, 1, tzinfo=UTC))
+
+    call_command("archive_recordings", "--retention-days", "200")
+    assert capsys.readouterr().out == "Nothing to archive\n"
+
+    call_command("archive_recordings")
+    assert capsys.readouterr().out.endswith(".jsonl.gz: 1 recordings\n")
@@ -0,0 +1,332 @@
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from twilio.base.exceptions import TwilioRestException
+
+from voice_recordings.calls import (
+    TokenBucket,
+    claim_next_job,
+    dispatch_next_call,
+    enqueue_call,
+    get_call_scheduler,
+)
+from voice_recordings.models import CallJob, RateLimit, Recording
+from voice_recordings.twilio_accounts import get_accounts
+
+WEBHOOK_URL = "http://testserver/recording/1/call_started/"
+STATUS_CALLBACK_URL = "http://testserver/recording/1/call_status_updated/"
+
+
+@pytest.fixture
+def twilio_calls(monkeypatch, settings):
+    """
+    Monkeypatch the Twilio client to record calls instead of placing them.
+    Set `calls.error` to make the next call raise.
+    """
+
+    class DummyCall:
+        def __init__(self, sid):
+            self.sid = sid
+
+    class DummyCalls(list):
+        error = None
+
+        def __init__(self, account_sid):
+            self.account_sid = account_sid
+
+        def create(self, to, from_, url, status_callback):
+            if self.error is not None:
+                raise self.error
+            assert status_callback == STATUS_CALLBACK_URL
+            self.append((self.account_sid, from_, to, url))
+            # Call SIDs are unique
+            return DummyCall(f"FAKE_CALL_SID_{len(self)}")
+
+    calls = DummyCalls(None)
+
+    class DummyClient:
+        def __init__(self, sid, token, http_client=None):
+            account = next(a for a in settings.TWILIO_ACCOUNTS if a["sid"] == sid)
+            assert token == account["auth_token"]
+            self.api = SimpleNamespace(base_url=None)
+            self.calls = calls
+            calls.account_sid = sid
+
+    monkeypatch.setattr("voice_recordings.twilio_accounts.Client", DummyClient)
+    return calls
+
+
+@pytest.fixture
+def scheduler(settings):
+    settings.CALL_DISPATCH_RATE = 1000
+    return get_call_scheduler()
+
+
+@pytest.mark.django_db
+def test_dispatch_places_queued_call(twilio_calls, scheduler, settings):
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    enqueue_call(rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL)
+
+    assert dispatch_next_call(scheduler)
+    assert not dispatch_next_call(scheduler)
+
+    rec.refresh_from_db()
+    assert twilio_calls == [
+        (
+            settings.TWILIO_ACCOUNT_SID,
+            settings.TWILIO_FROM_NUMBER,
+            "+11234567890",
+            WEBHOOK_URL,
+        )
+    ]
+    assert rec.twilio_account_sid == settings.TWILIO_ACCOUNT_SID
+    assert rec.twilio_call_sid == "FAKE_CALL_SID_1"
+    assert rec.placed_at > rec.created_at
+    assert rec.status == Recording.Status.IN_PROGRESS
+    assert not CallJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_dispatch_retries_transient_errors(twilio_calls, scheduler):
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    enqueue_call(rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL)
+    twilio_calls.error = TwilioRestException(503, WEBHOOK_URL)
+
+    assert dispatch_next_call(scheduler)
+
+    rec.refresh_from_db()
+    job = CallJob.objects.get()
+    assert rec.status == Recording.Status.IN_PROGRESS
+    assert job.attempts == 1
+    assert job.run_at > timezone.now()
+    assert job.locked_until is None
+
+    # Not due yet
+    assert not dispatch_next_call(scheduler)
+
+    job.run_at = timezone.now()
+    job.save()
+    twilio_calls.error = None
+    assert dispatch_next_call(scheduler)
+    rec.refresh_from_db()
+    assert rec.twilio_call_sid == "FAKE_CALL_SID_1"
+
+
+@pytest.mark.django_db
+def test_dispatch_fails_recording_on_permanent_error(twilio_calls, scheduler):
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    enqueue_call(rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL)
+    twilio_calls.error = TwilioRestException(400, WEBHOOK_URL, code=21211)
+
+    assert dispatch_next_call(scheduler)
+
+    rec.refresh_from_db()
+    assert rec.status == Recording.Status.FAILED
+    assert not CallJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_dispatch_keeps_status_set_while_placing_call(
+    twilio_calls, scheduler, monkeypatch
+):
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    enqueue_call(rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL)
+
+    # The call fails, and Twilio tells us, before create() has even returned
+    create = type(twilio_calls).create
+
+    def create_and_fail(self, *args, **kwargs):
+        call = create(self, *args, **kwargs)
+        Recording.objects.filter(pk=rec.pk).update(status=Recording.Status.FAILED)
+        return call
+
+    monkeypatch.setattr(type(twilio_calls), "create", create_and_fail)
+    assert dispatch_next_call(scheduler)
+
+    rec.refresh_from_db()
+    assert rec.twilio_call_sid == "FAKE_CALL_SID_1"
+    assert rec.status == Recording.Status.FAILED
+
+
+@pytest.mark.django_db
+def test_claimed_jobs_are_not_claimed_twice():
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    enqueue_call(rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL)
+
+    assert claim_next_job().recording == rec
+    assert claim_next_job() is None
+
+    # Lease expired, e.g. because the worker died
+    CallJob.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+    assert claim_next_job().recording == rec
+
+
+@pytest.mark.django_db
+def test_dispatch_holds_job_while_rate_limited(twilio_calls, monkeypatch):
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    enqueue_call(rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL)
+    monkeypatch.setattr("voice_recordings.calls.JOB_LEASE", timedelta(0))
+
+    # Rate-limited for longer than the lease, while another worker looks for work
+    tokens = iter([(None, 60), (None, 60), (get_accounts()[0], 0)])
+    scheduler = SimpleNamespace(acquire=lambda: next(tokens))
+    claimed = []
+    monkeypatch.setattr(
+        "voice_recordings.calls.time.sleep",
+        lambda _: claimed.append(claim_next_job()),
+    )
+
+    assert dispatch_next_call(scheduler)
+    assert claimed == [None, None]
+    assert len(twilio_calls) == 1
+
+
+@pytest.mark.django_db
+def test_dispatch_skips_job_whose_lease_was_lost(twilio_calls, monkeypatch):
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    enqueue_call(rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL)
+    tokens = iter([(None, 60), (None, 60), (get_accounts()[0], 0)])
+    scheduler = SimpleNamespace(acquire=lambda: next(tokens))
+
+    # Stalled past the lease, and another worker claimed the job meanwhile
+    def stall(wait):
+        CallJob.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        assert claim_next_job().recording == rec
+
+    monkeypatch.setattr("voice_recordings.calls.time.sleep", stall)
+
+    assert dispatch_next_call(scheduler)
+    assert twilio_calls == []
+    assert CallJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_token_bucket():
+    bucket = TokenBucket("test", rate=1, capacity=2)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() > 0
+
+    # Refilled after waiting a second
+    RateLimit.objects.filter(name="test").update(
+        updated_at=timezone.now() - timedelta(seconds=1)
+    )
+    assert bucket.acquire() == 0
+    assert bucket.acquire() > 0
+
+
+@pytest.mark.django_db
+def test_dispatch_spreads_calls_across_accounts(twilio_calls, settings, monkeypatch):
+    settings.TWILIO_ACCOUNTS = [
+        {"sid": "AC1", "auth_token": "token1", "from_numbers": ["+15550000001"]},
+        {
+            "sid": "AC2",
+            "auth_token": "token2",
+            "from_numbers": ["+15550000002", "+15550000003"],
+        },
+    ]
+    scheduler = get_call_scheduler()
+    sleeps = []
+    monkeypatch.setattr("voice_recordings.calls.time.sleep", sleeps.append)
+
+    for _ in range(2):
+        rec = Recording.objects.create(phone_number="123-456-7890")
+        enqueue_call(
+            rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL
+        )
+        assert dispatch_next_call(scheduler)
+
+    # Each account has a budget of 1 call, so both accounts are used without
+    # waiting for the rate-limit.
+    assert sorted(account for account, *_ in twilio_calls) == ["AC1", "AC2"]
+    assert sleeps == []
+    assert set(Recording.objects.values_list("twilio_account_sid", flat=True)) == {
+        "AC1",
+        "AC2",
+    }
+
+    # Both budgets are spent, so the next call has to wait
+    account, wait = scheduler.acquire()
+    assert account is None
+    assert 0 < wait <= 1
+
+
+def test_recording_url_uses_recording_account():
+    rec = Recording(
+        status=Recording.Status.COMPLETE,
+        twilio_account_sid="AC2",
+        twilio_recording_sid="RE1",
+    )
+    assert rec.twilio_recording_url == (
+        "https://api.twilio.com/2010-04-01/Accounts/AC2/Recordings/RE1.mp3"
+    )
+
+
+@pytest.mark.django_db
+def test_twilio_clients_are_reused(twilio_api):
+    account = get_accounts()[0]
+    client = account.client()
+    assert account.client() is client
+
+    client.calls.list()
+    client.calls.list()
+    # Over the same keep-alive connection
+    assert twilio_api.connections == 1
+
+    # Twilio's clients aren't thread-safe, so other threads have their own,
+    # over the same connections
+    clients = []
+
+    def list_calls():
+        clients.append(account.client())
+        clients[0].calls.list()
+
+    thread = threading.Thread(target=list_calls)
+    thread.start()
+    thread.join()
+    assert clients[0] is not client
+    assert twilio_api.connections == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_dispatch_places_calls_concurrently(twilio_api, settings):
+    settings.CALL_DISPATCH_RATE = 1000
+    settings.CALL_DISPATCH_BURST = 3
+    recordings = [
+        Recording.objects.create(phone_number=f"555-000-000{i}") for i in range(3)
+    ]
+    for rec in recordings:
+        enqueue_call(
+            rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL
+        )
+
+    call_command("dispatch_calls", "--once", "--concurrency", "3")
+
+    assert sorted(call["To"] for call in twilio_api.placed) == [
+        "+15550000000",
+        "+15550000001",
+        "+15550000002",
+    ]
+    assert not CallJob.objects.exists()
+    for rec in recordings:
+        rec.refresh_from_db()
+        assert rec.twilio_call_sid in {call["sid"] for call in twilio_api.placed}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_dispatch_retries_transient_errors(twilio_api, settings):
+    settings.CALL_DISPATCH_RATE = 1000
+    rec = Recording.objects.create(phone_number="555-000-0000")
+    enqueue_call(rec, webhook_url=WEBHOOK_URL, status_callback_url=STATUS_CALLBACK_URL)
+    twilio_api.status = 503
+
+    call_command("dispatch_calls", "--once", "--concurrency", "3")
+
+    job = CallJob.objects.get()
+    assert job.attempts == 1
+    assert job.run_at > timezone.now()
@@ -0,0 +1,164 @@
+import io
+from datetime import timedelta
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from voice_recordings.calls import _normalize_phone_number
+from voice_recordings.campaigns import import_campaign
+from voice_recordings.models import CallJob, Campaign, Recording
+
+CSV = (
+    # With a byte order mark, like Excel exports
+    "\ufeffname,phone_number\r\n"
+    "Ada,555-123-4567\r\n"
+    "Grace,5551234567\r\n"
+    "Alan,not a number\r\n"
+    'Edsger,"555-765-4321"\r\n'
+    "Barbara,\r\n"
+    "Ken,+15550001111\r\n"
+).encode()
+
+
+def test_normalize_phone_number():
+    assert _normalize_phone_number("555-123-4567") == "+15551234567"
+    assert _normalize_phone_number(" 5551234567\n") == "+15551234567"
+    assert _normalize_phone_number("+15551234567") == "+15551234567"
+    with pytest.raises(ValueError):
+        _normalize_phone_number("555-1234")
+
+
+@pytest.mark.django_db
+def test_import_campaign(settings):
+    settings.CALL_DISPATCH_RATE = 2
+    campaign = Campaign.objects.create(name="Customers")
+    batches = []
+
+    state = import_campaign(
+        campaign,
+        io.BytesIO(CSV),
+        base_url="https://example.com/",
+        batch_size=2,
+        total_bytes=len(CSV),
+        progress=lambda state: batches.append(state.bytes_read),
+    )
+
+    campaign.refresh_from_db()
+    assert (campaign.rows, campaign.queued, campaign.duplicates, campaign.invalid) == (
+        6,
+        3,
+        1,
+        2,
+    )
+    assert campaign.imported_at is not None
+    assert len(batches) == 3
+    assert batches[-1] == len(CSV)
+    assert state.eta == 0
+
+    jobs = list(CallJob.objects.select_related("recording").order_by("run_at"))
+    assert [job.recording.phone_number for job in jobs] == [
+        "+15551234567",
+        "+15557654321",
+        "+15550001111",
+    ]
+    assert all(job.recording.campaign == campaign for job in jobs)
+    # Spaced out at the outbound rate
+    assert [job.run_at - jobs[0].run_at for job in jobs] == [
+        timedelta(0),
+        timedelta(seconds=0.5),
+        timedelta(seconds=1),
+    ]
+    assert state.last_call_at == jobs[-1].run_at
+    assert jobs[0].webhook_url == "https://example.com" + reverse(
+        "call_started_webhook", args=[jobs[0].recording.pk]
+    )
+    assert jobs[0].status_callback_url == "https://example.com" + reverse(
+        "call_status_updated_webhook", args=[jobs[0].recording.pk]
+    )
+
+    # Importing the same list again doesn't call anyone twice
+    import_campaign(campaign, io.BytesIO(CSV), base_url="https://example.com/")
+    campaign.refresh_from_db()
+    assert campaign.queued == 3
+    assert campaign.duplicates == 5
+    assert Recording.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_campaigns_are_scheduled_after_queued_calls(settings):
+    settings.CALL_DISPATCH_RATE = 1
+    later = timezone.now() + timedelta(minutes=10)
+    rec = Recording.objects.create(phone_number="555-000-0000")
+    CallJob.objects.create(recording=rec, run_at=later)
+
+    campaign = Campaign.objects.create(name="Customers")
+    import_campaign(campaign, io.BytesIO(CSV), base_url="https://example.com/")
+
+    first = CallJob.objects.filter(recording__campaign=campaign).earliest("run_at")
+    assert first.run_at == later + timedelta(seconds=1)
+
+
+@pytest.mark.django_db
+def test_import_campaign_command(tmp_path, capsys):
+    path = tmp_path / "customers.csv"
+    path.write_bytes(CSV)
+
+    call_command("import_campaign", str(path), "--base-url", "https://example.com/")
+    out, err = capsys.readouterr()
+    campaign = Campaign.objects.get()
+    assert campaign.name == "customers.csv"
+    assert out.startswith(
+        f"Campaign {campaign.pk}: 3 calls queued, 1 duplicates, 2 invalid numbers\n"
+    )
+    assert err.startswith("6 rows, 3 calls queued, 100%, ETA 0:00:00")
+
+    with pytest.raises(CommandError, match="no 'tel' column"):
+        call_command(
+            "import_campaign",
+            str(path),
+            "--base-url",
+            "https://example.com/",
+            "--column",
+            "tel",
+        )
+    assert Campaign.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_campaigns_can_be_uploaded_in_the_admin(admin_client):
+    response = admin_client.post(
+        reverse("admin:voice_recordings_campaign_add"),
+        {
+            "name": "Customers",
+            "column": "phone_number",
+            "csv_file": SimpleUploadedFile("customers.csv", CSV),
+        },
+        follow=True,
+    )
+    assert response.status_code == 200
+    assert "3 calls queued, 1 duplicates, 2 invalid numbers." in (
+        response.content.decode()
+    )
+
+    campaign = Campaign.objects.get()
+    job = CallJob.objects.select_related("recording").first()
+    assert job.recording.campaign == campaign
+    assert job.webhook_url.startswith("http://testserver/")
+
+
+@pytest.mark.django_db
+def test_campaigns_without_the_column_are_not_saved_in_the_admin(admin_client):
+    response = admin_client.post(
+        reverse("admin:voice_recordings_campaign_add"),
+        {
+            "name": "Customers",
+            "column": "tel",
+            "csv_file": SimpleUploadedFile("customers.csv", CSV),
+        },
+    )
+    assert response.status_code == 200
+    assert "CSV has no &#x27;tel&#x27; column" in response.content.decode()
+    assert not Campaign.objects.exists()
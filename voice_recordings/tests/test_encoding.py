@@ -0,0 +1,147 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile
+from django.core.management import call_command
+from django.urls import reverse
+
+from voice_recordings import encoding
+from voice_recordings.media import get_storage
+from voice_recordings.models import AudioBlob, ProcessingJob, Recording, WebhookEvent
+from voice_recordings.processing import run_next_job
+from voice_recordings.webhooks import process_webhook_events, record_webhook_event
+
+RATE = 8000
+
+
+def twilio_mp3(seconds: int = 10) -> bytes:
+    """
+    A 32 kbps mp3, like Twilio's, of a tone that comes and goes.
+    """
+    t = np.arange(seconds * RATE) / RATE
+    samples = 0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(np.pi * t) > 0)
+    file = io.BytesIO()
+    soundfile.write(
+        file,
+        samples.astype(np.float32),
+        RATE,
+        format="MP3",
+        compression_level=0.5,
+        bitrate_mode="CONSTANT",
+    )
+    return file.getvalue()
+
+
+def complete_and_process(recording_sid: str) -> Recording:
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    record_webhook_event(
+        rec.pk,
+        WebhookEvent.Kind.RECORDING,
+        {"RecordingSid": recording_sid, "RecordingStatus": "completed"},
+    )
+    process_webhook_events()
+    while run_next_job():
+        pass
+    rec.refresh_from_db()
+    return rec
+
+
+def test_compression_level():
+    assert encoding.compression_level(256_000) == 0
+    assert encoding.compression_level(6_000) == 1
+    assert encoding.compression_level(1_000_000) == 0
+    assert encoding.compression_level(12_000) == pytest.approx(0.976)
+
+
+@pytest.mark.django_db
+def test_completed_recordings_are_encoded(
+    twilio_api, settings, client, django_capture_on_commit_callbacks
+):
+    audio = twilio_mp3()
+    path = f"/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Recordings"
+    twilio_api.files[f"{path}/RE123.mp3"] = audio
+    twilio_api.files[f"{path}/RE456.mp3"] = audio
+    storage = get_storage()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        rec = complete_and_process("RE123")
+    assert not ProcessingJob.objects.exists()
+
+    blob = rec.audio_blob
+    assert rec.media_name == ""
+    assert not storage.exists("RE123.mp3")
+    assert (blob.source_size, blob.references) == (len(audio), 1)
+    # About 12 kbps, rather than 32
+    assert blob.size < len(audio) / 2
+    assert storage.size(blob.name) == blob.size
+    # Analyzed before the mp3 was deleted
+    assert rec.duration_display == "0:10"
+
+    with storage.open(blob.name) as f:
+        samples, rate = soundfile.read(f)
+    assert rate == RATE
+    assert len(samples) == pytest.approx(10 * RATE, abs=RATE / 10)
+
+    url = reverse("recording_audio", args=[rec.pk])
+    response = client.get(url, headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response["Content-Type"] == "audio/ogg"
+    assert b"".join(response.streaming_content).startswith(b"OggS")
+
+    content = client.get(reverse("recording", args=[rec.pk])).content.decode()
+    assert f'src="{url}" type="audio/ogg"' in content
+    # Twilio's copy, for browsers that can't play Opus
+    assert f'src="{rec.twilio_recording_url}" type="audio/mpeg"' in content
+
+    # The same audio again shares the blob, without being encoded again
+    with django_capture_on_commit_callbacks(execute=True):
+        other = complete_and_process("RE456")
+    assert other.audio_blob == blob
+    blob.refresh_from_db()
+    assert blob.references == 2
+    assert AudioBlob.objects.count() == 1
+    assert [name for name in storage.listdir("")[1] if name.endswith(".mp3")] == []
+
+    # Deleted along with the last recording that uses it
+    with django_capture_on_commit_callbacks(execute=True):
+        rec.delete()
+    assert storage.exists(blob.name)
+    with django_capture_on_commit_callbacks(execute=True):
+        other.delete()
+    assert not AudioBlob.objects.exists()
+    assert not storage.exists(blob.name)
+
+
+@pytest.mark.django_db
+def test_audio_savings_report(capsys):
+    blobs = [
+        AudioBlob.objects.create(
+            sha256="a" * 64, source_size=40_000, size=15_000, references=3
+        ),
+        AudioBlob.objects.create(
+            sha256="b" * 64, source_size=10_000, size=4_000, references=1
+        ),
+    ]
+    recordings = [
+        Recording.objects.create(phone_number="123-456-7890", audio_blob=blob)
+        for blob in [blobs[0], blobs[0], blobs[1]]
+    ]
+
+    assert list(encoding.savings()) == [
+        (recordings[0].pk, 40_000, 15_000),
+        (recordings[1].pk, 40_000, 0),
+        (recordings[2].pk, 10_000, 4_000),
+    ]
+    # The blob's third recording has been archived
+    assert encoding.total_savings() == (130_000, 19_000)
+
+    call_command("audio_savings_report")
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1] == (
+        f"Recording {recordings[1].pk}: 40,000 bytes, shared "
+        "(40,000 bytes, 100.0% smaller)"
+    )
+    assert (
+        lines[-1] == "Total: 130,000 bytes, 19,000 bytes (111,000 bytes, 85.4% smaller)"
+    )
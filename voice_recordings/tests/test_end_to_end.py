@@ -1,12 +1,38 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+from django.db import connections
 
 from voice_recordings.models import Recording
 
 
+def in_thread(function, *args):
+    """
+    Call `function` in another thread. Playwright's sync API runs an event
+    loop in the test's thread, and Django won't query the database from a
+    thread with a running event loop.
+    """
+
+    def call():
+        try:
+            return function(*args)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(call).result()
+
+
+def complete_first_recording():
+    recording = Recording.objects.get()
+    assert recording.status == Recording.Status.IN_PROGRESS
+    recording.status = Recording.Status.COMPLETE
+    recording.save()
+
+
 @pytest.mark.django_db
-def test_happy_path_browser_with_polling(page, live_server, monkeypatch, settings):
+def test_happy_path_browser_with_polling(page, live_server):
     """
     Playwright browser E2E happy path using the template's JS polling:
     1. User opens form
@@ -15,25 +41,6 @@ def test_happy_path_browser_with_polling(page, live_server, monkeypatch, setting
     4. Browser auto-refreshes & shows 'Recording complete!'
     """
 
-    # --- Monkeypatch Twilio Client ---
-    class DummyCall:
-        sid = "FAKE_CALL_SID"
-
-    class DummyCalls:
-        def create(self, to, from_, url):
-            assert to.startswith("+1")
-            assert from_ == settings.TWILIO_FROM_NUMBER
-            assert url.startswith("http")
-            return DummyCall()
-
-    class DummyClient:
-        def __init__(self, sid, token):
-            assert sid == settings.TWILIO_ACCOUNT_SID
-            assert token == settings.TWILIO_AUTH_TOKEN
-            self.calls = DummyCalls()
-
-    monkeypatch.setattr("voice_recordings.views.Client", DummyClient)
-
     # --- Step 1: Visit form page ---
     page.goto(f"{live_server.url}")
     assert page.locator('button:has-text("Call me now")').is_visible()
@@ -43,16 +50,12 @@ def test_happy_path_browser_with_polling(page, live_server, monkeypatch, setting
     page.fill('input[name="tel"]', tel)
     page.click('button:has-text("Call me now")')
 
-    # Grab the created Recording instance
-    recording = Recording.objects.first()
-    assert recording is not None
-    assert recording.status == Recording.Status.IN_PROGRESS
+    page.wait_for_url("**/recording/**")
 
     # --- Step 3: Wait until polling script is likely active ---
     # The script waits 10s before the first poll, so we mark COMPLETE after ~3s
     time.sleep(3)
-    recording.status = Recording.Status.COMPLETE
-    recording.save()
+    in_thread(complete_first_recording)
 
     # --- Step 4: Browser should detect change & auto-reload ---
     # Polling delay: script waits 10s + server round-trip
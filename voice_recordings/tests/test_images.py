@@ -0,0 +1,57 @@
+import io
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.template import Context, Template
+from PIL import Image
+
+from voice_recordings import images
+
+LOGO = "voice_recordings/logo.png"
+
+
+def test_resize():
+    buffer = io.BytesIO()
+    Image.new("RGBA", (400, 200)).save(buffer, format="PNG")
+
+    resized = images.resize(buffer.getvalue(), [100, 200, 800])
+
+    assert [(r.width, r.height, r.type) for r in resized] == [
+        (100, 50, "image/webp"),
+        (100, 50, "image/png"),
+        (200, 100, "image/webp"),
+        (200, 100, "image/png"),
+    ]
+    assert Image.open(io.BytesIO(resized[0].content)).format == "WEBP"
+
+
+def test_responsive_image():
+    html = Template(
+        "{% load responsive_images %}"
+        '{% responsive_image name sizes="8rem" class="logo" %}'
+    ).render(Context({"name": LOGO}))
+
+    webp = staticfiles_storage.url("voice_recordings/logo.128w.webp")
+    png = staticfiles_storage.url("voice_recordings/logo.128w.png")
+    assert f'<source type="image/webp" srcset="{webp} 128w, ' in html
+    assert f'<img src="{png}" srcset="{png} 128w, ' in html
+    assert 'sizes="8rem" width="128" height="90" class="logo"' in html
+
+
+def test_landing_page_serves_small_logo(client):
+    html = client.get("/").content.decode()
+
+    assert staticfiles_storage.url("voice_recordings/logo.128w.png") in html
+    assert staticfiles_storage.url(LOGO) not in html
+    variants = staticfiles_storage.variants[LOGO]
+    assert variants["voice_recordings/logo.128w.webp"]["bytes"] < (
+        staticfiles_storage.size(staticfiles_storage.stored_name(LOGO)) / 10
+    )
+
+
+def test_static_variants_report():
+    output = io.StringIO()
+    call_command("static_variants_report", stdout=output)
+
+    assert "voice_recordings/logo.png: 420,929 bytes" in output.getvalue()
+    assert "voice_recordings/logo.128w.webp" in output.getvalue()
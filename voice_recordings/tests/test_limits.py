@@ -0,0 +1,101 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from django.urls import reverse
+
+from voice_recordings import limits
+from voice_recordings.models import CallJob, Recording
+
+KEY = "1b4e28ba-2fa1-11d2-883f-0016d3cca427"
+
+
+def test_sliding_window_limit():
+    limit = limits.SlidingWindowLimit("test", 4, timedelta(minutes=10))
+    start = datetime(2025, 1, 1, tzinfo=UTC)
+
+    for minute in range(4):
+        assert limit.allow("a", start + timedelta(minutes=minute))
+    assert not limit.allow("a", start + timedelta(minutes=5))
+    # Other keys have their own count
+    assert limit.allow("b", start + timedelta(minutes=5))
+
+    # Half way through the next window, half of this one's 4 still count
+    assert limit.allow("a", start + timedelta(minutes=15))
+    assert limit.allow("a", start + timedelta(minutes=15))
+    assert not limit.allow("a", start + timedelta(minutes=15))
+    # Once it has passed, only the 2 from the next window count
+    assert limit.allow("a", start + timedelta(minutes=20))
+
+
+@pytest.mark.django_db
+def test_resubmitted_form_goes_to_the_same_recording(client):
+    url = reverse("form")
+    first = client.post(url, {"tel": "555-123-4567", "idempotency_key": KEY})
+    recording = Recording.objects.get()
+    assert recording.normalized_phone_number == "+15551234567"
+    assert recording.idempotency_key == KEY
+
+    again = client.post(url, {"tel": "555-123-4567", "idempotency_key": KEY})
+    assert again.status_code == 302
+    assert again.url == first.url
+    assert CallJob.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_calls_in_progress_are_not_repeated(client, settings):
+    url = reverse("form")
+    first = client.post(url, {"tel": "555-123-4567"})
+    # Typed differently, without the form's script. Not sent to the first
+    # call's recording, which only its own submission may see.
+    again = client.post(url, {"tel": "5551234567"})
+    assert again.status_code == 409
+    content = again.content.decode()
+    assert "already calling this number" in content
+    assert first.url not in content
+    assert Recording.objects.count() == 1
+
+    # But once the call is over, or too long ago, the number can be called
+    # again
+    Recording.objects.update(status=Recording.Status.COMPLETE)
+    assert client.post(url, {"tel": "555-123-4567"}).url != first.url
+    settings.CALL_DEDUPE_SECONDS = 0
+    client.post(url, {"tel": "555-123-4567"})
+    assert Recording.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_calls_are_limited(client, settings):
+    settings.CALL_LIMIT_PER_NUMBER = 2
+    settings.CALL_LIMIT_PER_IP = 3
+    settings.CALL_DEDUPE_SECONDS = 0
+    url = reverse("form")
+
+    for tel in ["555-000-0001", "555-000-0001", "555-000-0002"]:
+        assert client.post(url, {"tel": tel}).status_code == 302
+    response = client.post(url, {"tel": "555-000-0001"})
+    assert response.status_code == 429
+    assert "can’t take any more calls" in response.content.decode()
+    assert 'value="555-000-0001"' in response.content.decode()
+
+    # Per client address
+    assert client.post(url, {"tel": "555-000-0003"}).status_code == 429
+    other_client = {"REMOTE_ADDR": "192.0.2.1"}
+    assert client.post(url, {"tel": "555-000-0003"}, **other_client).status_code == 302
+    assert client.post(url, {"tel": "555-000-0001"}, **other_client).status_code == 429
+    assert Recording.objects.count() == 4
+
+
+def test_client_ip(rf, settings):
+    settings.USE_X_FORWARDED_FOR = True
+    request = rf.get("/", headers={"X-Forwarded-For": "10.0.0.1, 192.0.2.1"})
+    assert limits.client_ip(request) == "192.0.2.1"
+    settings.USE_X_FORWARDED_FOR = False
+    assert limits.client_ip(request) == "127.0.0.1"
+
+
+@pytest.mark.django_db
+def test_invalid_numbers_are_rejected(client):
+    response = client.post(reverse("form"), {"tel": "555-1234"})
+    assert response.status_code == 400
+    assert "Please enter a US phone number" in response.content.decode()
+    assert not Recording.objects.exists()
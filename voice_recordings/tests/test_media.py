@@ -0,0 +1,134 @@
+import pytest
+from django.core.files.base import ContentFile
+from django.urls import reverse
+
+from voice_recordings.media import get_storage, parse_range
+from voice_recordings.models import ProcessingJob, Recording, WebhookEvent
+from voice_recordings.processing import run_next_job
+from voice_recordings.webhooks import process_webhook_events, record_webhook_event
+
+AUDIO = bytes(range(256)) * 1000
+
+
+def complete_recording(settings) -> Recording:
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    record_webhook_event(
+        rec.pk,
+        WebhookEvent.Kind.RECORDING,
+        {"RecordingSid": "RE123", "RecordingStatus": "completed"},
+    )
+    process_webhook_events()
+    rec.refresh_from_db()
+    return rec
+
+
+@pytest.mark.django_db
+def test_completed_recordings_are_fetched(twilio_api, settings, client):
+    twilio_api.files[
+        f"/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Recordings/RE123.mp3"
+    ] = AUDIO
+    rec = complete_recording(settings)
+    assert rec.audio_url == rec.twilio_recording_url
+
+    assert run_next_job()
+
+    rec.refresh_from_db()
+    assert rec.media_name == "RE123.mp3"
+    audio_url = reverse("recording_audio", args=[rec.pk])
+    assert rec.audio_url == audio_url
+    with get_storage().open(rec.media_name) as f:
+        assert f.read() == AUDIO
+    # Analyzed next, see test_waveforms
+    assert ProcessingJob.objects.get().step == ProcessingJob.Step.ANALYZE_AUDIO
+
+    response = client.get(reverse("recording", args=[rec.pk]))
+    assert f'src="{audio_url}"' in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_failed_fetches_are_retried(twilio_api, settings, recordings_storage):
+    twilio_api.status = 503
+    rec = complete_recording(settings)
+
+    assert run_next_job()
+
+    rec.refresh_from_db()
+    job = ProcessingJob.objects.get()
+    assert rec.media_name == ""
+    assert job.attempts == 1
+    assert "503" in job.last_error
+    assert not run_next_job()
+    assert not any(recordings_storage.glob("*"))
+
+
+@pytest.mark.django_db
+def test_recording_audio(client, django_capture_on_commit_callbacks):
+    rec = Recording.objects.create(
+        phone_number="123-456-7890",
+        status=Recording.Status.COMPLETE,
+        twilio_recording_sid="RE123",
+    )
+    url = reverse("recording_audio", args=[rec.pk])
+    response = client.get(url)
+    assert response.status_code == 404
+
+    rec.media_name = get_storage().save("RE123.mp3", ContentFile(AUDIO))
+    with django_capture_on_commit_callbacks(execute=True):
+        rec.save()
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response["Content-Type"] == "audio/mpeg"
+    assert response["Accept-Ranges"] == "bytes"
+    assert b"".join(response.streaming_content) == AUDIO
+    etag = response["ETag"]
+
+    response = client.get(url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 10-19/{len(AUDIO)}"
+    assert response["Content-Length"] == "10"
+    assert b"".join(response.streaming_content) == AUDIO[10:20]
+
+    response = client.get(url, headers={"Range": "bytes=1000-"})
+    assert response.status_code == 206
+    assert response["Content-Length"] == str(len(AUDIO) - 1000)
+    assert b"".join(response.streaming_content) == AUDIO[1000:]
+    response.close()
+
+    response = client.get(url, headers={"Range": f"bytes={len(AUDIO)}-"})
+    assert response.status_code == 416
+    assert response["Content-Range"] == f"bytes */{len(AUDIO)}"
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Stale If-Range: serve the whole file
+    response = client.get(
+        url,
+        headers={"Range": "bytes=10-19", "If-Range": '"something-else"'},
+    )
+    assert response.status_code == 200
+    response.close()
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("bytes=0-", (0, 99)),
+        ("bytes=10-19", (10, 19)),
+        ("bytes=90-200", (90, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=-200", (0, 99)),
+        ("bytes=20-10", None),
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
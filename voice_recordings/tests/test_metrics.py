@@ -0,0 +1,143 @@
+import re
+from datetime import timedelta
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from twilio.base.exceptions import TwilioException
+
+from voice_recordings import metrics
+from voice_recordings.models import CallJob, Recording
+from voice_recordings.twilio_accounts import get_account
+
+
+def histogram_count(name: str, **labels) -> int:
+    key = (name, tuple(sorted(labels.items())))
+    values = metrics.snapshot()["histograms"].get(key)
+    return sum(values[:-1]) if values else 0
+
+
+@pytest.mark.django_db
+def test_requests_are_timed(client):
+    rec = Recording.objects.create(phone_number="555-123-4567")
+    response = client.get(reverse("recording_status", args=[rec.pk]))
+
+    timing = response["Server-Timing"]
+    assert re.fullmatch(r'app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"', timing)
+    assert (
+        histogram_count("storyworth_request_duration_seconds", view="recording_status")
+        == 1
+    )
+    assert metrics.snapshot()["counters"] == {
+        (
+            "storyworth_requests_total",
+            (("status", "200"), ("view", "recording_status")),
+        ): 1
+    }
+
+
+@pytest.mark.django_db
+def test_database_queries_are_counted(client):
+    response = client.post(reverse("form"), {"tel": "555-123-4567"})
+
+    queries = int(re.search(r'desc="(\d+) queries"', response["Server-Timing"])[1])
+    assert queries > 0
+    (values,) = (
+        values
+        for (name, labels), values in metrics.snapshot()["histograms"].items()
+        if name == "storyworth_request_db_queries"
+    )
+    # The sum of the observed query counts
+    assert values[-1] == queries
+
+
+@pytest.mark.django_db
+def test_twilio_requests_are_timed(twilio_api):
+    client = get_account("").client()
+    client.calls.list()
+    twilio_api.status = 500
+    with pytest.raises(TwilioException):
+        client.calls.list()
+
+    endpoint = f"/2010-04-01/Accounts/{client.account_sid}/Calls.json"
+    assert (
+        histogram_count(
+            "storyworth_twilio_request_duration_seconds",
+            method="GET",
+            endpoint=endpoint,
+        )
+        == 2
+    )
+    assert metrics.snapshot()["counters"] == {
+        (
+            "storyworth_twilio_errors_total",
+            (("endpoint", endpoint), ("method", "GET"), ("status", "500")),
+        ): 1
+    }
+
+
+def test_twilio_endpoints_leave_out_sids():
+    assert (
+        metrics.twilio_endpoint(
+            "https://api.twilio.com/2010-04-01/Accounts/AC0123456789abcdef0123456789abcdef"
+            "/Recordings/RE0123456789abcdef0123456789abcdef.mp3"
+        )
+        == "/2010-04-01/Accounts/{sid}/Recordings/{sid}.mp3"
+    )
+
+
+@pytest.mark.django_db
+def test_metrics_are_merged_across_processes(client, admin_user, settings):
+    metrics.observe("storyworth_request_duration_seconds", 0.02, view="form")
+    # Another gunicorn worker's timings
+    cache.set(
+        "metrics:other",
+        {
+            "histograms": {
+                (
+                    "storyworth_request_duration_seconds",
+                    (("view", "form"),),
+                ): [0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0.02],
+            },
+            "counters": {},
+        },
+    )
+    cache.set(metrics.PROCESSES_KEY, {"metrics:other", "metrics:exited"})
+    rec = Recording.objects.create(phone_number="555-123-4567")
+    CallJob.objects.create(recording=rec, run_at=timezone.now() - timedelta(seconds=30))
+
+    client.force_login(admin_user)
+    response = client.get(reverse("prometheus_metrics"))
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+    body = response.content.decode()
+    assert (
+        'storyworth_request_duration_seconds_bucket{view="form",le="0.01"} 0\n'
+        'storyworth_request_duration_seconds_bucket{view="form",le="0.025"} 2\n'
+    ) in body
+    assert 'storyworth_request_duration_seconds_count{view="form"} 2\n' in body
+    assert "storyworth_recordings_in_progress 1\n" in body
+    assert "storyworth_calls_queued 1\n" in body
+    age = float(
+        re.search(
+            r"^storyworth_oldest_pending_call_age_seconds (.+)$", body, re.MULTILINE
+        )[1]
+    )
+    assert 30 <= age < 60
+
+    # Processes whose timings have expired are forgotten
+    assert "metrics:exited" not in cache.get(metrics.PROCESSES_KEY)
+    assert "metrics:other" in cache.get(metrics.PROCESSES_KEY)
+
+
+@pytest.mark.django_db
+def test_metrics_require_staff_or_token(client, settings):
+    url = reverse("prometheus_metrics")
+    assert client.get(url).status_code == 403
+
+    settings.METRICS_TOKEN = "secret"
+    assert client.get(url, headers={"Authorization": "Bearer wrong"}).status_code == 403
+    assert (
+        client.get(url, headers={"Authorization": "Bearer secret"}).status_code == 200
+    )
@@ -0,0 +1,112 @@
+import importlib
+from datetime import timedelta
+
+import pytest
+from django.apps import apps
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from voice_recordings.cache import get_status
+from voice_recordings.models import Recording
+from voice_recordings.webhooks import find_recording_id
+
+
+@pytest.mark.django_db
+def test_sids_are_unique_unless_blank():
+    Recording.objects.create(phone_number="1", twilio_call_sid="CA1")
+    Recording.objects.create(phone_number="2")
+    Recording.objects.create(phone_number="3")
+
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Recording.objects.create(phone_number="4", twilio_call_sid="CA1")
+
+
+@pytest.mark.django_db
+def test_find_recording_id():
+    rec = Recording.objects.create(
+        phone_number="1", twilio_call_sid="CA1", twilio_recording_sid="RE1"
+    )
+    assert find_recording_id("CA1") == rec.pk
+    assert find_recording_id("", "RE1") == rec.pk
+    assert find_recording_id("CA2", "RE1") == rec.pk
+    assert find_recording_id("CA2") is None
+    assert find_recording_id("") is None
+
+
+@pytest.mark.django_db
+def test_recordings_cached_with_string_statuses_are_ignored():
+    rec = Recording.objects.create(phone_number="1", status=Recording.Status.COMPLETE)
+    # As cached, without expiry, before statuses became integers
+    legacy = Recording(pk=rec.pk, phone_number="1")
+    legacy.status = "COMPLETE"
+    cache.set(f"recording:v1:{rec.pk}", legacy, timeout=None)
+    assert get_status(rec.pk) == Recording.Status.COMPLETE
+
+
+@pytest.mark.django_db
+def test_older_writes_dont_overwrite_cached_recordings(
+    django_capture_on_commit_callbacks,
+):
+    rec = Recording.objects.create(phone_number="1")
+    stale = Recording.objects.get(pk=rec.pk)
+
+    # Two writes whose commits reach the cache in the opposite order
+    with django_capture_on_commit_callbacks() as callbacks:
+        stale.save(update_fields=["updated_at"])
+        rec.status = Recording.Status.COMPLETE
+        rec.save(update_fields=["status", "updated_at"])
+    for callback in reversed(callbacks):
+        callback()
+
+    assert get_status(rec.pk) == Recording.Status.COMPLETE
+
+
+@pytest.mark.django_db
+def test_normalized_phone_numbers_are_backfilled(monkeypatch):
+    migration = importlib.import_module(
+        "voice_recordings.migrations.0016_backfill_normalized_phone_number"
+    )
+    monkeypatch.setattr(migration, "BATCH_SIZE", 2)
+    numbers = ["555-123-4567", "5551234567", "+15557654321", "555-1234", "x"]
+    recordings = [Recording.objects.create(phone_number=tel) for tel in numbers]
+
+    migration.backfill_normalized_phone_numbers(apps, None)
+    assert [
+        Recording.objects.get(pk=rec.pk).normalized_phone_number for rec in recordings
+    ] == ["+15551234567", "+15551234567", "+15557654321", "", ""]
+
+
+@pytest.mark.skipif(
+    connection.vendor != "postgresql", reason="Query plans are Postgres specific"
+)
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "queryset,index",
+    [
+        (
+            lambda: Recording.objects.filter(twilio_call_sid="CA1"),
+            "recording_unique_call_sid",
+        ),
+        (
+            lambda: Recording.objects.filter(twilio_recording_sid="RE1"),
+            "recording_unique_recording_sid",
+        ),
+        (
+            lambda: Recording.objects.filter(
+                status=Recording.Status.IN_PROGRESS,
+                created_at__lt=timezone.now() - timedelta(hours=1),
+            ),
+            "recording_in_progress_idx",
+        ),
+    ],
+)
+def test_query_plans_use_indexes(queryset, index):
+    Recording.objects.bulk_create(
+        Recording(phone_number=str(i), twilio_call_sid=f"CA{i}") for i in range(100)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE voice_recordings_recording")
+        # The table is tiny, so the planner would rather scan it
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        assert index in queryset().explain()
@@ -0,0 +1,198 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from voice_recordings import reaper
+from voice_recordings.models import CallJob, ProcessingJob, Recording
+from voice_recordings.reaper import reap_stale_recordings
+
+
+def stale_recording(call_sid: str, hours_ago: float = 3) -> Recording:
+    rec = Recording.objects.create(
+        phone_number="123-456-7890", twilio_call_sid=call_sid
+    )
+    created_at = timezone.now() - timedelta(hours=hours_ago)
+    Recording.objects.filter(pk=rec.pk).update(created_at=created_at)
+    rec.refresh_from_db()
+    return rec
+
+
+def twilio_call(rec: Recording, status: str) -> dict:
+    return {
+        "sid": rec.twilio_call_sid,
+        "status": status,
+        "start_time": rec.created_at + timedelta(seconds=5),
+    }
+
+
+def twilio_recording(rec: Recording, sid: str, status: str = "completed") -> dict:
+    return {
+        "sid": sid,
+        "call_sid": rec.twilio_call_sid,
+        "status": status,
+        "date_created": rec.created_at + timedelta(seconds=30),
+    }
+
+
+@pytest.mark.django_db
+def test_stale_recordings_are_reconciled(
+    twilio_api, monkeypatch, django_capture_on_commit_callbacks
+):
+    # Make Twilio page through its lists
+    monkeypatch.setattr(reaper, "PAGE_SIZE", 2)
+
+    completed = stale_recording("CA1")
+    busy = stale_recording("CA2")
+    unrecorded = stale_recording("CA3")
+    absent = stale_recording("CA4")
+    ringing = stale_recording("CA5")
+    unknown = stale_recording("CA6")
+    never_placed = stale_recording("")
+    queued = stale_recording("")
+    CallJob.objects.create(recording=queued, run_at=timezone.now())
+    fresh = stale_recording("CA7", hours_ago=0.5)
+
+    twilio_api.calls = [
+        twilio_call(completed, "completed"),
+        twilio_call(busy, "busy"),
+        twilio_call(unrecorded, "completed"),
+        twilio_call(absent, "completed"),
+        twilio_call(ringing, "ringing"),
+        twilio_call(fresh, "completed"),
+    ]
+    twilio_api.recordings = [
+        twilio_recording(completed, "RE1"),
+        twilio_recording(absent, "RE4", status="absent"),
+        twilio_recording(fresh, "RE7"),
+    ]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        counts = reap_stale_recordings(timedelta(hours=2))
+    assert counts == {"complete": 1, "failed": 4, "unresolved": 2}
+
+    statuses = dict(Recording.objects.values_list("pk", "status"))
+    assert statuses == {
+        completed.pk: Recording.Status.COMPLETE,
+        busy.pk: Recording.Status.FAILED,
+        unrecorded.pk: Recording.Status.FAILED,
+        absent.pk: Recording.Status.FAILED,
+        ringing.pk: Recording.Status.IN_PROGRESS,
+        unknown.pk: Recording.Status.IN_PROGRESS,
+        never_placed.pk: Recording.Status.FAILED,
+        queued.pk: Recording.Status.IN_PROGRESS,
+        fresh.pk: Recording.Status.IN_PROGRESS,
+    }
+    completed.refresh_from_db()
+    assert completed.twilio_recording_sid == "RE1"
+    assert completed.updated_at > completed.created_at
+    assert ProcessingJob.objects.filter(recording=completed).exists()
+
+    # Listed a page at a time, not fetched call by call, except for the call
+    # the listing didn't find
+    paths = [path.split("?")[0] for path in twilio_api.requests]
+    assert {path.rsplit("/", 1)[1] for path in paths} == {
+        "Calls.json",
+        "Recordings.json",
+        "CA6.json",
+    }
+    assert paths.count(paths[0]) == 3
+
+
+@pytest.mark.django_db
+def test_sparse_stale_recordings_are_fetched_one_by_one(twilio_api):
+    # Weeks apart, so listing every call in between would cost far more
+    completed = stale_recording("CA1", hours_ago=24 * 20)
+    busy = stale_recording("CA2", hours_ago=24 * 10)
+    unknown = stale_recording("CA3")
+    twilio_api.calls = [twilio_call(completed, "completed"), twilio_call(busy, "busy")]
+    twilio_api.recordings = [
+        twilio_recording(busy, "RE2", status="absent"),
+        twilio_recording(completed, "RE1"),
+    ]
+
+    assert reap_stale_recordings(timedelta(hours=2)) == {
+        "complete": 1,
+        "failed": 1,
+        "unresolved": 1,
+    }
+    completed.refresh_from_db()
+    assert completed.twilio_recording_sid == "RE1"
+    unknown.refresh_from_db()
+    assert unknown.status == Recording.Status.IN_PROGRESS
+    paths = [path.split("?")[0].rsplit("/", 1)[1] for path in twilio_api.requests]
+    assert paths == ["CA1.json", "Recordings.json", "CA2.json", "CA3.json"]
+
+
+@pytest.mark.django_db
+def test_calls_placed_long_after_their_recording_are_reconciled(twilio_api):
+    # Queued late in a long campaign
+    recordings = [stale_recording(f"CA{i}", hours_ago=30) for i in range(6)]
+    twilio_api.calls = [
+        {**twilio_call(rec, "busy"), "start_time": rec.created_at + timedelta(hours=20)}
+        for rec in recordings
+    ]
+    assert reap_stale_recordings(timedelta(hours=2)) == {"failed": 6}
+
+
+@pytest.mark.django_db
+def test_calls_are_listed_around_when_they_were_placed(twilio_api):
+    recordings = [stale_recording(f"CA{i}", hours_ago=30) for i in range(6)]
+    for rec in recordings:
+        rec.placed_at = rec.created_at + timedelta(hours=20)
+        rec.save(update_fields=["placed_at", "updated_at"])
+    twilio_api.calls = [
+        {**twilio_call(rec, "busy"), "start_time": rec.placed_at + timedelta(seconds=5)}
+        for rec in recordings
+    ]
+    assert reap_stale_recordings(timedelta(hours=2)) == {"failed": 6}
+    # Found by the listing, rather than call by call
+    assert [path.split("?")[0].rsplit("/", 1)[1] for path in twilio_api.requests] == [
+        "Calls.json"
+    ]
+
+
+@pytest.mark.django_db
+def test_reaping_is_resumable(twilio_api):
+    recordings = [stale_recording(f"CA{i}") for i in range(5)]
+    twilio_api.calls = [twilio_call(rec, "ringing") for rec in recordings]
+
+    # Unresolved recordings don't come round again within a run
+    assert reap_stale_recordings(timedelta(hours=2), batch_size=2) == {"unresolved": 5}
+
+    # Once Twilio has an answer, the next run resolves them
+    twilio_api.calls = [twilio_call(rec, "no-answer") for rec in recordings]
+    assert reap_stale_recordings(timedelta(hours=2), batch_size=2) == {"failed": 5}
+    assert reap_stale_recordings(timedelta(hours=2), batch_size=2) == {}
+
+
+@pytest.mark.django_db
+def test_webhooks_win_races(twilio_api, monkeypatch):
+    rec = stale_recording("CA1")
+
+    # A webhook completes the recording while we're asking Twilio about it
+    def reconcile(account_sid, recordings):
+        Recording.objects.filter(pk=rec.pk).update(
+            status=Recording.Status.COMPLETE, twilio_recording_sid="RE1"
+        )
+        return {rec.pk: (Recording.Status.FAILED, "")}
+
+    monkeypatch.setattr(reaper, "_reconcile", reconcile)
+    assert reap_stale_recordings(timedelta(hours=2)) == {}
+
+    rec.refresh_from_db()
+    assert rec.status == Recording.Status.COMPLETE
+    assert rec.twilio_recording_sid == "RE1"
+
+
+@pytest.mark.django_db
+def test_reap_stale_calls_command(twilio_api, capsys):
+    rec = stale_recording("CA1", hours_ago=1)
+    twilio_api.calls = [twilio_call(rec, "failed")]
+
+    call_command("reap_stale_calls")
+    assert capsys.readouterr().out == "0 completed, 0 failed, 0 still in progress\n"
+
+    call_command("reap_stale_calls", "--older-than", "30")
+    assert capsys.readouterr().out == "0 completed, 1 failed, 0 still in progress\n"
@@ -0,0 +1,72 @@
+import math
+import struct
+
+import pytest
+from django.contrib.staticfiles import finders
+from django.test import RequestFactory
+
+from voice_recordings import telephony
+from voice_recordings.staticfiles import OptimizedStaticFilesStorage
+from voice_recordings.twiml import GREETING, build_call_started_twiml
+
+
+def sine(frequency: float, rate: int, seconds: float = 0.5) -> list[float]:
+    return [
+        0.5 * math.sin(2 * math.pi * frequency * i / rate)
+        for i in range(int(rate * seconds))
+    ]
+
+
+def rms(samples: list[float]) -> float:
+    # Ignore the edges, where the filter runs off the end of the input
+    samples = samples[100:-100]
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+@pytest.mark.parametrize("rate", [44100, 48000])
+def test_resample_filters_above_nyquist(rate):
+    # Speech band frequencies survive...
+    assert rms(telephony.resample(sine(1000, rate), rate, 8000)) == pytest.approx(
+        0.5 / math.sqrt(2), rel=0.02
+    )
+    # ...but anything the phone can't carry is filtered out, rather than
+    # aliasing back into the speech band.
+    assert rms(telephony.resample(sine(6000, rate), rate, 8000)) < 0.01
+
+
+def test_encode_ulaw():
+    assert telephony.encode_ulaw([0, 1, -1, 2]) == b"\xff\x80\x00\x80"
+
+
+def test_greeting_variants():
+    with open(finders.find(GREETING), "rb") as f:
+        original = f.read()
+    samples, rate = telephony.read_aiff(original)
+    assert rate == 48000
+    resampled = telephony.resample(samples, rate, telephony.TELEPHONY_RATE)
+
+    wav = telephony.ulaw_wav(resampled)
+    assert wav[:4] == b"RIFF" and wav[8:12] == b"WAVE"
+    # mu-law, mono, 8 kHz
+    assert struct.unpack("<HHI", wav[20:28]) == (7, 1, 8000)
+    assert len(wav) < len(original) / 10
+
+    aifc = telephony.ulaw_aifc(resampled)
+    assert aifc[:4] == b"FORM" and aifc[8:12] == b"AIFC"
+    # COMM chunk, after FVER: mono, frame count, and mu-law compression
+    assert aifc[24:28] == b"COMM"
+    assert struct.unpack(">hI", aifc[32:38]) == (1, len(resampled))
+    assert aifc[50:54] == b"ulaw"
+    assert len(aifc) < len(original) / 10
+
+
+def test_collectstatic_builds_smallest_greeting():
+    storage = OptimizedStaticFilesStorage()
+    greeting = storage.smallest_variant(GREETING)
+    assert greeting == "voice_recordings/greeting.8k.wav"
+    assert storage.size(storage.stored_name(greeting)) < (
+        storage.size(storage.stored_name(GREETING)) / 10
+    )
+
+    twiml = build_call_started_twiml(RequestFactory().post("/"), 1)
+    assert storage.url(greeting) in twiml
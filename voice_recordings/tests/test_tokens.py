@@ -0,0 +1,74 @@
+import time
+
+import pytest
+from django.core.signing import BadSignature, SignatureExpired
+from django.urls import reverse
+
+from voice_recordings.models import Recording
+from voice_recordings.tokens import TOKEN_LENGTH, make_token, read_token
+
+
+def test_token_round_trip():
+    token = make_token(42)
+    assert len(token) == TOKEN_LENGTH
+    assert read_token(token) == 42
+
+
+def test_tampered_token():
+    token = make_token(42)
+    tampered = ("B" if token[0] == "A" else "A") + token[1:]
+    with pytest.raises(BadSignature):
+        read_token(tampered)
+    with pytest.raises(BadSignature):
+        read_token("not a token")
+
+
+def test_expired_token(settings, monkeypatch):
+    token = make_token(42)
+    now = time.time()
+    monkeypatch.setattr(
+        "voice_recordings.tokens.time.time",
+        lambda: now + settings.RECORDING_TOKEN_MAX_AGE + 24 * 60 * 60,
+    )
+    with pytest.raises(SignatureExpired):
+        read_token(token)
+
+
+def test_token_signed_with_old_key(settings):
+    token = make_token(42)
+    settings.SECRET_KEY_FALLBACKS = [settings.SECRET_KEY]
+    settings.SECRET_KEY = "new-secret-key"
+    assert read_token(token) == 42
+
+
+@pytest.mark.django_db
+def test_recording_urls_use_tokens(client):
+    rec = Recording.objects.create(phone_number="1234567890")
+    url = reverse("recording", args=[rec.pk])
+
+    assert url == f"/recording/{make_token(rec.pk)}/"
+    assert client.get(url).status_code == 200
+
+
+@pytest.mark.django_db
+def test_forged_recording_urls_404_without_queries(
+    client, settings, django_assert_num_queries
+):
+    rec = Recording.objects.create(phone_number="1234567890")
+    settings.SECRET_KEY = "someone-else's-key"
+    forged = reverse("recording_status", args=[rec.pk])
+    settings.SECRET_KEY = "our-key"
+
+    with django_assert_num_queries(0):
+        assert client.get(forged).status_code == 404
+
+
+@pytest.mark.django_db
+def test_integer_recording_urls(client, settings):
+    rec = Recording.objects.create(phone_number="1234567890")
+    url = f"/recording/{rec.pk}/status/"
+
+    assert client.get(url).status_code == 200
+
+    settings.RECORDING_INT_URLS = False
+    assert client.get(url).status_code == 404
@@ -0,0 +1,159 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile
+from django.urls import reverse
+
+from voice_recordings import transcribers, transcription
+from voice_recordings.models import ProcessingJob, Recording, WebhookEvent
+from voice_recordings.processing import run_next_job
+from voice_recordings.webhooks import process_webhook_events, record_webhook_event
+
+RATE = 8000
+
+
+def bursts(*seconds: float) -> np.ndarray:
+    """
+    Half scale tones of the given lengths, each followed by half a second of
+    silence.
+    """
+    parts = []
+    for length in seconds:
+        t = np.arange(round(length * RATE)) / RATE
+        parts += [0.5 * np.sin(2 * np.pi * 440 * t), np.zeros(RATE // 2)]
+    return np.concatenate(parts).astype(np.float32)
+
+
+@pytest.fixture
+def short_chunks(monkeypatch):
+    monkeypatch.setattr(transcription, "CHUNK_SECONDS", 2)
+    monkeypatch.setattr(transcription, "MIN_CHUNK_SECONDS", 1)
+    monkeypatch.setattr(transcription, "MAX_CHUNK_SECONDS", 3)
+
+
+@pytest.fixture
+def stub_engine(settings):
+    settings.TRANSCRIPTION_ENGINE = {
+        "BACKEND": "voice_recordings.transcribers.StubEngine",
+        "OPTIONS": {},
+    }
+    yield
+    transcription.shutdown_pool()
+
+
+def complete_recording(twilio_api, settings, samples: np.ndarray) -> Recording:
+    file = io.BytesIO()
+    soundfile.write(file, samples, RATE, format="MP3")
+    twilio_api.files[
+        f"/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Recordings/RE123.mp3"
+    ] = file.getvalue()
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    record_webhook_event(
+        rec.pk,
+        WebhookEvent.Kind.RECORDING,
+        {"RecordingSid": "RE123", "RecordingStatus": "completed"},
+    )
+    process_webhook_events()
+    return rec
+
+
+def test_split_at_pauses(short_chunks):
+    samples = bursts(1, 1.5, 2.5, 0.5)
+    # Pauses are at 1.25, 3.25, 6.25 and 7.25 seconds
+    assert [
+        (start / RATE, end / RATE) for start, end in transcription.split(samples, RATE)
+    ] == [(0, 1.25), (1.25, 3.25), (3.25, 6.25), (6.25, 7.5)]
+
+
+def test_split_without_pauses(short_chunks):
+    samples = np.full(7 * RATE, 0.5, dtype=np.float32)
+    assert transcription.split(samples, RATE) == [
+        (0, 3 * RATE),
+        (3 * RATE, 6 * RATE),
+        (6 * RATE, 7 * RATE),
+    ]
+    assert transcription.split(samples[:100], RATE) == [(0, 100)]
+    assert transcription.split(samples[:0], RATE) == [(0, 0)]
+
+
+@pytest.mark.django_db
+def test_completed_recordings_are_transcribed(
+    twilio_api,
+    settings,
+    client,
+    short_chunks,
+    stub_engine,
+    django_capture_on_commit_callbacks,
+):
+    settings.TRANSCRIPTION_PROCESSES = 2
+    rec = complete_recording(twilio_api, settings, bursts(1, 1.5, 2))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        while run_next_job():
+            pass
+    assert not ProcessingJob.objects.exists()
+
+    rec.refresh_from_db()
+    assert not rec.transcript_chunks.exists()
+    # In order, with the stub's descriptions of each chunk
+    assert [segment["start"] for segment in rec.transcript] == pytest.approx(
+        [0, 1.25, 3.25], abs=0.1
+    )
+    texts = [segment["text"] for segment in rec.transcript]
+    assert texts[0].startswith("(1.") and "seconds of sound" in texts[0]
+    assert texts[2].startswith("(2.") and len(texts) == 3
+
+    content = client.get(reverse("recording", args=[rec.pk])).content.decode()
+    assert "Transcript" in content
+    assert "0:03" in content and texts[2] in content
+    assert "Transcribing the rest" not in content
+
+
+@pytest.mark.django_db
+def test_partial_transcripts(
+    twilio_api,
+    settings,
+    client,
+    monkeypatch,
+    short_chunks,
+    stub_engine,
+    django_capture_on_commit_callbacks,
+):
+    settings.TRANSCRIPTION_PROCESSES = 1
+    rec = complete_recording(twilio_api, settings, bursts(1, 1.5, 2))
+    with django_capture_on_commit_callbacks(execute=True):
+        for _ in range(3):
+            run_next_job()
+    assert ProcessingJob.objects.get().step == ProcessingJob.Step.TRANSCRIBE
+
+    calls = []
+    transcribe = transcribers.StubEngine.transcribe
+
+    def fail_on_second_chunk(self, samples, sample_rate):
+        calls.append(len(samples))
+        if len(calls) == 2:
+            raise RuntimeError("Out of memory")
+        return transcribe(self, samples, sample_rate)
+
+    monkeypatch.setattr(transcribers.StubEngine, "transcribe", fail_on_second_chunk)
+    with django_capture_on_commit_callbacks(execute=True):
+        run_next_job()
+
+    # The first chunk is kept, and shown
+    rec.refresh_from_db()
+    assert rec.transcript is None
+    assert rec.transcript_chunks.get().index == 0
+    content = client.get(reverse("recording", args=[rec.pk])).content.decode()
+    assert "seconds of sound" in content
+    assert "Transcribing the rest" in content
+
+    # And isn't transcribed again
+    ProcessingJob.objects.update(run_at=rec.created_at)
+    with django_capture_on_commit_callbacks(execute=True):
+        run_next_job()
+    assert len(calls) == 4
+    rec.refresh_from_db()
+    assert len(rec.transcript) == 3
+    content = client.get(reverse("recording", args=[rec.pk])).content.decode()
+    assert "Transcribing the rest" not in content
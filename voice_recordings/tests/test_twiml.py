@@ -0,0 +1,25 @@
+import pytest
+from django.test import RequestFactory
+
+from voice_recordings.twiml import build_call_started_twiml, call_started_twiml
+
+
+@pytest.mark.parametrize("host", ["testserver", "example.ngrok-free.app"])
+@pytest.mark.parametrize("secure", [False, True])
+@pytest.mark.parametrize("recording_id", [1, 42, 9876543210])
+def test_precompiled_twiml_matches_voice_response(settings, host, secure, recording_id):
+    settings.ALLOWED_HOSTS = [host]
+    request = RequestFactory().post("/", secure=secure, headers={"Host": host})
+
+    expected = build_call_started_twiml(request, recording_id).encode()
+    assert call_started_twiml(request, recording_id) == expected
+    # Served from the compiled template the second time round
+    assert call_started_twiml(request, recording_id) == expected
+
+
+def test_precompiled_twiml_invalidated_by_settings(settings):
+    request = RequestFactory().post("/")
+    call_started_twiml(request, 1)
+
+    settings.STATIC_URL = "https://cdn.example.com/static/"
+    assert b"https://cdn.example.com/static/" in call_started_twiml(request, 1)
@@ -1,7 +1,16 @@
+import asyncio
+import re
+
 import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.templatetags.static import static
+from django.test import Client
 from django.urls import reverse
+from django.utils.module_loading import import_string
 
 from voice_recordings.models import Recording
+from voice_recordings.webhooks import process_webhook_events
 
 
 def test_form_get(client):
@@ -11,29 +20,27 @@ def test_form_get(client):
 
 
 @pytest.mark.django_db
-def test_form_post_places_call(monkeypatch, client, settings):
-    # Monkeypatch Twilio Client.calls.create to avoid network calls
-    fake_sid = "FAKE_CALL_SID"
-    tel = "123-456-7890"
+def test_form_get_is_cached_with_fresh_csrf_token():
+    client = Client(enforce_csrf_checks=True)
+    url = reverse("form")
 
-    class DummyCall:
-        sid = fake_sid
+    tokens = []
+    for _ in range(2):
+        html = client.get(url).content.decode()
+        match = re.search(r'name="csrfmiddlewaretoken" value="(\w+)"', html)
+        tokens.append(match.group(1))
+    # Tokens are masked differently every time
+    assert tokens[0] != tokens[1]
 
-    class DummyCalls:
-        def create(self, to, from_, url):
-            # Check that number is normalized
-            assert to == "+11234567890"
-            assert from_ == settings.TWILIO_FROM_NUMBER
-            assert url.startswith("http")
-            return DummyCall()
+    response = client.post(
+        url, {"tel": "123-456-7890", "csrfmiddlewaretoken": tokens[1]}
+    )
+    assert response.status_code == 302
 
-    class DummyClient:
-        def __init__(self, sid, token):
-            assert sid == settings.TWILIO_ACCOUNT_SID
-            assert token == settings.TWILIO_AUTH_TOKEN
-            self.calls = DummyCalls()
 
-    monkeypatch.setattr("voice_recordings.views.Client", DummyClient)
+@pytest.mark.django_db
+def test_form_post_enqueues_call(client):
+    tel = "123-456-7890"
 
     # Create POST request
     url = reverse("form")
@@ -44,9 +51,16 @@ def test_form_post_places_call(monkeypatch, client, settings):
     assert response.status_code == 302
     assert response.url == reverse("recording", args=[recording.pk])
 
-    # DB saved
+    # DB saved, call queued but not yet placed
     assert recording.phone_number == tel
-    assert recording.twilio_call_sid == fake_sid
+    assert recording.twilio_call_sid == ""
+    webhook_url = reverse("call_started_webhook", args=[recording.pk])
+    assert recording.call_job.webhook_url == f"http://testserver{webhook_url}"
+    status_callback_url = reverse("call_status_updated_webhook", args=[recording.pk])
+    assert (
+        recording.call_job.status_callback_url
+        == f"http://testserver{status_callback_url}"
+    )
 
 
 @pytest.mark.django_db
@@ -57,6 +71,40 @@ def test_recording_get(client):
     assert response.status_code == 200
 
 
+@pytest.mark.django_db
+def test_finished_recording_page_is_cached(
+    client, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    rec = Recording.objects.create(
+        phone_number="1234567890",
+        status=Recording.Status.COMPLETE,
+        twilio_recording_sid="RE123",
+    )
+    url = reverse("recording", args=[rec.pk])
+
+    response = client.get(url)
+    assert response.context is not None
+    etag, last_modified = response["ETag"], response["Last-Modified"]
+
+    with django_assert_num_queries(0):
+        response = client.get(url)
+    # Served without rendering the template
+    assert response.context is None
+    assert response["ETag"] == etag
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert (
+        client.get(url, headers={"If-Modified-Since": last_modified}).status_code == 304
+    )
+
+    # Writing the recording evicts its page
+    rec.media_name = "RE123.mp3"
+    with django_capture_on_commit_callbacks(execute=True):
+        rec.save()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert reverse("recording_audio", args=[rec.pk]) in response.content.decode()
+
+
 @pytest.mark.django_db
 def test_call_started_webhook_generates_twiml(client):
     rec = Recording.objects.create(phone_number="1234567890")
@@ -75,8 +123,9 @@ def test_recording_status_updated_webhook_get_updates_recording(client):
     url = reverse("recording_status_updated_webhook", args=[rec.pk])
     params = {"RecordingStatus": "completed", "RecordingSid": "RS12345"}
     response = client.get(url, params)
-    rec.refresh_from_db()
     assert response.status_code == 200
+    process_webhook_events()
+    rec.refresh_from_db()
     assert rec.status == Recording.Status.COMPLETE
     assert rec.twilio_recording_sid == "RS12345"
 
@@ -87,11 +136,41 @@ def test_recording_status_updated_webhook_post_noop(client):
     url = reverse("recording_status_updated_webhook", args=[rec.pk])
     # Status is not 'completed', so it should not change
     response = client.post(url, {"RecordingStatus": "in-progress"})
-    rec.refresh_from_db()
     assert response.status_code == 200
+    process_webhook_events()
+    rec.refresh_from_db()
     assert rec.status != Recording.Status.COMPLETE
 
 
+@pytest.mark.django_db
+def test_call_status_updated_webhook_fails_unanswered_call(client):
+    rec = Recording.objects.create(phone_number="1234567890")
+    url = reverse("call_status_updated_webhook", args=[rec.pk])
+    response = client.post(url, {"CallSid": "CA12345", "CallStatus": "no-answer"})
+    assert response.status_code == 200
+    process_webhook_events()
+    rec.refresh_from_db()
+    assert rec.status == Recording.Status.FAILED
+
+
+@pytest.mark.django_db
+def test_webhooks_routed_by_sid(client):
+    rec = Recording.objects.create(phone_number="1234567890", twilio_call_sid="CA1")
+    Recording.objects.create(phone_number="1234567890", twilio_call_sid="CA2")
+
+    url = reverse("sid_recording_status_updated_webhook")
+    params = {"CallSid": "CA1", "RecordingSid": "RE1", "RecordingStatus": "completed"}
+    assert client.post(url, params).status_code == 200
+    process_webhook_events()
+    rec.refresh_from_db()
+    assert rec.status == Recording.Status.COMPLETE
+    assert rec.twilio_recording_sid == "RE1"
+
+    url = reverse("sid_call_status_updated_webhook")
+    params = {"CallSid": "CA3", "CallStatus": "completed"}
+    assert client.post(url, params).status_code == 404
+
+
 @pytest.mark.django_db
 def test_recording_status_view(client):
     rec = Recording.objects.create(
@@ -101,4 +180,199 @@ def test_recording_status_view(client):
     response = client.get(url)
     assert response.status_code == 200
     assert response["Content-Type"] == "text/plain"
-    assert response.content.decode() == Recording.Status.COMPLETE
+    assert response.content.decode() == "COMPLETE"
+
+
+@pytest.mark.django_db
+def test_recording_status_view_is_cached(
+    client, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    rec = Recording.objects.create(phone_number="1234567890")
+    url = reverse("recording_status", args=[rec.pk])
+
+    with django_assert_num_queries(1):
+        assert client.get(url).content.decode() == "IN_PROGRESS"
+    with django_assert_num_queries(0):
+        assert client.get(url).content.decode() == "IN_PROGRESS"
+
+    # Status updates are written through to the cache
+    webhook_url = reverse("recording_status_updated_webhook", args=[rec.pk])
+    params = {"RecordingStatus": "completed", "RecordingSid": "RS12345"}
+    client.get(webhook_url, params)
+    with django_capture_on_commit_callbacks(execute=True):
+        process_webhook_events()
+    with django_assert_num_queries(0):
+        assert client.get(url).content.decode() == "COMPLETE"
+
+
+@pytest.mark.django_db
+def test_recording_status_view_conditional_get(client):
+    rec = Recording.objects.create(phone_number="1234567890")
+    url = reverse("recording_status", args=[rec.pk])
+
+    response = client.get(url)
+    assert response["Cache-Control"] == "no-cache"
+    etag = response["ETag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_recording_page_uses_events_when_served_over_asgi(client, async_client):
+    rec = Recording.objects.create(phone_number="1234567890")
+    url = reverse("recording", args=[rec.pk])
+    events_url = reverse("recording_events", args=[rec.pk])
+
+    response = client.get(url)
+    assert response.context["events_url"] is None
+
+    response = async_to_sync(async_client.get)(url)
+    assert response.context["events_url"] == events_url
+
+
+@pytest.mark.django_db
+def test_recording_events_finished_recording(async_client):
+    rec = Recording.objects.create(
+        phone_number="1234567890", status=Recording.Status.COMPLETE
+    )
+    url = reverse("recording_events", args=[rec.pk])
+
+    @async_to_sync
+    async def read_events():
+        response = await async_client.get(url)
+        assert response["Content-Type"] == "text/event-stream"
+        return [chunk async for chunk in response.streaming_content]
+
+    assert read_events() == [b"event: status\ndata: COMPLETE\n\n"]
+
+
+@pytest.mark.django_db
+def test_recording_events_pushes_status_updates(
+    async_client, django_capture_on_commit_callbacks
+):
+    rec = Recording.objects.create(phone_number="1234567890")
+    url = reverse("recording_events", args=[rec.pk])
+
+    @sync_to_async
+    def complete_recording():
+        with django_capture_on_commit_callbacks(execute=True):
+            rec.status = Recording.Status.COMPLETE
+            rec.save()
+
+    @async_to_sync
+    async def read_events():
+        response = await async_client.get(url)
+        events = aiter(response.streaming_content)
+        chunks = [await anext(events)]
+        await complete_recording()
+        chunks += [chunk async for chunk in events]
+        return chunks
+
+    assert read_events() == [
+        b"event: status\ndata: IN_PROGRESS\n\n",
+        b"event: status\ndata: COMPLETE\n\n",
+    ]
+
+
+def test_middleware_runs_async(settings):
+    # Under ASGI, a single sync-only middleware puts every request on a thread
+    for path in settings.MIDDLEWARE:
+        assert import_string(path).async_capable, path
+
+
+@pytest.mark.django_db
+def test_webhooks_and_status_over_asgi(
+    async_client, django_capture_on_commit_callbacks
+):
+    rec = Recording.objects.create(phone_number="1234567890", twilio_call_sid="CA1")
+    status_url = reverse("recording_status", args=[rec.pk])
+
+    @sync_to_async
+    def process_webhooks():
+        with django_capture_on_commit_callbacks(execute=True):
+            process_webhook_events()
+
+    @async_to_sync
+    async def complete_call():
+        url = reverse("sid_recording_status_updated_webhook")
+        params = {
+            "CallSid": "CA1",
+            "RecordingSid": "RE1",
+            "RecordingStatus": "completed",
+        }
+        response = await async_client.post(url, params)
+        assert response.status_code == 200
+        response = await async_client.get(status_url)
+        assert response.content == b"IN_PROGRESS"
+
+        await process_webhooks()
+        response = await async_client.get(status_url)
+        assert response.content == b"COMPLETE"
+        response = await async_client.get(reverse("recording", args=[rec.pk]))
+        assert b"Recording complete!" in response.content
+
+        # Static files are still served by WhiteNoise
+        response = await async_client.get(static("voice_recordings/logo.png"))
+        assert response["Content-Type"] == "image/png"
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        assert content.startswith(b"\x89PNG")
+        response.close()
+
+    complete_call()
+
+
+@async_to_sync
+async def asgi_request(method: str, path: str, headers=()) -> list[dict]:
+    """
+    Send a request straight through Django's ASGI handler, and return the
+    messages it sends back. Unlike the test client, this doesn't drop the
+    body of HEAD and 304 responses itself.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), *headers],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+    body_sent = False
+    messages = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client stays connected
+        await asyncio.Future()
+
+    async def send(message):
+        messages.append(message)
+
+    await ASGIHandler()(scope, receive, send)
+    return messages
+
+
+@pytest.mark.django_db
+def test_static_revalidation_and_head_over_asgi():
+    path = static("voice_recordings/logo.png")
+    messages = asgi_request("GET", path)
+    assert messages[0]["status"] == 200
+    headers = {name.lower(): value for name, value in messages[0]["headers"]}
+    etag = headers[b"etag"]
+
+    messages = asgi_request("GET", path, [(b"if-none-match", etag)])
+    assert messages[0]["status"] == 304
+    assert b"".join(message.get("body", b"") for message in messages[1:]) == b""
+
+    messages = asgi_request("HEAD", path)
+    assert messages[0]["status"] == 200
+    assert b"".join(message.get("body", b"") for message in messages[1:]) == b""
@@ -0,0 +1,109 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile
+from django.urls import reverse
+
+from voice_recordings import waveforms
+from voice_recordings.media import get_storage
+from voice_recordings.models import ProcessingJob, Recording, WebhookEvent
+from voice_recordings.processing import run_next_job
+from voice_recordings.webhooks import process_webhook_events, record_webhook_event
+
+RATE = 8000
+
+
+def encode_audio(samples: np.ndarray, format: str = "MP3") -> bytes:
+    file = io.BytesIO()
+    soundfile.write(file, samples, RATE, format=format)
+    return file.getvalue()
+
+
+def tone_then_silence() -> np.ndarray:
+    """
+    A second of a half scale 440 Hz tone, then a second of silence.
+    """
+    t = np.arange(RATE) / RATE
+    tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+    return np.concatenate([tone, np.zeros(RATE)]).astype(np.float32)
+
+
+def test_analyze(monkeypatch):
+    # Several blocks, that don't line up with the peaks
+    monkeypatch.setattr(waveforms, "BLOCK_SIZE", 1000)
+    # Lossless, so that levels are exact
+    audio = encode_audio(tone_then_silence(), format="WAV")
+    waveform = waveforms.analyze(io.BytesIO(audio))
+
+    assert waveform.sample_rate == RATE
+    assert waveform.duration == 2
+    # Half as loud as a full scale tone (-3 dB) for half the time (another -3)
+    assert waveform.loudness == pytest.approx(-12, abs=0.1)
+
+    assert [len(level) for level in waveform.levels] == list(waveforms.LEVELS)
+    for level in waveform.levels:
+        half = len(level) // 2
+        # The finest peaks are shorter than the tone's period, so may miss its crest
+        assert level[1 : half - 1] == pytest.approx(0.5, abs=0.03)
+        assert level[half + 1 :] == pytest.approx(0)
+
+    decoded = waveforms.decode(waveforms.encode(waveform))
+    assert (decoded.sample_rate, decoded.frames) == (RATE, waveform.frames)
+    for level, decoded_level in zip(waveform.levels, decoded.levels, strict=True):
+        assert decoded_level == pytest.approx(level, abs=1 / 255)
+
+
+def test_analyze_short_recording():
+    audio = encode_audio(np.full(100, 0.25), format="WAV")
+    waveform = waveforms.analyze(io.BytesIO(audio))
+    # One peak per frame, at most
+    assert [len(level) for level in waveform.levels] == [100, 100, 100]
+    assert waveform.levels[0] == pytest.approx(0.25)
+
+
+@pytest.mark.django_db
+def test_completed_recordings_are_analyzed(
+    twilio_api, settings, client, django_capture_on_commit_callbacks
+):
+    twilio_api.files[
+        f"/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Recordings/RE123.mp3"
+    ] = encode_audio(tone_then_silence())
+    rec = Recording.objects.create(phone_number="123-456-7890")
+    record_webhook_event(
+        rec.pk,
+        WebhookEvent.Kind.RECORDING,
+        {"RecordingSid": "RE123", "RecordingStatus": "completed"},
+    )
+    process_webhook_events()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert run_next_job()
+        assert run_next_job()
+    # Encoded next, see test_encoding
+    assert ProcessingJob.objects.get().step == ProcessingJob.Step.ENCODE_AUDIO
+
+    rec.refresh_from_db()
+    assert rec.peaks_name == "RE123.mp3.peaks"
+    assert rec.duration_display == "0:02"
+    assert rec.loudness < -10
+
+    url = reverse("recording_peaks", args=[rec.pk])
+    response = client.get(url)
+    assert response["Content-Type"] == "application/octet-stream"
+    assert "max-age=3600" in response["Cache-Control"]
+    content = b"".join(response.streaming_content)
+    assert waveforms.decode(content).frames == pytest.approx(2 * RATE, abs=100)
+    assert (
+        client.get(url, headers={"If-None-Match": response["ETag"]}).status_code == 304
+    )
+
+    response = client.get(reverse("recording", args=[rec.pk]))
+    content = response.content.decode()
+    assert f'data-peaks-url="{url}"' in content
+    assert "0:02" in content
+
+    # Deleted along with the recording
+    with django_capture_on_commit_callbacks(execute=True):
+        rec.delete()
+    assert not get_storage().exists("RE123.mp3.peaks")
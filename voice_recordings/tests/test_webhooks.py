@@ -0,0 +1,91 @@
+import pytest
+
+from voice_recordings.models import Recording, WebhookEvent
+from voice_recordings.signals import recording_updated
+from voice_recordings.webhooks import process_webhook_events, record_webhook_event
+
+
+@pytest.fixture
+def saved_recordings():
+    """
+    Record the ids of recordings as they're saved.
+    """
+    saved = []
+
+    def receiver(sender, recording, **kwargs):
+        saved.append(recording.pk)
+
+    recording_updated.connect(receiver)
+    yield saved
+    recording_updated.disconnect(receiver)
+
+
+def recording_event(recording, status, sid="RS1"):
+    record_webhook_event(
+        recording.pk,
+        WebhookEvent.Kind.RECORDING,
+        {"RecordingSid": sid, "RecordingStatus": status},
+    )
+
+
+def call_event(recording, status, sid="CA1"):
+    record_webhook_event(
+        recording.pk,
+        WebhookEvent.Kind.CALL,
+        {"CallSid": sid, "CallStatus": status},
+    )
+
+
+@pytest.mark.django_db
+def test_duplicate_events_are_coalesced(saved_recordings):
+    rec = Recording.objects.create(phone_number="1234567890")
+    other = Recording.objects.create(phone_number="1234567890")
+    saved_recordings.clear()
+
+    # Twilio retrying the same callback, and the call ending after the
+    # recording completed
+    for _ in range(5):
+        recording_event(rec, "completed")
+    call_event(rec, "completed")
+    call_event(other, "busy")
+    call_event(other, "busy")
+
+    assert process_webhook_events() == 8
+    assert process_webhook_events() == 0
+
+    rec.refresh_from_db()
+    other.refresh_from_db()
+    assert rec.status == Recording.Status.COMPLETE
+    assert rec.twilio_recording_sid == "RS1"
+    assert other.status == Recording.Status.FAILED
+    assert sorted(saved_recordings) == [rec.pk, other.pk]
+    assert not WebhookEvent.objects.filter(processed_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_completed_recordings_stay_complete(saved_recordings):
+    rec = Recording.objects.create(phone_number="1234567890")
+    recording_event(rec, "completed")
+    process_webhook_events()
+    saved_recordings.clear()
+
+    # Late or out-of-order events don't undo the completed recording
+    call_event(rec, "failed")
+    recording_event(rec, "absent", sid="RS2")
+    process_webhook_events()
+
+    rec.refresh_from_db()
+    assert rec.status == Recording.Status.COMPLETE
+    assert rec.twilio_recording_sid == "RS1"
+    assert saved_recordings == []
+
+
+@pytest.mark.django_db
+def test_absent_recording_fails(saved_recordings):
+    rec = Recording.objects.create(phone_number="1234567890")
+    recording_event(rec, "absent")
+    process_webhook_events()
+
+    rec.refresh_from_db()
+    assert rec.status == Recording.Status.FAILED
+    assert rec.twilio_recording_sid == ""
@@ -0,0 +1,104 @@
+"""
+Signed tokens identifying recordings in URLs, in place of their integer ids.
+
+A token holds the recording id and an expiry date, signed with SECRET_KEY.
+Tokens are checked when the URL is resolved (see `RecordingTokenConverter`),
+so forged, tampered with or expired URLs 404 without touching the database,
+and valid ones resolve straight to a primary key lookup.
+
+Tokens are 27 URL-safe characters: 8 bytes of id, 2 bytes of expiry (in days
+since the epoch) and a 10 byte HMAC, base64 encoded. Expiry dates are rounded
+up to a whole day, so a recording's token only changes once a day, and cached
+pages and TwiML stay valid for at least `RECORDING_TOKEN_MAX_AGE`.
+"""
+
+import base64
+import binascii
+import math
+import struct
+import time
+
+from django.conf import settings
+from django.core.signing import BadSignature, SignatureExpired
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+SALT = "voice_recordings.tokens"
+DAY = 24 * 60 * 60
+MAC_SIZE = 10
+PAYLOAD = struct.Struct(">QH")
+TOKEN_LENGTH = math.ceil((PAYLOAD.size + MAC_SIZE) * 4 / 3)
+
+
+def make_token(recording_id: int) -> str:
+    expires = math.ceil((time.time() + settings.RECORDING_TOKEN_MAX_AGE) / DAY)
+    payload = PAYLOAD.pack(recording_id, expires)
+    token = payload + _mac(payload, settings.SECRET_KEY)
+    return base64.urlsafe_b64encode(token).rstrip(b"=").decode()
+
+
+def read_token(token: str) -> int:
+    """
+    Return the recording id in the given token. Raises BadSignature if the
+    token wasn't made by us, or SignatureExpired if it has expired.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError) as e:
+        raise BadSignature("Malformed recording token") from e
+    payload, mac = data[: PAYLOAD.size], data[PAYLOAD.size :]
+    if len(mac) != MAC_SIZE:
+        raise BadSignature("Malformed recording token")
+
+    # Accept tokens signed with keys being rotated out, like Django's signer
+    keys = [settings.SECRET_KEY, *settings.SECRET_KEY_FALLBACKS]
+    if not any(constant_time_compare(mac, _mac(payload, key)) for key in keys):
+        raise BadSignature("Recording token signature does not match")
+
+    recording_id, expires = PAYLOAD.unpack(payload)
+    if expires * DAY < time.time():
+        raise SignatureExpired("Recording token has expired")
+    return recording_id
+
+
+def _mac(payload: bytes, key: str) -> bytes:
+    mac = salted_hmac(SALT, payload, secret=key, algorithm="sha256")
+    return mac.digest()[:MAC_SIZE]
+
+
+class RecordingTokenConverter:
+    """
+    URL converter between recording tokens and recording ids. Reversing a URL
+    with a recording id makes a token for it; strings are assumed to be
+    tokens already.
+    """
+
+    regex = f"[A-Za-z0-9_-]{{{TOKEN_LENGTH}}}"
+
+    def to_python(self, value: str) -> int:
+        try:
+            return read_token(value)
+        except BadSignature as e:
+            # Resolves as if the URL didn't match, i.e. 404
+            raise ValueError(str(e)) from e
+
+    def to_url(self, value) -> str:
+        if isinstance(value, int):
+            return make_token(value)
+        return value
+
+
+class LegacyRecordingIdConverter:
+    """
+    URL converter for the integer recording ids we used before tokens, which
+    only match while `RECORDING_INT_URLS` is on.
+    """
+
+    regex = "[0-9]+"
+
+    def to_python(self, value: str) -> int:
+        if not settings.RECORDING_INT_URLS:
+            raise ValueError("Integer recording URLs are disabled")
+        return int(value)
+
+    def to_url(self, value) -> str:
+        return str(value)
@@ -0,0 +1,70 @@
+"""
+Speech-to-text engines for `transcription`.
+
+`TRANSCRIPTION_ENGINE["BACKEND"]` names an `Engine` subclass, constructed
+with `TRANSCRIPTION_ENGINE["OPTIONS"]` as keyword arguments. Engines run in
+the transcription pool's worker processes, which are spawned fresh and only
+import this module (and the engine's), so engines can't use Django's
+settings or models.
+"""
+
+import math
+import time
+
+import numpy as np
+from django.utils.module_loading import import_string
+
+
+class Engine:
+    """
+    Turns a chunk of speech into text. Each worker process constructs one
+    and reuses it for every chunk it transcribes, so engines can load their
+    model in `__init__`.
+    """
+
+    def transcribe(self, samples: np.ndarray, sample_rate: int) -> str:
+        """
+        Return the text spoken in `samples`, a mono float32 array.
+        """
+        raise NotImplementedError
+
+
+class StubEngine(Engine):
+    """
+    Stands in for a real engine in development and tests. Describes each
+    chunk rather than transcribing it, so the same audio always gets the same
+    transcript. Spends `cost` seconds of CPU time on each second of audio,
+    like a real engine would.
+    """
+
+    def __init__(self, cost: float = 0.0):
+        self.cost = cost
+
+    def transcribe(self, samples: np.ndarray, sample_rate: int) -> str:
+        seconds = len(samples) / sample_rate
+        deadline = time.process_time() + self.cost * seconds
+        while time.process_time() < deadline:
+            pass
+
+        mean_square = float(np.dot(samples, samples)) / max(len(samples), 1)
+        if mean_square == 0:
+            return ""
+        loudness = 10 * math.log10(mean_square)
+        return f"({seconds:.1f} seconds of sound at {loudness:.0f} dB)"
+
+
+def load_engine(backend: str, options: dict) -> Engine:
+    return import_string(backend)(**options)
+
+
+# This worker process' engine
+_engine = None
+
+
+def init_worker(backend: str, options: dict) -> None:
+    global _engine
+    _engine = load_engine(backend, options)
+
+
+def transcribe_in_worker(samples: np.ndarray, sample_rate: int) -> str:
+    return _engine.transcribe(samples, sample_rate)
@@ -0,0 +1,214 @@
+"""
+Transcripts of completed recordings.
+
+Once a recording's audio has been encoded (see `encoding`), the
+`process_recordings` worker runs `transcribe_audio`. Transcribing a long
+recording in one go would take minutes, so instead:
+
+1. The audio is split into chunks of around `CHUNK_SECONDS`, at pauses
+   (`MIN_PAUSE_SECONDS` or more quieter than `SILENCE_DB`) where there are
+   any, so that words aren't cut in half. See `split`.
+2. The chunks are transcribed in parallel, by a pool of
+   `TRANSCRIPTION_PROCESSES` processes, each with its own
+   `TRANSCRIPTION_ENGINE` (see `transcribers`).
+3. Each chunk is saved as a `TranscriptChunk`, with where it starts and
+   ends in the recording, as soon as it's done, in whichever order they
+   finish. The recording page shows the transcript so far.
+4. Once every chunk is done, they are stitched together in order into
+   `Recording.transcript`, and deleted.
+
+A retried job only transcribes the chunks that weren't saved. Splitting the
+same audio always gives the same chunks, so they line up.
+
+Recordings aren't transcribed if no engine is configured.
+"""
+
+import json
+import logging
+import multiprocessing
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import soundfile
+from django.conf import settings
+from django.db import transaction
+
+from . import transcribers
+from .media import get_storage
+from .models import Recording, TranscriptChunk
+
+logger = logging.getLogger(__name__)
+
+# Chunks are cut at the pause nearest this long, and no shorter than
+# MIN_CHUNK_SECONDS. Without a pause, they're cut at MAX_CHUNK_SECONDS.
+CHUNK_SECONDS = 30
+MIN_CHUNK_SECONDS = 10
+MAX_CHUNK_SECONDS = 45
+
+# Pauses are at least this long, and this quiet (mean square, in dBFS),
+# measured over windows of WINDOW_SECONDS
+MIN_PAUSE_SECONDS = 0.3
+SILENCE_DB = -40
+WINDOW_SECONDS = 0.02
+
+# The pool of worker processes, and the settings it was started with
+_pool: ProcessPoolExecutor | None = None
+_pool_config = None
+
+
+def transcribe_audio(recording: Recording) -> None:
+    """
+    Transcribe the given recording's audio, saving each chunk as it's done,
+    then stitch the chunks into its transcript.
+    """
+    if (
+        not settings.TRANSCRIPTION_ENGINE["BACKEND"]
+        or recording.transcript is not None
+        or not recording.audio_name
+    ):
+        return
+
+    # Whole recordings are decoded into memory, which for an hour of 8 kHz
+    # audio is about 115 MB
+    with get_storage().open(recording.audio_name, "rb") as file:
+        samples, sample_rate = soundfile.read(file, dtype="float32", always_2d=True)
+    samples = samples.mean(axis=1)
+
+    chunks = split(samples, sample_rate)
+    done = set(recording.transcript_chunks.values_list("index", flat=True))
+    pending = [
+        (index, start, end)
+        for index, (start, end) in enumerate(chunks)
+        if index not in done
+    ]
+    for index, text in _transcribe(samples, sample_rate, pending):
+        start, end = chunks[index]
+        with transaction.atomic():
+            TranscriptChunk.objects.bulk_create(
+                [
+                    TranscriptChunk(
+                        recording=recording,
+                        index=index,
+                        start=start / sample_rate,
+                        end=end / sample_rate,
+                        text=text.strip(),
+                    )
+                ],
+                # Another worker got there first (see `processing.JOB_LEASE`)
+                ignore_conflicts=True,
+            )
+            # Evicts the cached page, so it shows the new chunk
+            recording.save(update_fields=["updated_at"])
+
+    with transaction.atomic():
+        recording.transcript = [
+            {"start": chunk.start, "end": chunk.end, "text": chunk.text}
+            for chunk in recording.transcript_chunks.order_by("index")
+        ]
+        recording.save(update_fields=["transcript", "updated_at"])
+        recording.transcript_chunks.all().delete()
+
+
+def split(samples: np.ndarray, sample_rate: int) -> list[tuple[int, int]]:
+    """
+    Return the first and last (exclusive) frame of each chunk to transcribe.
+    """
+    frames = len(samples)
+    cuts = _pauses(samples, sample_rate)
+    target = round(CHUNK_SECONDS * sample_rate)
+    shortest = round(MIN_CHUNK_SECONDS * sample_rate)
+    longest = round(MAX_CHUNK_SECONDS * sample_rate)
+
+    chunks = []
+    start = 0
+    while frames - start > longest:
+        candidates = cuts[(cuts >= start + shortest) & (cuts <= start + longest)]
+        if len(candidates):
+            end = int(candidates[np.argmin(np.abs(candidates - (start + target)))])
+        else:
+            end = start + longest
+        chunks.append((start, end))
+        start = end
+    if frames > start or not chunks:
+        chunks.append((start, frames))
+    return chunks
+
+
+def shutdown_pool() -> None:
+    global _pool, _pool_config
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+    _pool = _pool_config = None
+
+
+def _pauses(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    The frame in the middle of each pause.
+    """
+    window = max(round(WINDOW_SECONDS * sample_rate), 1)
+    count = len(samples) // window
+    mean_squares = np.square(samples[: count * window]).reshape(count, window).mean(1)
+    silent = np.concatenate([[0], mean_squares < 10 ** (SILENCE_DB / 10), [0]])
+
+    # Runs of silent windows, as [first, last) window
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    firsts, lasts = edges[::2], edges[1::2]
+    long_enough = (lasts - firsts) * window >= MIN_PAUSE_SECONDS * sample_rate
+    return (firsts + lasts)[long_enough] * window // 2
+
+
+def _transcribe(
+    samples: np.ndarray, sample_rate: int, chunks: list[tuple[int, int, int]]
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield each chunk's index and text, as soon as it's transcribed.
+    """
+    backend = settings.TRANSCRIPTION_ENGINE["BACKEND"]
+    options = settings.TRANSCRIPTION_ENGINE.get("OPTIONS", {})
+    if settings.TRANSCRIPTION_PROCESSES <= 1:
+        engine = transcribers.load_engine(backend, options)
+        for index, start, end in chunks:
+            yield index, engine.transcribe(samples[start:end], sample_rate)
+        return
+
+    pool = _get_pool(backend, options)
+    futures = {
+        pool.submit(
+            transcribers.transcribe_in_worker, samples[start:end], sample_rate
+        ): index
+        for index, start, end in chunks
+    }
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    except BrokenProcessPool:
+        # A worker died, e.g. ran out of memory. Start afresh next time.
+        shutdown_pool()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _get_pool(backend: str, options: dict) -> ProcessPoolExecutor:
+    global _pool, _pool_config
+    config = (
+        backend,
+        json.dumps(options, sort_keys=True),
+        settings.TRANSCRIPTION_PROCESSES,
+    )
+    if _pool is None or _pool_config != config:
+        shutdown_pool()
+        logger.info("Starting %s transcription processes", config[2])
+        _pool = ProcessPoolExecutor(
+            config[2],
+            # Forked workers would share the parent's database connections
+            # and locks. Spawned ones only import `transcribers`.
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=transcribers.init_worker,
+            initargs=(backend, options),
+        )
+        _pool_config = config
+    return _pool
@@ -0,0 +1,181 @@
+"""
+The pool of Twilio accounts we place calls from. See `TWILIO_ACCOUNTS` in
+settings.
+
+Each process shares one HTTP session between all of its Twilio clients, so
+that API requests reuse keep-alive connections rather than making a new
+connection and TLS handshake every time. requests' connection pool is safe to
+share between threads, but Twilio's clients aren't (their HTTP client keeps
+the last response on itself, and returns it from there), so each thread has
+clients of its own. Forked processes (e.g. gunicorn workers) start a pool of
+their own, rather than sharing their parent's sockets.
+"""
+
+import asyncio
+import base64
+import os
+import threading
+from dataclasses import dataclass
+
+from aiohttp import ClientSession, TCPConnector
+from django.conf import settings
+from requests import Session
+from requests.adapters import HTTPAdapter
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+from . import metrics
+
+
+class TimedHttpClient(TwilioHttpClient):
+    """
+    Records the latency and errors of Twilio API requests. See `metrics`.
+    Makes requests with the given session, which may be shared, but isn't
+    safe to use from more than one thread itself.
+    """
+
+    def __init__(self, session: Session):
+        super().__init__(timeout=settings.TWILIO_TIMEOUT, pool_connections=False)
+        self.session = session
+
+    def request(self, method, url, *args, **kwargs):
+        with metrics.time_twilio_request(method, url):
+            response = super().request(method, url, *args, **kwargs)
+        metrics.record_twilio_status(method, url, response.status_code)
+        return response
+
+
+class AsyncTimedHttpClient(AsyncTwilioHttpClient):
+    """
+    Like `TimedHttpClient`, for Twilio's async API (`create_async` and so
+    on). Its connection pool belongs to the event loop it was created in, so
+    create one per loop, and close it when done:
+
+        async with AsyncTimedHttpClient() as http_client:
+            client = account.async_client(http_client)
+    """
+
+    def __init__(self):
+        super().__init__(pool_connections=False)
+        self.session = ClientSession(
+            connector=TCPConnector(limit=settings.TWILIO_POOL_SIZE)
+        )
+
+    async def request(self, method, url, *args, auth=None, headers=None, **kwargs):
+        if auth is not None:
+            # Newer aiohttps deprecate their `auth` argument, which Twilio uses
+            credentials = base64.b64encode(":".join(auth).encode()).decode()
+            headers = {**(headers or {}), "Authorization": f"Basic {credentials}"}
+        with metrics.time_twilio_request(method, url):
+            async with asyncio.timeout(settings.TWILIO_TIMEOUT):
+                response = await super().request(
+                    method, url, *args, headers=headers, **kwargs
+                )
+        metrics.record_twilio_status(method, url, response.status_code)
+        return response
+
+
+_lock = threading.Lock()
+_session: Session | None = None
+# Each thread's `TimedHttpClient` (as `http_client`), and its clients by
+# account and API base URL (as `clients`)
+_local = threading.local()
+
+
+def reset_clients() -> None:
+    """
+    Forget this process' clients, and their connections.
+    """
+    global _lock, _session, _local
+    # A fork may have copied the lock while another thread held it
+    _lock = threading.Lock()
+    _session = None
+    _local = threading.local()
+
+
+def _get_session() -> Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = Session()
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=settings.TWILIO_POOL_SIZE
+            )
+            # http:// for fakes of the API, e.g. in tests
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+os.register_at_fork(after_in_child=reset_clients)
+
+
+@dataclass(frozen=True)
+class TwilioAccount:
+    sid: str
+    auth_token: str
+    from_numbers: tuple[str, ...]
+    # Outbound calls per second
+    rate: float
+
+    def client(self) -> Client:
+        """
+        Return this thread's client for the account. Every thread's clients
+        share the process' connections.
+        """
+        if not hasattr(_local, "clients"):
+            _local.http_client = TimedHttpClient(_get_session())
+            _local.clients = {}
+        key = (self, settings.TWILIO_API_BASE_URL)
+        client = _local.clients.get(key)
+        if client is None:
+            client = _local.clients[key] = self._client(_local.http_client)
+        return client
+
+    def async_client(self, http_client: AsyncTimedHttpClient) -> Client:
+        """
+        Return a client for the account that makes requests with the given
+        async HTTP client.
+        """
+        return self._client(http_client)
+
+    def _client(self, http_client) -> Client:
+        client = Client(self.sid, self.auth_token, http_client=http_client)
+        # Lets us talk to a stand-in for Twilio, e.g. in tests
+        client.api.base_url = settings.TWILIO_API_BASE_URL
+        return client
+
+    def from_number(self, key: int) -> str:
+        """
+        Pick one of this account's numbers to call from. Passing a stable
+        key (e.g. the recording id) spreads calls evenly over the numbers.
+        """
+        return self.from_numbers[key % len(self.from_numbers)]
+
+
+def get_accounts() -> list[TwilioAccount]:
+    return [
+        TwilioAccount(
+            sid=account["sid"],
+            auth_token=account["auth_token"],
+            from_numbers=tuple(account["from_numbers"]),
+            rate=float(account.get("rate", settings.CALL_DISPATCH_RATE)),
+        )
+        for account in settings.TWILIO_ACCOUNTS
+    ]
+
+
+def get_account(sid: str) -> TwilioAccount:
+    """
+    Return the account with the given SID. Recordings created before we
+    started tracking accounts have a blank SID, and belong to the default
+    account.
+    """
+    accounts = get_accounts()
+    if not sid:
+        return accounts[0]
+    for account in accounts:
+        if account.sid == sid:
+            return account
+    raise LookupError(f"Unknown Twilio account: {sid}")
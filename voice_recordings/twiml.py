@@ -0,0 +1,96 @@
+"""
+TwiML responses for `call_started_webhook`.
+
+Twilio waits for this response before playing the greeting, so it should be
+as fast as we can make it. Only the recording's URL token varies from one call
+to the next, so we build the response once per host with a placeholder token,
+split it around the placeholder, and splice each call's token into the bytes.
+"""
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.templatetags.static import static
+from django.urls import get_script_prefix, reverse
+from twilio.twiml.voice_response import VoiceResponse
+
+from .cache import LRUCache
+from .tokens import TOKEN_LENGTH, make_token
+
+GREETING = "voice_recordings/greeting.aifc"
+
+# Passes for a token in URLs, but won't be mistaken for anything else in the
+# response.
+PLACEHOLDER_TOKEN = "_" * TOKEN_LENGTH
+
+# Compiled templates, by scheme, host, script prefix and static files
+# manifest. Bounded, since the host comes from the request.
+templates = LRUCache(maxsize=32)
+
+
+def build_call_started_twiml(request, recording_id: int | str) -> str:
+    """
+    Build TwiML telling Twilio to:
+
+    1. Play a greeting.
+    2. Record the rest of the call.
+
+    `recording_id` may also be the recording's URL token.
+    """
+    response = VoiceResponse()
+
+    # Play the smallest phone quality version of the greeting built by
+    # collectstatic, so that Twilio can start playing it sooner.
+    greeting_path = static(staticfiles_storage.smallest_variant(GREETING))
+    greeting_url = request.build_absolute_uri(greeting_path)
+    response.play(greeting_url)
+
+    # Ask Twilio to send recording status updates to the following webhook
+    # endpoint, scoped to this recording:
+    recording_status_updated_webhook_path = reverse(
+        "recording_status_updated_webhook",
+        args=[recording_id],
+    )
+    recording_status_updated_webhook_url = request.build_absolute_uri(
+        recording_status_updated_webhook_path
+    )
+    response.record(
+        recording_status_callback=recording_status_updated_webhook_url,
+        recording_status_callback_event="completed absent",
+        trim="trim-silence",
+    )
+
+    return str(response)
+
+
+def call_started_twiml(request, recording_id: int) -> bytes:
+    """
+    Return the same bytes as `build_call_started_twiml`, from a precompiled
+    template.
+    """
+    key = (
+        request.scheme,
+        request.get_host(),
+        get_script_prefix(),
+        # Changes when static files are collected, e.g. a new greeting
+        getattr(staticfiles_storage, "manifest_hash", ""),
+    )
+    template = templates.get(key)
+    if template is None:
+        template = _compile(request)
+        templates.set(key, template)
+
+    prefix, suffix = template
+    return b"%s%s%s" % (prefix, make_token(recording_id).encode(), suffix)
+
+
+def _compile(request) -> tuple[bytes, bytes]:
+    twiml = build_call_started_twiml(request, PLACEHOLDER_TOKEN).encode()
+    prefix, placeholder, suffix = twiml.partition(PLACEHOLDER_TOKEN.encode())
+    assert placeholder and PLACEHOLDER_TOKEN.encode() not in suffix
+    return prefix, suffix
+
+
+@receiver(setting_changed)
+def _clear_templates(**kwargs):
+    templates.clear()
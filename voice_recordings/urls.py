@@ -1,28 +1,59 @@
-from django.urls import path
+from django.urls import path, register_converter
 
 from . import views
+from .tokens import LegacyRecordingIdConverter, RecordingTokenConverter
+
+register_converter(RecordingTokenConverter, "recording")
+register_converter(LegacyRecordingIdConverter, "legacy_recording_id")
+
+# Views of a single recording, by path under the recording's URL
+recording_views = [
+    ("", views.recording, "recording"),
+    ("audio.mp3", views.recording_audio, "recording_audio"),
+    ("peaks.bin", views.recording_peaks, "recording_peaks"),
+    ("call_started/", views.call_started_webhook, "call_started_webhook"),
+    (
+        "recording_status_updated/",
+        views.recording_status_updated_webhook,
+        "recording_status_updated_webhook",
+    ),
+    (
+        "call_status_updated/",
+        views.call_status_updated_webhook,
+        "call_status_updated_webhook",
+    ),
+    ("status/", views.recording_status, "recording_status"),
+    ("events/", views.recording_events, "recording_events"),
+]
 
 urlpatterns = [
     path("", views.form, name="form"),
-    # FIXME: Including integer primary keys in the URL is not ideal.
-    # - Gives a sense of many recordings we have
-    # - Makes it too easy to guess the URL of someone else's recording
-    #
-    # Use an obfuscated identifier instead, like a UUID.
-    path("recording/<int:recording_id>/", views.recording, name="recording"),
+    # Recordings are identified by signed tokens, see `tokens`.
+    *(
+        path(f"recording/<recording:recording_id>/{route}", view, name=name)
+        for route, view, name in recording_views
+    ),
+    # Integer ids, from before recording URLs were signed. Unnamed, so that we
+    # never link to them, and only matched while RECORDING_INT_URLS is on.
+    *(
+        path(f"recording/<legacy_recording_id:recording_id>/{route}", view)
+        for route, view, name in recording_views
+    ),
+    # Twilio callbacks that aren't scoped to a recording, routed by SID
     path(
-        "recording/<int:recording_id>/call_started/",
-        views.call_started_webhook,
-        name="call_started_webhook",
+        "twilio/recording_status_updated/",
+        views.sid_recording_status_updated_webhook,
+        name="sid_recording_status_updated_webhook",
     ),
     path(
-        "recording/<int:recording_id>/recording_status_updated/",
-        views.recording_status_updated_webhook,
-        name="recording_status_updated_webhook",
+        "twilio/call_status_updated/",
+        views.sid_call_status_updated_webhook,
+        name="sid_call_status_updated_webhook",
     ),
     path(
-        "recording/<int:recording_id>/status/",
-        views.recording_status,
-        name="recording_status",
+        "recording_cache_stats/",
+        views.recording_cache_stats,
+        name="recording_cache_stats",
     ),
+    path("metrics/", views.prometheus_metrics, name="prometheus_metrics"),
 ]
@@ -1,18 +1,37 @@
-import re
+import asyncio
+import math
+from datetime import datetime, timedelta
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect, render
-from django.templatetags.static import static
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_GET, require_http_methods
-from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse
+from django.views.decorators.http import require_GET, require_http_methods, require_safe
 
-from .models import Recording
+from . import admission, cache, limits, media, metrics, pages
+from .calls import PHONE_NUMBER_PATTERN, _normalize_phone_number, enqueue_call
+from .events import get_broker
+from .models import CallJob, Recording, WebhookEvent
+from .twiml import call_started_twiml
+from .webhooks import afind_recording_id, arecord_webhook_event
 
-PHONE_NUMBER_PATTERN = "[0-9]{3}-?[0-9]{3}-?[0-9]{4}"
+# Send a comment down idle event streams this often (in seconds), so that
+# proxies don't time them out. Heroku's router gives up after 55 seconds.
+EVENTS_KEEPALIVE = 20
 
 
 @require_http_methods(["GET", "POST"])
@@ -20,44 +39,184 @@ def form(request):
     """
     On GET, display a form allowing the user to input their phone number.
 
-    On POST, create a Recording instance in our database. Then call the number
-    and redirect to the recording page.
+    On POST, create a Recording instance in our database, queue up a call to
+    the number and redirect to the recording page. If the call would have to
+    wait too long, offer callback slots instead (see `admission`).
+
+    Submitting the form again (a double click, the browser retrying, or an
+    impatient storyteller) redirects to the recording the first submission
+    created, rather than calling them twice. Asking for a call to a number
+    we're still calling shows the form again with an error: only the client
+    that asked for that call may see its recording. Calls to a number, and
+    for a client, are also limited (see `limits`).
     """
     if request.method == "POST":
         tel = request.POST["tel"]
-        recording = Recording.objects.create(phone_number=tel)
-
-        # Place a call to the given number using the Twilio API. When the call
-        # connects, Twilio will send us a webhook request to a url of our
-        # choosing. Send a webhook url scoped to this recording:
-        call_started_webhook_path = reverse("call_started_webhook", args=[recording.pk])
-        call_started_webhook_url = request.build_absolute_uri(call_started_webhook_path)
-
-        # FIXME: This will error out and return a 500 response for invalid
-        # phone numbers. We should show a helpful error message instead.
-        # FIXME(performance): 3rd party API call in response handler. Move to
-        # background job.
-        # FIXME: Twilio outbound voice calls are rate-limited to 1/sec. After
-        # moving this Twilio API call to a background job, throttle the job
-        # queue to stay within the rate-limit. Monitor the queue, and set up an
-        # alert if it starts growing so we know to add more capacity -
-        # additional Twilio accounts, perhaps?
-        recording.twilio_call_sid = _place_call(
-            tel, webhook_url=call_started_webhook_url
-        )
-        recording.save()
+        try:
+            normalized_tel = _normalize_phone_number(tel)
+        except ValueError:
+            return _form(request, tel, "Please enter a US phone number.", status=400)
+        # Generated by the form's script. Blank without it.
+        idempotency_key = request.POST.get("idempotency_key", "")
+        if len(idempotency_key) > 64:
+            idempotency_key = ""
+
+        existing = _submitted_recording(idempotency_key)
+        if existing is not None:
+            return redirect("recording", existing)
+        if _calling(normalized_tel):
+            return _form(
+                request,
+                tel,
+                "We’re already calling this number. Please answer the call, "
+                "or try again in a few minutes.",
+                status=409,
+            )
+
+        # Blank from the form itself, "now" or a callback slot's start time
+        # from the page offering callbacks
+        when = request.POST.get("when", "")
+        if not when:
+            wait = admission.estimated_wait()
+            if wait.total_seconds() > settings.CALL_WAIT_THRESHOLD:
+                return _offer_callback(request, tel, wait)
+
+        if not limits.allow_call(normalized_tel, limits.client_ip(request)):
+            return _form(
+                request,
+                tel,
+                "Sorry, we can’t take any more calls from you right now. "
+                "Please try again later.",
+                status=429,
+            )
+
+        try:
+            with transaction.atomic():
+                run_at = callback_slot = None
+                if when and when != "now":
+                    try:
+                        callback_slot, run_at = admission.book_callback(
+                            datetime.fromisoformat(when)
+                        )
+                    except (ValueError, admission.SlotUnavailableError):
+                        return _offer_callback(
+                            request,
+                            tel,
+                            admission.estimated_wait(),
+                            error="Sorry, that time is no longer available.",
+                        )
+                else:
+                    admission.admit_call()
+
+                recording = Recording.objects.create(
+                    phone_number=tel,
+                    normalized_phone_number=normalized_tel,
+                    idempotency_key=idempotency_key,
+                )
+
+                # When the call connects, Twilio will send us a webhook
+                # request to a url of our choosing. Send a webhook url scoped
+                # to this recording:
+                call_started_webhook_path = reverse(
+                    "call_started_webhook", args=[recording.pk]
+                )
+                call_started_webhook_url = request.build_absolute_uri(
+                    call_started_webhook_path
+                )
+                # Twilio will also tell us how the call ended, so that we know
+                # if the storyteller didn't pick up:
+                call_status_updated_webhook_url = request.build_absolute_uri(
+                    reverse("call_status_updated_webhook", args=[recording.pk])
+                )
+
+                enqueue_call(
+                    recording,
+                    webhook_url=call_started_webhook_url,
+                    status_callback_url=call_status_updated_webhook_url,
+                    run_at=run_at,
+                    callback_slot=callback_slot,
+                )
+        except IntegrityError:
+            # The same submission, handled at the same time by another
+            # request, created the recording first
+            existing = _submitted_recording(idempotency_key)
+            if existing is None:
+                raise
+            return redirect("recording", existing)
 
         return redirect("recording", recording.pk)
 
-    return render(
+    # The form is our landing page, so serve it from the page cache
+    return pages.render_with_csrf_token(
         request,
         "voice_recordings/form.html",
         {"phone_number_pattern": PHONE_NUMBER_PATTERN},
     )
 
 
+def _submitted_recording(idempotency_key: str) -> int | None:
+    """
+    The id of the recording created by an earlier submission of the same
+    form, if any.
+    """
+    if not idempotency_key:
+        return None
+    return (
+        Recording.objects.filter(idempotency_key=idempotency_key)
+        .values_list("pk", flat=True)
+        .first()
+    )
+
+
+def _calling(normalized_tel: str) -> bool:
+    """
+    Whether a call to the given number was requested in the last
+    `CALL_DEDUPE_SECONDS` and is still in progress.
+    """
+    since = timezone.now() - timedelta(seconds=settings.CALL_DEDUPE_SECONDS)
+    return Recording.objects.filter(
+        normalized_phone_number=normalized_tel,
+        status=Recording.Status.IN_PROGRESS,
+        created_at__gte=since,
+    ).exists()
+
+
+def _form(request, tel: str, error: str, status: int) -> HttpResponse:
+    """
+    The form again, with an error. Not cached, unlike the blank form.
+    """
+    return render(
+        request,
+        "voice_recordings/form.html",
+        {"phone_number_pattern": PHONE_NUMBER_PATTERN, "tel": tel, "error": error},
+        status=status,
+    )
+
+
+def _offer_callback(
+    request, tel: str, wait: timedelta, error: str | None = None
+) -> HttpResponse:
+    """
+    Tell the storyteller how long they'd wait for a call, and offer to call
+    them at a time of their choosing instead.
+    """
+    return render(
+        request,
+        "voice_recordings/callback.html",
+        {
+            "tel": tel,
+            # Passed on, so that choosing a time still counts as the same
+            # submission of the form
+            "idempotency_key": request.POST.get("idempotency_key", ""),
+            "wait_minutes": math.ceil(wait.total_seconds() / 60),
+            "slots": admission.callback_slots(),
+            "error": error,
+        },
+    )
+
+
 @require_GET
-def recording(request, recording_id: int):
+async def recording(request, recording_id: int):
     # FIXME: Recordings are currently publicly available. We can't restrict
     # this view to logged in users only if we want to allow unauthenticated
     # users play back their own recordings. On the other hand, we don't want to
@@ -76,101 +235,238 @@ def recording(request, recording_id: int):
     # balance between privacy (not letting other people listen to my recording)
     # and convenience (being able play my recording back without creating an
     # account).
-    recording = Recording.objects.get(pk=recording_id)
-    return render(request, "voice_recordings/recording.html", {"recording": recording})
+    recording = await cache.aget_recording(recording_id)
+    if recording.status != Recording.Status.IN_PROGRESS:
+        # Served from the cache, but rendered (and cached) in a thread on a miss
+        return await sync_to_async(pages.render_finished_recording)(
+            request,
+            recording,
+            "voice_recordings/recording.html",
+            {"recording": recording},
+        )
+
+    # Calls booked for later (or queued by a campaign) say when they're due
+    call_at = (
+        await CallJob.objects.filter(
+            recording_id=recording_id, run_at__gt=timezone.now()
+        )
+        .values_list("run_at", flat=True)
+        .afirst()
+    )
+
+    # Streaming server-sent events needs an async server, otherwise the page
+    # falls back to polling.
+    events_url = None
+    if isinstance(request, ASGIRequest):
+        events_url = reverse("recording_events", args=[recording_id])
+
+    return render(
+        request,
+        "voice_recordings/recording.html",
+        {"recording": recording, "events_url": events_url, "call_at": call_at},
+    )
+
+
+@require_safe
+def recording_audio(request, recording_id: int):
+    """
+    Serve our copy of the given recording's audio, once it has been fetched
+    from Twilio. See `media.serve`, and `encoding` for the copy we keep.
+    """
+    recording = cache.get_recording(recording_id)
+    if not recording.audio_name:
+        raise Http404("Recording audio not fetched yet")
+    return media.serve(
+        request, recording.audio_name, content_type=recording.audio_content_type
+    )
+
+
+@require_safe
+def recording_peaks(request, recording_id: int):
+    """
+    Serve the given recording's waveform peaks, once its audio has been
+    analyzed. See `waveforms`.
+    """
+    recording = cache.get_recording(recording_id)
+    if not recording.peaks_name:
+        raise Http404("Recording audio not analyzed yet")
+    return media.serve(
+        request, recording.peaks_name, content_type="application/octet-stream"
+    )
 
 
 @require_http_methods(["GET", "POST"])
 @csrf_exempt
-def call_started_webhook(request, recording_id: int):
+async def call_started_webhook(request, recording_id: int):
     """
     Webhook handler called by Twilio when a call starts. Respond with TwiML
     (Twilio's xml-based instruction format) telling Twilio to:
 
     1. Play a greeting.
     2. Record the rest of the call.
+
+    See `twiml.build_call_started_twiml`.
     """
     # TODO(security): verify that request comes from Twilio
-    response = VoiceResponse()
+    return HttpResponse(
+        call_started_twiml(request, recording_id), content_type="application/xml"
+    )
 
-    greeting_path = static("voice_recordings/greeting.aifc")
-    greeting_url = request.build_absolute_uri(greeting_path)
-    response.play(greeting_url)
 
-    # Ask Twilio to send recording status updates to the following webhook
-    # endpoint, scoped to this recording:
-    recording_status_updated_webhook_path = reverse(
-        "recording_status_updated_webhook",
-        args=[recording_id],
-    )
-    recording_status_updated_webhook_url = request.build_absolute_uri(
-        recording_status_updated_webhook_path
-    )
-    response.record(
-        recording_status_callback=recording_status_updated_webhook_url,
-        trim="trim-silence",
+@require_http_methods(["GET", "POST"])
+@csrf_exempt
+async def recording_status_updated_webhook(request, recording_id: int):
+    """
+    Webhook handler called by Twilio when a recording's status changes.
+
+    Store the update in the webhook inbox, to be applied to the corresponding
+    Recording instance by the `process_webhooks` worker.
+    """
+    # TODO(security): verify that request comes from Twilio
+    await arecord_webhook_event(
+        recording_id, WebhookEvent.Kind.RECORDING, _webhook_params(request)
     )
+    return HttpResponse(status=200)
 
-    return HttpResponse(str(response), content_type="application/xml")
+
+@require_http_methods(["GET", "POST"])
+@csrf_exempt
+async def call_status_updated_webhook(request, recording_id: int):
+    """
+    Webhook handler called by Twilio when a call ends.
+
+    Store the update in the webhook inbox, to be applied to the corresponding
+    Recording instance by the `process_webhooks` worker.
+    """
+    # TODO(security): verify that request comes from Twilio
+    await arecord_webhook_event(
+        recording_id, WebhookEvent.Kind.CALL, _webhook_params(request)
+    )
+    return HttpResponse(status=200)
 
 
 @require_http_methods(["GET", "POST"])
 @csrf_exempt
-def recording_status_updated_webhook(request, recording_id: int):
+async def sid_recording_status_updated_webhook(request):
     """
-    Webhook handler called by Twilio when a recording's status changes.
+    Like `recording_status_updated_webhook`, for callbacks that aren't scoped
+    to a recording (e.g. configured in the Twilio console). The recording is
+    found by RecordingSid or CallSid instead.
+    """
+    # TODO(security): verify that request comes from Twilio
+    params = _webhook_params(request)
+    recording_id = await afind_recording_id(
+        params.get("CallSid", ""), params.get("RecordingSid", "")
+    )
+    if recording_id is None:
+        raise Http404("No recording with this CallSid or RecordingSid")
+    await arecord_webhook_event(recording_id, WebhookEvent.Kind.RECORDING, params)
+    return HttpResponse(status=200)
+
 
-    If Twilio tells us the recording is complete, update the corresponding
-    Recording instance in our database.
+@require_http_methods(["GET", "POST"])
+@csrf_exempt
+async def sid_call_status_updated_webhook(request):
+    """
+    Like `call_status_updated_webhook`, for callbacks that aren't scoped to a
+    recording (e.g. configured in the Twilio console). The recording is found
+    by CallSid instead.
     """
     # TODO(security): verify that request comes from Twilio
+    params = _webhook_params(request)
+    recording_id = await afind_recording_id(params.get("CallSid", ""))
+    if recording_id is None:
+        raise Http404("No recording with this CallSid")
+    await arecord_webhook_event(recording_id, WebhookEvent.Kind.CALL, params)
+    return HttpResponse(status=200)
+
 
+def _webhook_params(request) -> dict:
     # Twilio sometimes sends webhook requests as GET, and sometimes as POST.
     # TODO: figure out how to get Twilio to use a consistent HTTP method.
     if request.method == "GET":
-        params = request.GET
-    else:
-        params = request.POST
+        return request.GET.dict()
+    return request.POST.dict()
 
-    if params["RecordingStatus"] == "completed":
-        recording = Recording.objects.get(pk=recording_id)
-        recording.status = Recording.Status.COMPLETE
-        recording.twilio_recording_sid = params["RecordingSid"]
-        recording.save()
 
-    # TODO: handle other statuses (failed, etc.)
+@require_GET
+async def recording_status(request, recording_id: int):
+    """
+    Return the given Recording instance's status as plain text. The frontend
+    polls this endpoint to check if the recording is finished, when
+    `recording_events` isn't available.
 
-    return HttpResponse(status=200)
+    Statuses are served from the cache, and carry an ETag so that pollers can
+    make conditional requests.
+    """
+    status = await cache.aget_status(recording_id)
+    response = HttpResponse(status.name, content_type="text/plain")
+    response["ETag"] = f'"{recording_id}-{status.name}"'
+    if status == Recording.Status.COMPLETE:
+        # Completed recordings stay that way
+        patch_cache_control(response, max_age=3600)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return get_conditional_response(request, etag=response["ETag"], response=response)
 
 
-@require_GET
-def recording_status(request, recording_id: int):
+@staff_member_required
+def recording_cache_stats(request):
     """
-    Return the given Recording instance's status as plain text. The frontend
-    polls this endpoint to check if the recording is finished.
+    Return this process' recording cache hit/miss counters.
     """
-    # FIXME: Polling introduces some latency on the frontend, and cause sharp
-    # increases in traffic. Implement this using server-sent events or
-    # websockets instead, for performance and better UX.
-    recording = Recording.objects.get(pk=recording_id)
-    return HttpResponse(recording.status, content_type="text/plain")
+    return JsonResponse(cache.stats)
 
 
-def _place_call(tel: str, webhook_url: str) -> str:
+@require_GET
+def prometheus_metrics(request):
     """
-    Using the Twilio Voice API, place a call to the given number. Return the
-    call's Twilio SID.
+    Return request and Twilio API timings from every process, and the state
+    of the call queue, for Prometheus to scrape.
     """
-    twilio_client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-    call = twilio_client.calls.create(
-        to=_normalize_phone_number(tel),
-        from_=settings.TWILIO_FROM_NUMBER,
-        url=webhook_url,
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not request.user.is_staff and not (
+        settings.METRICS_TOKEN and constant_time_compare(token, settings.METRICS_TOKEN)
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(metrics.collect(), metrics.gauges()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
     )
-    return call.sid
 
 
-def _normalize_phone_number(tel: str) -> str:
-    assert re.fullmatch(PHONE_NUMBER_PATTERN, tel)
-    without_dashes = tel.replace("-", "")
-    return f"+1{without_dashes}"  # US numbers only for now
+@require_GET
+async def recording_events(request, recording_id: int):
+    """
+    Stream the given Recording instance's status as server-sent events. An
+    event is sent straight away, then every time the status changes, until
+    the recording is finished.
+    """
+    recording = await Recording.objects.aget(pk=recording_id)
+
+    async def stream():
+        async with get_broker().subscribe(recording_id) as updates:
+            # The status may have changed before we subscribed
+            await recording.arefresh_from_db(fields=["status"])
+            status = recording.status
+            yield _event("status", Recording.Status(status).name)
+
+            while status == Recording.Status.IN_PROGRESS:
+                try:
+                    update = await asyncio.wait_for(
+                        updates.get(), timeout=EVENTS_KEEPALIVE
+                    )
+                except TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if update != status:
+                    status = update
+                    yield _event("status", Recording.Status(status).name)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def _event(name: str, data: str) -> bytes:
+    return f"event: {name}\ndata: {data}\n\n".encode()
@@ -0,0 +1,155 @@
+"""
+Waveform peaks, duration and loudness for completed recordings, so that the
+recording page can draw the waveform and show how long the recording is
+without the browser downloading the audio first.
+
+The `process_recordings` worker runs `analyze_audio` once the recording's
+audio has been fetched (see `media`). It decodes our copy a block at a time,
+and keeps the loudest sample in each of `LEVELS[0]` equal slices of the
+recording. Coarser levels take the loudest of every few of those.
+
+Peaks are stored next to the audio in the "recordings" storage, as a small
+binary file (see `encode`) that `views.recording_peaks` serves as is:
+
+    magic "PEAK", version (u16), number of levels (u16),
+    sample rate (u32), frames (u32),
+    number of peaks in each level (u32 each),
+    each level's peaks, finest first (u8 each, 255 is full scale)
+
+All integers are little-endian. A 2,048 peak waveform, with its coarser
+levels, comes to under 3 KB however long the recording is.
+"""
+
+import math
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+import soundfile
+from django.core.files.base import ContentFile
+
+from .media import get_storage
+from .models import Recording
+
+# Peaks in each zoom level, finest first
+LEVELS = (2048, 512, 128)
+
+# Frames to decode at a time
+BLOCK_SIZE = 64 * 1024
+
+MAGIC = b"PEAK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+
+# Reported for silence, rather than minus infinity
+SILENCE_DB = -120.0
+
+
+@dataclass
+class Waveform:
+    sample_rate: int
+    frames: int
+    # Mean square level over the whole recording, in dBFS
+    loudness: float
+    # Peaks between 0 and 1, one array per level in `LEVELS`
+    levels: list[np.ndarray]
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate
+
+
+def analyze_audio(recording: Recording) -> None:
+    """
+    Compute the given recording's waveform from our copy of its audio, and
+    store it.
+    """
+    if recording.peaks_name or not recording.media_name:
+        return
+
+    storage = get_storage()
+    with storage.open(recording.media_name, "rb") as file:
+        waveform = analyze(file)
+    name = storage.save(f"{recording.media_name}.peaks", ContentFile(encode(waveform)))
+
+    recording.peaks_name = name
+    recording.duration = waveform.duration
+    recording.loudness = waveform.loudness
+    recording.save(update_fields=["peaks_name", "duration", "loudness", "updated_at"])
+
+
+def analyze(file) -> Waveform:
+    """
+    Decode an audio file (anything libsndfile reads, including mp3) and
+    compute its waveform.
+    """
+    with soundfile.SoundFile(file) as audio:
+        sample_rate, frames = audio.samplerate, audio.frames
+        count = max(min(LEVELS[0], frames), 1)
+        # Frame each peak starts at
+        starts = np.arange(count) * frames // count
+        peaks = np.zeros(count, dtype=np.float32)
+        sum_of_squares = 0.0
+
+        position = 0
+        for block in audio.blocks(BLOCK_SIZE, dtype="float32", always_2d=True):
+            # Loudest channel, for the (rare) stereo recording
+            samples = np.abs(block).max(axis=1)
+            sum_of_squares += float(np.dot(samples, samples))
+
+            # Peaks that this block overlaps
+            first = max(np.searchsorted(starts, position, side="right") - 1, 0)
+            last = np.searchsorted(starts, position + len(samples), side="left")
+            offsets = np.maximum(starts[first:last] - position, 0)
+            np.maximum(
+                peaks[first:last],
+                np.maximum.reduceat(samples, offsets),
+                out=peaks[first:last],
+            )
+            position += len(samples)
+
+    mean_square = sum_of_squares / max(position, 1)
+    loudness = 10 * math.log10(mean_square) if mean_square > 0 else SILENCE_DB
+    return Waveform(
+        sample_rate=sample_rate,
+        frames=position,
+        loudness=max(loudness, SILENCE_DB),
+        levels=[peaks, *(_downsample(peaks, size) for size in LEVELS[1:])],
+    )
+
+
+def encode(waveform: Waveform) -> bytes:
+    levels = [
+        np.rint(np.clip(level, 0, 1) * 255).astype(np.uint8)
+        for level in waveform.levels
+    ]
+    header = HEADER.pack(
+        MAGIC, VERSION, len(levels), waveform.sample_rate, waveform.frames
+    )
+    sizes = struct.pack(f"<{len(levels)}I", *(len(level) for level in levels))
+    return b"".join([header, sizes, *(level.tobytes() for level in levels)])
+
+
+def decode(data: bytes) -> Waveform:
+    """
+    Read back a waveform written by `encode`. Loudness isn't stored, so is
+    NaN.
+    """
+    magic, version, count, sample_rate, frames = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a version 1 peaks file")
+    sizes = struct.unpack_from(f"<{count}I", data, HEADER.size)
+    offset = HEADER.size + 4 * count
+    levels = []
+    for size in sizes:
+        peaks = np.frombuffer(data, dtype=np.uint8, count=size, offset=offset)
+        levels.append(peaks.astype(np.float32) / 255)
+        offset += size
+    return Waveform(
+        sample_rate=sample_rate, frames=frames, loudness=math.nan, levels=levels
+    )
+
+
+def _downsample(peaks: np.ndarray, size: int) -> np.ndarray:
+    size = min(size, len(peaks))
+    return np.maximum.reduceat(peaks, np.arange(size) * len(peaks) // size)
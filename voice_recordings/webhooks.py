@@ -0,0 +1,151 @@
+"""
+Applying Twilio's status callbacks to recordings.
+
+Webhook handlers append each callback to the `WebhookEvent` inbox and respond
+straight away, so they stay fast however many callbacks Twilio sends (it
+retries on timeouts, and may send duplicates). The `process_webhooks` worker
+then applies the inbox in batches, saving each recording at most once per
+batch however many events it had.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Recording, WebhookEvent
+from .processing import enqueue_processing
+
+# Terminal CallStatus values for calls that never got as far as recording
+# https://www.twilio.com/docs/voice/api/call-resource#call-status-values
+FAILED_CALL_STATUSES = {"busy", "failed", "no-answer", "canceled"}
+
+# https://www.twilio.com/docs/voice/twiml/record#recordingstatuscallbackevent
+FAILED_RECORDING_STATUSES = {"absent", "failed"}
+
+# When events disagree, the most final status wins. In particular, a
+# recording that made it to Twilio is complete even if the call reported an
+# error afterwards.
+STATUS_RANK = {
+    Recording.Status.IN_PROGRESS: 0,
+    Recording.Status.FAILED: 1,
+    Recording.Status.COMPLETE: 2,
+}
+
+
+def record_webhook_event(
+    recording_id: int, kind: WebhookEvent.Kind, params: dict
+) -> WebhookEvent:
+    return WebhookEvent.objects.create(**_event_fields(recording_id, kind, params))
+
+
+async def arecord_webhook_event(
+    recording_id: int, kind: WebhookEvent.Kind, params: dict
+) -> WebhookEvent:
+    return await WebhookEvent.objects.acreate(
+        **_event_fields(recording_id, kind, params)
+    )
+
+
+def _event_fields(recording_id: int, kind: WebhookEvent.Kind, params: dict) -> dict:
+    if kind == WebhookEvent.Kind.RECORDING:
+        sid, status = params.get("RecordingSid", ""), params.get("RecordingStatus", "")
+    else:
+        sid, status = params.get("CallSid", ""), params.get("CallStatus", "")
+    return {
+        "recording_id": recording_id,
+        "kind": kind,
+        "sid": sid,
+        "status": status,
+        "params": params,
+    }
+
+
+def find_recording_id(call_sid: str, recording_sid: str = "") -> int | None:
+    """
+    Return the id of the recording with the given CallSid or RecordingSid, or
+    None if there isn't one.
+    """
+    query = _sid_query(call_sid, recording_sid)
+    if not query:
+        return None
+    return Recording.objects.filter(query).values_list("pk", flat=True).first()
+
+
+async def afind_recording_id(call_sid: str, recording_sid: str = "") -> int | None:
+    query = _sid_query(call_sid, recording_sid)
+    if not query:
+        return None
+    return await Recording.objects.filter(query).values_list("pk", flat=True).afirst()
+
+
+def _sid_query(call_sid: str, recording_sid: str) -> Q:
+    query = Q()
+    if call_sid:
+        query |= Q(twilio_call_sid=call_sid)
+    if recording_sid:
+        query |= Q(twilio_recording_sid=recording_sid)
+    return query
+
+
+def process_webhook_events(batch_size: int = 500) -> int:
+    """
+    Apply the next batch of unprocessed events. Return the number of events
+    processed.
+    """
+    with transaction.atomic():
+        # Let concurrent workers take different batches, on databases that
+        # support it.
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        # Duplicates (e.g. Twilio retries) don't change the outcome
+        events_by_recording = defaultdict(set)
+        for event in events:
+            events_by_recording[event.recording_id].add(
+                (event.kind, event.sid, event.status)
+            )
+
+        recordings = Recording.objects.select_for_update().in_bulk(events_by_recording)
+        for recording_id, recording_events in events_by_recording.items():
+            _apply(recordings[recording_id], recording_events)
+
+        WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+            processed_at=timezone.now()
+        )
+    return len(events)
+
+
+def _apply(recording: Recording, events: set[tuple[str, str, str]]) -> None:
+    status, recording_sid = recording.status, recording.twilio_recording_sid
+    for kind, sid, twilio_status in sorted(events):
+        new_status = _status_for_event(kind, twilio_status)
+        if new_status is None or STATUS_RANK[new_status] <= STATUS_RANK[status]:
+            continue
+        status = new_status
+        if kind == WebhookEvent.Kind.RECORDING and status == Recording.Status.COMPLETE:
+            recording_sid = sid
+
+    if (status, recording_sid) != (recording.status, recording.twilio_recording_sid):
+        recording.status = status
+        recording.twilio_recording_sid = recording_sid
+        recording.save(update_fields=["status", "twilio_recording_sid", "updated_at"])
+        if status == Recording.Status.COMPLETE:
+            enqueue_processing(recording)
+
+
+def _status_for_event(kind: str, twilio_status: str) -> Recording.Status | None:
+    if kind == WebhookEvent.Kind.RECORDING:
+        if twilio_status == "completed":
+            return Recording.Status.COMPLETE
+        if twilio_status in FAILED_RECORDING_STATUSES:
+            return Recording.Status.FAILED
+    elif twilio_status in FAILED_CALL_STATUSES:
+        return Recording.Status.FAILED
+    return None